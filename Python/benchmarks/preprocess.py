@@ -0,0 +1,95 @@
+"""Benchmark of the preprocessing of trial data into padded arrays.
+
+Compares :func:`hbayesdm.preprocess_funcs.pad_trials` with the loop over
+subjects it replaces (``ra_preprocess_func`` before), on data of a million
+trials by default::
+
+    python benchmarks/preprocess.py --trials 1000000 --subjects 2000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from hbayesdm.preprocess_funcs import pad_trials
+
+
+def make_data(n_trials, n_subj, seed=0):
+    """Trials of the risk aversion task, with uneven numbers of trials."""
+    rng = np.random.RandomState(seed)
+    subjid = np.sort(rng.randint(n_subj, size=n_trials))
+    return pd.DataFrame({
+        'subjid': subjid,
+        'gain': rng.randint(1, 13, size=n_trials).astype(float),
+        'loss': -rng.randint(1, 13, size=n_trials).astype(float),
+        'cert': rng.randint(0, 3, size=n_trials).astype(float),
+        'gamble': rng.randint(0, 2, size=n_trials),
+    })
+
+
+def general_info(raw_data):
+    grouped_data = raw_data.groupby('subjid', sort=False)
+    t_subjs = list(grouped_data.size())
+    return {'grouped_data': grouped_data, 'n_subj': len(t_subjs),
+            'b_subjs': None, 'b_max': None,
+            't_subjs': t_subjs, 't_max': max(t_subjs)}
+
+
+def loop(raw_data, info):
+    """Write the arrays subject by subject."""
+    subj_group = iter(info['grouped_data'])
+    n_subj, t_max = info['n_subj'], info['t_max']
+    gain = np.full((n_subj, t_max), 0, dtype=float)
+    loss = np.full((n_subj, t_max), 0, dtype=float)
+    cert = np.full((n_subj, t_max), 0, dtype=float)
+    gamble = np.full((n_subj, t_max), -1, dtype=int)
+    for s in range(n_subj):
+        _, subj_data = next(subj_group)
+        t = info['t_subjs'][s]
+        gain[s][:t] = subj_data['gain']
+        loss[s][:t] = np.abs(subj_data['loss'])
+        cert[s][:t] = subj_data['cert']
+        gamble[s][:t] = subj_data['gamble']
+    return {'gain': gain, 'loss': loss, 'cert': cert, 'gamble': gamble}
+
+
+def vectorized(raw_data, info):
+    """Write the arrays at once with ``pad_trials``."""
+    return pad_trials(info, {
+        'gain': (raw_data['gain'], float, 0),
+        'loss': (np.abs(raw_data['loss']), float, 0),
+        'cert': (raw_data['cert'], float, 0),
+        'gamble': (raw_data['gamble'], int, -1),
+    })
+
+
+def best_time(function, *args, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--trials', type=int, default=10 ** 6)
+    parser.add_argument('--subjects', type=int, default=2000)
+    args = parser.parse_args()
+
+    raw_data = make_data(args.trials, args.subjects)
+    info = general_info(raw_data)
+    loop_time, expected = best_time(loop, raw_data, info)
+    pad_time, padded = best_time(vectorized, raw_data, info)
+    assert all(np.array_equal(padded[k], v) for k, v in expected.items())
+
+    print('%d trials, %d subjects' % (args.trials, info['n_subj']))
+    print('loop over subjects: %8.3f s' % loop_time)
+    print('pad_trials:         %8.3f s (%.0fx faster)'
+          % (pad_time, loop_time / pad_time))
+
+
+if __name__ == '__main__':
+    main()
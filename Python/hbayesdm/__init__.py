@@ -6,9 +6,14 @@ except ModuleNotFoundError:
 
 import hbayesdm
 from hbayesdm.diagnostics import *
+from hbayesdm.compiler import *
+from hbayesdm.batch import fit_many
+from hbayesdm.saving import load
 
 __all__ = []
 __all__ += hbayesdm.diagnostics.__all__
+__all__ += hbayesdm.compiler.__all__
+__all__ += ['fit_many', 'load']
 
 # Load version from the metadata
 __version__ = importlib_metadata.version(__name__)
@@ -0,0 +1,5 @@
+import sys
+
+from hbayesdm.cli import main
+
+sys.exit(main())
@@ -0,0 +1,1013 @@
+"""Backends running Stan for hBayesDM.
+
+Two backends are available:
+
+- ``'pystan'``: PyStan 2, which compiles models into Python extension
+  modules (the default).
+- ``'cmdstan'``: CmdStan, whose models are compiled into executables which
+  are run in separate processes (one per chain), their draws being read back
+  from the CSV files they write. CmdStan 2.26 or later is required for
+  within-chain parallelism (``threads_per_chain``). With CmdStan 2.33 or
+  later, programs are first rewritten in the current syntax of Stan (see
+  :func:`hbayesdm.variants.canonical_model_code`).
+
+The backend is chosen with the ``backend`` argument of the model functions,
+or with the ``HBAYESDM_BACKEND`` environment variable. CmdStan is looked up
+in the directory given by ``HBAYESDM_CMDSTAN`` (or ``CMDSTAN``), and then in
+``~/.cmdstan``.
+"""
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import weakref
+from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import (Any, Callable, Dict, Iterator, List, Optional, Sequence,
+                    Tuple, Union)
+
+import arviz as az
+import numpy as np
+import pandas as pd
+
+from hbayesdm.cache import compiler_flags
+from hbayesdm.variants import canonical_model_code
+
+__all__ = ['Backend', 'PyStanBackend', 'CmdStanBackend', 'CmdStanModel',
+           'DrawsFit', 'CmdStanFit', 'BACKENDS', 'DEFAULT_BACKEND',
+           'get_backend', 'read_stan_csv', 'to_inference_data']
+
+#: Backend used when none is given (``HBAYESDM_BACKEND`` overrides it).
+DEFAULT_BACKEND = 'pystan'
+
+# Number of values read at once by ``iter_draws``, by default
+_CHUNK_VALUES = 2 ** 20
+
+
+class Backend(metaclass=ABCMeta):
+    """Interface between hBayesDM and a Stan implementation.
+
+    A backend compiles Stan programs into model objects (which are pickled
+    into the model cache), runs the samplers, and extracts the draws.
+    """
+
+    #: Name of the backend, as given to ``get_backend``.
+    name = ''
+
+    @property
+    @abstractmethod
+    def version(self) -> str:
+        """Version of the Stan interface (part of the cache key)."""
+        pass
+
+    @property
+    def supports_threading(self) -> bool:
+        """Whether models can use several threads per chain."""
+        return False
+
+    @property
+    def supports_generate_quantities(self) -> bool:
+        """Whether generated quantities can be computed from given draws
+        (see :meth:`generate_quantities`)."""
+        return False
+
+    def available(self) -> bool:
+        """Whether the backend is installed."""
+        try:
+            return bool(self.version)
+        except (ImportError, RuntimeError):
+            return False
+
+    def flags(self, threads: bool = False) -> List[str]:
+        """Settings affecting compiled models (part of the cache key)."""
+        return compiler_flags()
+
+    def stan_code(self, model_path: Path, code: Optional[str]) \
+            -> Optional[str]:
+        """Stan code to compile, in the syntax accepted by the backend.
+
+        Parameters
+        ----------
+        model_path
+            Path to the ``.stan`` file.
+        code
+            Stan code of a variant of the model, or ``None`` for the file.
+
+        Returns
+        -------
+        str
+            Stan code to compile instead of the file, or ``None`` to compile
+            the file as it is.
+        """
+        return code
+
+    @abstractmethod
+    def compile(self, name: str, model_path: Path, code: Optional[str],
+                include_paths: Sequence[Path], threads: bool = False) -> Any:
+        """Compile a Stan program.
+
+        Parameters
+        ----------
+        name
+            Name of the model.
+        model_path
+            Path to the ``.stan`` file.
+        code
+            Stan code to compile instead of the file (e.g., for variants).
+        include_paths
+            Directories searched for ``#include``-d files.
+        threads
+            Whether the model should support within-chain parallelism.
+
+        Returns
+        -------
+        Any
+            Compiled model, to be pickled into the model cache.
+        """
+        pass
+
+    @abstractmethod
+    def sample(self, sm: Any, data: Dict, pars: List[str],
+               init: Union[str, Callable], chains: int, iter: int,
+               warmup: int, thin: int, control: Dict, n_jobs: int,
+               threads_per_chain: int = 1,
+               adaptation: Optional[List[Dict[str, Any]]] = None,
+               seed: Optional[int] = None) -> Any:
+        """Draw samples with NUTS; arguments follow PyStan's ``sampling``.
+
+        With ``adaptation`` (``'stepsize'``, ``'inv_metric'`` and ``'init'``
+        values of each chain), chains start from the given state: the
+        adaptation goes on from there during the ``warmup`` iterations, if
+        any, and is disengaged otherwise (i.e., chains are resumed). Chains
+        get distinct random number streams from the same ``seed``, which is
+        random if not given.
+        """
+        pass
+
+    def generate_quantities(self, sm: Any, data: Dict, fit: 'DrawsFit',
+                            pars: List[str], n_jobs: int) -> 'DrawsFit':
+        """Compute the generated quantities of a model from given draws of
+        its parameters (of each chain of ``fit``), keeping ``pars``."""
+        raise RuntimeError('The %s backend cannot compute generated '
+                           'quantities on their own.' % self.name)
+
+    def last_draws(self, fit: Any) -> List[Dict[str, np.ndarray]]:
+        """Return the last draw of each chain of a fit."""
+        return self.to_draws(fit).last_draws()
+
+    @abstractmethod
+    def adaptation(self, fit: Any) -> List[Dict[str, Any]]:
+        """Return the ``'stepsize'`` and ``'inv_metric'`` of each chain."""
+        pass
+
+    @abstractmethod
+    def to_draws(self, fit: Any) -> 'DrawsFit':
+        """Convert a fit returned by :meth:`sample` to a ``DrawsFit``."""
+        pass
+
+    @abstractmethod
+    def variational(self, sm: Any, data: Dict, pars: List[str],
+                    init: Union[str, Callable]) -> Any:
+        """Approximate the posterior with ADVI; see PyStan's ``vb``."""
+        pass
+
+    @abstractmethod
+    def vb_means(self, sm: Any, data: Dict) -> Dict[str, float]:
+        """Return the means of the variational approximation.
+
+        Returns
+        -------
+        Dict[str, float]
+            Mean of each scalar parameter, named like ``'mu_pr[1]'``.
+        """
+        pass
+
+    @abstractmethod
+    def extract(self, fit: Any, pars: Optional[Sequence[str]] = None) \
+            -> 'OrderedDict[str, np.ndarray]':
+        """Extract the draws of each parameter (or of ``pars`` only),
+        merging the chains."""
+        pass
+
+    @abstractmethod
+    def par_names(self, fit: Any) -> List[str]:
+        """List the parameters :meth:`extract` returns (with ``lp__``)."""
+        pass
+
+    def iter_draws(self, fit: Any, name: str,
+                   chunk_size: Optional[int] = None) -> Iterator[np.ndarray]:
+        """Iterate over the draws of a parameter in chunks of at most
+        ``chunk_size`` draws (of shape ``(n_draws, *dims)``), reading them
+        chain by chain if the fit allows it. By default, chunks hold about
+        a million values."""
+        if isinstance(fit, DrawsFit):
+            return fit.iter_draws(name, chunk_size)
+        values = self.extract(fit, [name])[name]
+        chunk_size = chunk_size or _chunk_size(values.shape[1:])
+        return (values[i:i + chunk_size]
+                for i in range(0, len(values), chunk_size))
+
+
+class PyStanBackend(Backend):
+    """Run Stan with PyStan 2."""
+
+    name = 'pystan'
+
+    @property
+    def version(self) -> str:
+        from pystan import __version__
+        return __version__
+
+    def compile(self, name, model_path, code, include_paths, threads=False):
+        from pystan import StanModel
+
+        include_paths = [str(p) for p in include_paths]
+        if code is None:
+            return StanModel(file=str(model_path), model_name=name,
+                             include_paths=include_paths)
+        return StanModel(model_code=code, model_name=name,
+                         include_paths=include_paths)
+
+    def sample(self, sm, data, pars, init, chains, iter, warmup, thin,
+               control, n_jobs, threads_per_chain=1, adaptation=None,
+               seed=None):
+        kwargs = {}  # type: Dict[str, Any]
+        if seed is not None:
+            kwargs['seed'] = seed
+        if adaptation is not None:
+            # PyStan shares the step size between chains
+            init = [a['init'] for a in adaptation]
+            control = dict(
+                control, adapt_engaged=warmup > 0,
+                stepsize=float(np.median([a['stepsize'] for a in adaptation])),
+                inv_metric={i: a['inv_metric']
+                            for i, a in enumerate(adaptation)})
+            kwargs['chain_id'] = list(range(chains))
+        return sm.sampling(data=data, pars=pars, init=init, chains=chains,
+                           iter=iter, warmup=warmup, thin=thin,
+                           control=control, n_jobs=n_jobs, **kwargs)
+
+    def adaptation(self, fit):
+        if isinstance(fit, DrawsFit):
+            return [dict(a) for a in fit.adaptation]
+        return [{'stepsize': s, 'inv_metric': np.asarray(m)}
+                for s, m in zip(fit.get_stepsize(), fit.get_inv_metric())]
+
+    def last_draws(self, fit):
+        if isinstance(fit, DrawsFit):
+            return fit.last_draws()
+        return [OrderedDict((k, np.asarray(v)) for k, v in p.items())
+                for p in fit.get_last_position()]
+
+    def to_draws(self, fit):
+        if isinstance(fit, DrawsFit):
+            return fit
+        data = az.from_pystan(fit)
+        return DrawsFit(
+            fit.model_name,
+            OrderedDict((n, v.values) for n, v in data.posterior.items()),
+            OrderedDict((n, v.values) for n, v in data.sample_stats.items()))
+
+    def variational(self, sm, data, pars, init):
+        return sm.vb(data=data, pars=pars, init=init)
+
+    def vb_means(self, sm, data):
+        fit = sm.vb(data=data)
+        return dict(zip(fit['mean_par_names'], fit['mean_pars']))
+
+    def extract(self, fit, pars=None):
+        return fit.extract(pars=pars, permuted=True)
+
+    def par_names(self, fit):
+        if isinstance(fit, DrawsFit):
+            return fit.par_names()
+        return list(fit.sim['pars_oi'])
+
+    def iter_draws(self, fit, name, chunk_size=None):
+        if isinstance(fit, DrawsFit) or not hasattr(fit, 'sim'):
+            return super().iter_draws(fit, name, chunk_size)
+        return self._iter_sim_draws(fit.sim, name, chunk_size)
+
+    @staticmethod
+    def _iter_sim_draws(sim: Dict[str, Any], name: str,
+                        chunk_size: Optional[int]) -> Iterator[np.ndarray]:
+        """Read the draws of a parameter from the samples a StanFit keeps
+        for each chain (one array per scalar, in column-major order)."""
+        if name not in sim['pars_oi']:
+            raise KeyError(name)
+        dims = tuple(sim['dims_oi'][sim['pars_oi'].index(name)])
+        fnames = [f for f in sim['fnames_oi']
+                  if f == name or f.startswith(name + '[')]
+        chunk_size = chunk_size or _chunk_size(dims)
+        for samples, warmup in zip(sim['samples'], sim['warmup2']):
+            chains = samples['chains']
+            n_draws = len(chains[fnames[0]]) - warmup
+            for i in range(warmup, warmup + n_draws, chunk_size):
+                end = min(i + chunk_size, warmup + n_draws)
+                chunk = np.column_stack(
+                    [np.asarray(chains[f][i:end]) for f in fnames])
+                yield chunk.reshape((end - i,) + dims, order='F')
+
+
+def _chunk_size(dims: Sequence[int]) -> int:
+    """Number of draws read at once by ``iter_draws``, by default."""
+    return max(_CHUNK_VALUES // max(int(np.prod(dims)), 1), 1)
+
+
+def _version_info(version: str) -> Tuple[int, ...]:
+    """Major and minor version numbers, e.g., ``(2, 33)`` for ``2.33.1``."""
+    return tuple(int(n) for n in re.findall(r'\d+', version)[:2])
+
+
+def _cmdstan_home() -> Optional[Path]:
+    """Find the CmdStan installation to use."""
+    for var in ('HBAYESDM_CMDSTAN', 'CMDSTAN'):
+        if os.environ.get(var):
+            return Path(os.environ[var]).expanduser()
+    installs = sorted(Path('~/.cmdstan').expanduser().glob('cmdstan-*'),
+                      key=lambda p: [int(n)
+                                     for n in re.findall(r'\d+', p.name)])
+    return installs[-1] if installs else None
+
+
+def _to_json(value: Any) -> Any:
+    """Convert data (or initial values) for Stan to JSON-compatible types."""
+    if isinstance(value, dict):
+        return OrderedDict((k, _to_json(v)) for k, v in value.items())
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    if isinstance(value, (list, tuple)):
+        return [_to_json(v) for v in value]
+    return value
+
+
+def _write_json(path: Path, value: Dict):
+    with open(str(path), 'w') as f:
+        json.dump(_to_json(value), f)
+
+
+def read_stan_csv(path: Union[str, Path]) \
+        -> Tuple[List[str], np.ndarray, Dict[str, Any]]:
+    """Read a CSV file written by CmdStan.
+
+    Parameters
+    ----------
+    path
+        Path to the CSV file.
+
+    Returns
+    -------
+    columns
+        Names of the columns (e.g., ``'lp__'``, ``'mu_pr.1'``).
+    draws
+        Draws, as an array of shape ``(n_draws, n_columns)``.
+    adaptation
+        ``'stepsize'`` and ``'inv_metric'`` adapted during warm-up, if any.
+    """
+    adaptation = {}  # type: Dict[str, Any]
+    with open(str(path)) as f:
+        comments = [line for line in f if line.startswith('#')]
+    for i, line in enumerate(comments):
+        m = re.match(r'#\s*Step size\s*=\s*(\S+)', line)
+        if m:
+            adaptation['stepsize'] = float(m.group(1))
+        elif 'inverse mass matrix' in line.lower():
+            rows = []
+            for row in comments[i + 1:]:
+                values = row.lstrip('#').strip()
+                if not re.match(r'^[-+.\deE,\s]+$', values) or not values:
+                    break
+                rows.append([float(v) for v in values.split(',')])
+            metric = np.array(rows)
+            adaptation['inv_metric'] = \
+                metric[0] if 'diagonal' in line.lower() else metric
+    df = pd.read_csv(str(path), comment='#')
+    return list(df.columns), df.to_numpy(dtype=float), adaptation
+
+
+def _read_stan_csv_header(path: Union[str, Path]) \
+        -> Tuple[List[str], List[str]]:
+    """Read the comments (the settings of the run) and the columns at the
+    beginning of a CSV file written by CmdStan."""
+    comments = []
+    with open(str(path)) as f:
+        for line in f:
+            if not line.startswith('#'):
+                return comments, line.strip().split(',')
+            comments.append(line)
+    raise RuntimeError('No columns found in %s.' % path)
+
+
+def _write_stan_csv(path: Path, fit: 'DrawsFit', chain: int,
+                    comments: Sequence[str] = (),
+                    columns: Optional[Sequence[str]] = None):
+    """Write the draws of a chain as a CSV file of CmdStan (e.g., as the
+    ``fitted_params`` of its generated quantities), after the ``comments``
+    and with the given ``columns`` if any (those missing from the fit, such
+    as generated quantities, are set to 0)."""
+    names = []  # type: List[str]
+    values = []  # type: List[np.ndarray]
+    for suffix, draws in (('__', fit.sample_stats), ('', fit.draws)):
+        for name, v in draws.items():
+            v = v[chain]
+            shape = v.shape[1:]
+            # Column-major order, as CmdStan writes arrays and matrices
+            index = np.array(np.unravel_index(
+                np.arange(int(np.prod(shape))), shape, order='F')).T + 1 \
+                if shape else np.zeros((1, 0), dtype=int)
+            names += [name + suffix + ''.join('.%d' % i for i in idx)
+                      for idx in index]
+            values.append(np.transpose(
+                v, [0] + list(range(v.ndim - 1, 0, -1))).reshape(len(v), -1))
+    df = pd.DataFrame(np.hstack(values), columns=names)
+    if columns is not None:
+        df = df.reindex(columns=list(columns), fill_value=0.0)
+    with open(str(path), 'w') as f:
+        f.writelines(comments)
+        df.to_csv(f, index=False)
+
+
+def _parse_columns(columns: Sequence[str]) \
+        -> 'OrderedDict[str, Tuple[List[int], Tuple[int, ...], List[int]]]':
+    """Group CSV columns by parameter: column numbers, shape, flat indices."""
+    groups = OrderedDict()  # type: OrderedDict
+    for j, col in enumerate(columns):
+        name, *index = col.split('.')
+        groups.setdefault(name, []).append((j, [int(i) - 1 for i in index]))
+    parsed = OrderedDict()  # type: OrderedDict
+    for name, items in groups.items():
+        cols = [j for j, _ in items]
+        indices = np.array([index for _, index in items], dtype=int)
+        if indices.size == 0:
+            parsed[name] = (cols, (), [0])
+            continue
+        shape = tuple(int(n) for n in indices.max(axis=0) + 1)
+        flat = np.ravel_multi_index(indices.T, shape).tolist()
+        parsed[name] = (cols, shape, flat)
+    return parsed
+
+
+class DrawsFit(object):
+    """Draws of a fitted model, kept by chain.
+
+    It mimics the parts of PyStan's ``StanFit4Model`` used by hBayesDM, for
+    fits read from CmdStan and fits made of several blocks of iterations
+    (``niter='auto'``).
+
+    Parameters
+    ----------
+    model_name
+        Name of the model.
+    draws
+        Draws of each parameter, as arrays of shape
+        ``(n_chains, n_draws, *dims)``.
+    sample_stats
+        Statistics of the sampler (e.g., ``'lp'``), as arrays of shape
+        ``(n_chains, n_draws)``.
+    adaptation
+        Adapted ``'stepsize'`` and ``'inv_metric'`` of each chain.
+    """
+
+    def __init__(self, model_name: str,
+                 draws: 'OrderedDict[str, np.ndarray]',
+                 sample_stats: 'OrderedDict[str, np.ndarray]',
+                 adaptation: Optional[List[Dict[str, Any]]] = None):
+        self.model_name = model_name
+        self.draws = draws
+        self.sample_stats = sample_stats
+        if not adaptation:
+            n_chains = len(next(iter(draws.values()))) if draws else 0
+            adaptation = [{} for _ in range(n_chains)]
+        self.adaptation = adaptation
+
+    @property
+    def pars(self) -> List[str]:
+        return list(self.draws)
+
+    @property
+    def n_chains(self) -> int:
+        return len(self.adaptation)
+
+    @classmethod
+    def concat(cls, fits: Sequence['DrawsFit'],
+               pars: Optional[Sequence[str]] = None) -> 'DrawsFit':
+        """Concatenate the draws of successive runs of the same chains.
+
+        Parameters
+        ----------
+        fits
+            Fits of successive blocks of iterations.
+        pars
+            Parameters to keep (all if not given).
+
+        Returns
+        -------
+        DrawsFit
+            Draws of all blocks; the adaptation is the latest one known.
+        """
+        names = [n for n in fits[0].draws if pars is None or n in pars]
+        adaptation = [{} for _ in range(fits[0].n_chains)]
+        for fit in fits:
+            for a, b in zip(adaptation, fit.adaptation):
+                a.update(b)
+        return DrawsFit(
+            fits[0].model_name,
+            OrderedDict((n, np.concatenate([f.draws[n] for f in fits], 1))
+                        for n in names),
+            OrderedDict((n, np.concatenate([f.sample_stats[n] for f in fits],
+                                           1))
+                        for n in fits[0].sample_stats),
+            adaptation)
+
+    @classmethod
+    def from_chains(cls, fits: Sequence['DrawsFit']) -> 'DrawsFit':
+        """Combine the draws of chains run separately.
+
+        Parameters
+        ----------
+        fits
+            Fits of the chains, with the same parameters and number of draws.
+
+        Returns
+        -------
+        DrawsFit
+            Draws of all the chains.
+        """
+        return DrawsFit(
+            fits[0].model_name,
+            OrderedDict((n, np.concatenate([f.draws[n] for f in fits]))
+                        for n in fits[0].draws),
+            OrderedDict((n, np.concatenate([f.sample_stats[n] for f in fits]))
+                        for n in fits[0].sample_stats),
+            [a for f in fits for a in f.adaptation])
+
+    def last_draws(self) -> List[Dict[str, np.ndarray]]:
+        """Last draw of each chain, to initialize a following run."""
+        return [OrderedDict((n, v[c, -1]) for n, v in self.draws.items())
+                for c in range(self.n_chains)]
+
+    def par_names(self) -> List[str]:
+        """Names of the draws :meth:`extract` returns."""
+        return self.pars + (['lp__'] if 'lp' in self.sample_stats else [])
+
+    def extract(self, pars: Optional[Sequence[str]] = None,
+                permuted: bool = True) -> 'OrderedDict[str, np.ndarray]':
+        """Extract the draws of each parameter (and ``lp__``).
+
+        Draws of all chains are concatenated (``permuted`` is accepted for
+        compatibility with PyStan, but draws are not shuffled).
+        """
+        draws = OrderedDict(self.draws)
+        if 'lp' in self.sample_stats:
+            draws['lp__'] = self.sample_stats['lp']
+        names = list(pars) if pars is not None else list(draws)
+        return OrderedDict(
+            (n, draws[n].reshape((-1,) + draws[n].shape[2:]))
+            for n in names if n in draws)
+
+    def iter_draws(self, name: str, chunk_size: Optional[int] = None) \
+            -> Iterator[np.ndarray]:
+        """Iterate over the draws of a parameter (or ``lp__``), chain by
+        chain, in chunks of at most ``chunk_size`` draws of shape
+        ``(n_draws, *dims)`` (by default, of about a million values)."""
+        values = self.sample_stats['lp'] if name == 'lp__' else \
+            self.draws[name]
+        chunk_size = chunk_size or _chunk_size(values.shape[2:])
+        for chain in values:
+            for i in range(0, len(chain), chunk_size):
+                yield chain[i:i + chunk_size]
+
+    def to_inference_data(self, log_likelihood: Optional[str] = None) \
+            -> az.InferenceData:
+        """Convert the draws to ArviZ's ``InferenceData``.
+
+        Generated quantities with fewer draws than the parameters (thinned
+        with ``gq_thin``) are left out of the posterior.
+        """
+        n_draws = max(v.shape[1] for v in self.draws.values())
+        posterior = OrderedDict((n, v) for n, v in self.draws.items()
+                                if n != log_likelihood and
+                                v.shape[1] == n_draws)
+        kwargs = {}  # type: Dict[str, Any]
+        if log_likelihood is not None:
+            kwargs['log_likelihood'] = {
+                log_likelihood: self.draws[log_likelihood]}
+        return az.from_dict(posterior=posterior,
+                            sample_stats=self.sample_stats, **kwargs)
+
+    def stansummary(self) -> str:
+        """Summarize the draws of each parameter."""
+        n_draws = sum(v.shape[0] * v.shape[1]
+                      for v in list(self.draws.values())[:1])
+        return '\n'.join([
+            'Inference for Stan model: %s.' % self.model_name,
+            '%d chains, %d draws in total.' % (self.n_chains, n_draws),
+            '',
+            az.summary(self.to_inference_data()).to_string()])
+
+
+class CmdStanFit(DrawsFit):
+    """Draws of a model run with CmdStan.
+
+    Parameters
+    ----------
+    model_name
+        Name of the model.
+    columns
+        Names of the columns of the CSV files written by CmdStan.
+    chains
+        Draws of each chain, as arrays of shape ``(n_draws, n_columns)``.
+    pars
+        Parameters to keep (all if not given).
+    adaptation
+        Adapted stepsize and inverse metric of each chain.
+    """
+
+    def __init__(self, model_name: str, columns: List[str],
+                 chains: List[np.ndarray],
+                 pars: Optional[Sequence[str]] = None,
+                 adaptation: Optional[List[Dict[str, Any]]] = None):
+        draws = OrderedDict()  # type: OrderedDict
+        sample_stats = OrderedDict()  # type: OrderedDict
+        data = np.stack(chains)
+        for name, (cols, shape, flat) in _parse_columns(columns).items():
+            values = np.empty(data.shape[:2] + (int(np.prod(shape)),))
+            values[..., flat] = data[..., cols]
+            values = values.reshape(data.shape[:2] + shape)
+            if name.endswith('__'):
+                sample_stats[name.rstrip('_')] = values
+            elif pars is None or name in pars:
+                draws[name] = values
+        super().__init__(model_name, draws, sample_stats,
+                         adaptation or [{} for _ in chains])
+
+
+class CmdStanModel(object):
+    """A Stan model compiled by CmdStan.
+
+    The executable is kept in memory, so that the model can be pickled into
+    the model cache, and is written to a temporary file when first run.
+
+    Parameters
+    ----------
+    name
+        Name of the model.
+    executable
+        Content of the compiled executable.
+    threads
+        Whether the executable was built with threading support.
+    """
+
+    def __init__(self, name: str, executable: bytes, threads: bool = False):
+        self.name = name
+        self.executable = executable
+        self.threads = threads
+        self._path = None  # type: Optional[Path]
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_path'] = None
+        return state
+
+    def path(self) -> Path:
+        """Path to the executable, written to a temporary file if needed."""
+        if self._path is None or not self._path.exists():
+            directory = tempfile.mkdtemp(prefix='hbayesdm-cmdstan-')
+            weakref.finalize(self, shutil.rmtree, directory, True)
+            path = Path(directory) / (
+                self.name + ('.exe' if sys.platform == 'win32' else ''))
+            path.write_bytes(self.executable)
+            path.chmod(0o755)
+            self._path = path
+        return self._path
+
+    def run(self, args: List[str], workdir: Path, log: str,
+            threads: int = 1):
+        """Run the executable with CmdStan arguments.
+
+        Raises
+        ------
+        RuntimeError
+            If the run fails; the end of its output is given in the message.
+        """
+        env = dict(os.environ, STAN_NUM_THREADS=str(threads))
+        with open(str(workdir / log), 'w') as out:
+            code = subprocess.call([str(self.path())] + args, cwd=str(workdir),
+                                   stdout=out, stderr=subprocess.STDOUT,
+                                   env=env)
+        if code != 0:
+            with open(str(workdir / log)) as f:
+                tail = ''.join(f.readlines()[-20:])
+            raise RuntimeError(
+                'CmdStan failed to run %s (exit code %d):\n%s'
+                % (self.name, code, tail))
+
+
+class CmdStanBackend(Backend):
+    """Run Stan with CmdStan executables.
+
+    Parameters
+    ----------
+    path
+        CmdStan installation directory. Defaults to ``HBAYESDM_CMDSTAN`` or
+        ``CMDSTAN``, or the latest version installed in ``~/.cmdstan``.
+    """
+
+    name = 'cmdstan'
+
+    def __init__(self, path: Union[str, Path, None] = None):
+        self._path = Path(path) if path is not None else None
+
+    @property
+    def path(self) -> Path:
+        path = self._path or _cmdstan_home()
+        if path is None or not (path / 'makefile').exists():
+            raise RuntimeError(
+                'Cannot find CmdStan. Install it (e.g., with cmdstanpy\'s '
+                'install_cmdstan) and set HBAYESDM_CMDSTAN to its directory.')
+        return path
+
+    @property
+    def version(self) -> str:
+        with open(str(self.path / 'makefile')) as f:
+            m = re.search(r'^CMDSTAN_VERSION\s*:?=\s*(\S+)', f.read(), re.M)
+        return m.group(1) if m else self.path.name.replace('cmdstan-', '')
+
+    @property
+    def supports_threading(self) -> bool:
+        return _version_info(self.version) >= (2, 26)
+
+    def flags(self, threads=False):
+        flags = compiler_flags()
+        local = self.path / 'make' / 'local'
+        if local.exists():
+            flags += ['make/local:' + line.strip()
+                      for line in local.read_text().splitlines()
+                      if line.strip() and not line.startswith('#')]
+        if threads:
+            flags.append('STAN_THREADS=true')
+        return flags
+
+    def stan_code(self, model_path, code):
+        # The syntax of Stan 2.19 used by the programs was removed in 2.33
+        if _version_info(self.version) < (2, 33):
+            return code
+        if code is None:
+            with open(str(model_path), 'r') as f:
+                code = f.read()
+        return canonical_model_code(code)
+
+    def compile(self, name, model_path, code, include_paths, threads=False):
+        make = 'mingw32-make' if sys.platform == 'win32' and \
+            shutil.which('mingw32-make') else 'make'
+        with tempfile.TemporaryDirectory(prefix='hbayesdm-') as tmp:
+            stan_file = Path(tmp) / (name + '.stan')
+            if code is None:
+                shutil.copyfile(str(model_path), str(stan_file))
+            else:
+                stan_file.write_text(code)
+            exe = stan_file.with_suffix(
+                '.exe' if sys.platform == 'win32' else '')
+            command = [make, 'STANCFLAGS=--include-paths=' +
+                       ','.join(Path(p).as_posix() for p in include_paths)]
+            if threads:
+                command.append('STAN_THREADS=true')
+            command.append(exe.as_posix())
+            result = subprocess.run(
+                command, cwd=str(self.path), stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT, universal_newlines=True)
+            if result.returncode != 0 or not exe.exists():
+                raise RuntimeError(
+                    'CmdStan failed to compile %s:\n%s'
+                    % (name, '\n'.join(result.stdout.splitlines()[-30:])))
+            return CmdStanModel(name, exe.read_bytes(), threads)
+
+    def _inits(self, workdir: Path, init: Union[str, Callable, List[Dict]],
+               chain: int) -> List[str]:
+        if isinstance(init, list):
+            value = init[chain - 1]
+        elif callable(init):
+            value = init()
+        else:
+            return ['init=0'] if init in ('0', 0) else []
+        path = workdir / ('init-%d.json' % chain)
+        _write_json(path, value)
+        return ['init=' + str(path)]
+
+    def _adaptation_args(self, workdir: Path, control: Dict, warmup: int,
+                         adaptation: Optional[List[Dict[str, Any]]],
+                         chain: int) -> List[str]:
+        """Arguments of the sampler, after the number of iterations."""
+        adapt = ['adapt', 'delta=%g' % control['adapt_delta']] if warmup \
+            else ['adapt', 'engaged=0']
+        if adaptation is None:
+            return adapt + ['algorithm=hmc', 'engine=nuts',
+                            'max_depth=%d' % control['max_treedepth'],
+                            'stepsize=%g' % control['stepsize']]
+        a = adaptation[chain - 1]
+        metric = workdir / ('metric-%d.json' % chain)
+        _write_json(metric, {'inv_metric': a['inv_metric']})
+        return adapt + [
+            'algorithm=hmc', 'engine=nuts',
+            'max_depth=%d' % control['max_treedepth'],
+            'metric=%s_e' % ('diag' if np.ndim(a['inv_metric']) == 1
+                             else 'dense'),
+            'metric_file=' + str(metric),
+            'stepsize=%r' % float(a['stepsize'])]
+
+    def sample(self, sm, data, pars, init, chains, iter, warmup, thin,
+               control, n_jobs, threads_per_chain=1, adaptation=None,
+               seed=None):
+        if threads_per_chain > 1 and not sm.threads:
+            raise RuntimeError(
+                'The model was compiled without threading support.')
+        workdir = Path(tempfile.mkdtemp(prefix='hbayesdm-fit-'))
+        try:
+            _write_json(workdir / 'data.json', data)
+            if seed is None:
+                seed = np.random.randint(0, 2 ** 31 - 1)
+            if adaptation is not None:
+                init = [a['init'] for a in adaptation]
+
+            def run_chain(chain):
+                output = workdir / ('output-%d.csv' % chain)
+                sm.run(['id=%d' % chain,
+                        'random', 'seed=%d' % seed,
+                        'data', 'file=' + str(workdir / 'data.json')]
+                       + self._inits(workdir, init, chain)
+                       + ['output', 'file=' + str(output),
+                          'refresh=%d' % max(1, iter // 10),
+                          'method=sample',
+                          'num_samples=%d' % (iter - warmup),
+                          'num_warmup=%d' % warmup,
+                          'thin=%d' % thin]
+                       + self._adaptation_args(
+                           workdir, control, warmup, adaptation, chain),
+                       workdir, 'output-%d.txt' % chain, threads_per_chain)
+                print('Chain %d finished.' % chain)
+                return read_stan_csv(output)
+
+            with ThreadPoolExecutor(max_workers=max(1, n_jobs)) as executor:
+                results = list(executor.map(run_chain, range(1, chains + 1)))
+        finally:
+            shutil.rmtree(str(workdir), ignore_errors=True)
+
+        columns = results[0][0]
+        return CmdStanFit(sm.name, columns, [r[1] for r in results], pars,
+                          [r[2] for r in results])
+
+    @property
+    def supports_generate_quantities(self):
+        return True
+
+    def _fitted_params_header(self, sm: CmdStanModel, workdir: Path,
+                              n_draws: int) -> Tuple[List[str], List[str]]:
+        """Comments and columns CmdStan expects in the ``fitted_params`` of
+        the generated quantities of a model: those of its own output, taken
+        from a single draw with fixed parameters."""
+        output = workdir / 'header.csv'
+        sm.run(['data', 'file=' + str(workdir / 'data.json'), 'init=0',
+                'output', 'file=' + str(output),
+                'method=sample', 'num_samples=1', 'num_warmup=0',
+                'algorithm=fixed_param'],
+               workdir, 'header.txt')
+        comments, columns = _read_stan_csv_header(output)
+        comments = [re.sub(r'^(#\s*num_samples\s*=\s*)\d+.*',
+                           r'\g<1>%d' % n_draws, line)
+                    for line in comments]
+        return comments, columns
+
+    def generate_quantities(self, sm, data, fit, pars, n_jobs):
+        workdir = Path(tempfile.mkdtemp(prefix='hbayesdm-gq-'))
+        try:
+            _write_json(workdir / 'data.json', data)
+            n_draws = next(iter(fit.draws.values())).shape[1]
+            comments, columns = self._fitted_params_header(
+                sm, workdir, n_draws)
+
+            def run_chain(chain):
+                fitted = workdir / ('fitted-%d.csv' % chain)
+                output = workdir / ('output-%d.csv' % chain)
+                _write_stan_csv(fitted, fit, chain - 1, comments, columns)
+                sm.run(['id=%d' % chain,
+                        'data', 'file=' + str(workdir / 'data.json'),
+                        'output', 'file=' + str(output),
+                        'method=generate_quantities',
+                        'fitted_params=' + str(fitted)],
+                       workdir, 'output-%d.txt' % chain)
+                return read_stan_csv(output)
+
+            with ThreadPoolExecutor(max_workers=max(1, n_jobs)) as executor:
+                results = list(executor.map(
+                    run_chain, range(1, fit.n_chains + 1)))
+        finally:
+            shutil.rmtree(str(workdir), ignore_errors=True)
+
+        generated = CmdStanFit(sm.name, results[0][0],
+                               [r[1] for r in results], pars)
+        return DrawsFit(sm.name, generated.draws, OrderedDict())
+
+    def _variational(self, sm, data, init):
+        workdir = Path(tempfile.mkdtemp(prefix='hbayesdm-vb-'))
+        try:
+            _write_json(workdir / 'data.json', data)
+            sm.run(['data', 'file=' + str(workdir / 'data.json')]
+                   + self._inits(workdir, init, 1)
+                   + ['output', 'file=' + str(workdir / 'output.csv'),
+                      'method=variational'],
+                   workdir, 'output.txt')
+            return read_stan_csv(workdir / 'output.csv')
+        finally:
+            shutil.rmtree(str(workdir), ignore_errors=True)
+
+    def variational(self, sm, data, pars, init):
+        columns, draws, _ = self._variational(sm, data, init)
+        # The first row holds the mean of the approximation
+        return CmdStanFit(sm.name, columns, [draws[1:]], pars)
+
+    def vb_means(self, sm, data):
+        columns, draws, _ = self._variational(sm, data, 'random')
+        means = OrderedDict()  # type: Dict[str, float]
+        for col, value in zip(columns, draws[0]):
+            name, *index = col.split('.')
+            if not name.endswith('__'):
+                key = name + ('[%s]' % ','.join(index) if index else '')
+                means[key] = value
+        return means
+
+    def extract(self, fit, pars=None):
+        return fit.extract(pars=pars, permuted=True)
+
+    def par_names(self, fit):
+        return fit.par_names()
+
+    def adaptation(self, fit):
+        return [{k: a[k] for k in ('stepsize', 'inv_metric') if k in a}
+                for a in fit.adaptation]
+
+    def to_draws(self, fit):
+        return fit
+
+
+#: Available backends, by name.
+BACKENDS = OrderedDict([
+    ('pystan', PyStanBackend),
+    ('cmdstan', CmdStanBackend),
+])
+
+
+@lru_cache(maxsize=None)
+def _backend(name: str) -> Backend:
+    return BACKENDS[name]()
+
+
+def get_backend(backend: Union[str, Backend, None] = None) -> Backend:
+    """Return the backend to use.
+
+    Parameters
+    ----------
+    backend
+        Name of the backend (``'pystan'`` or ``'cmdstan'``), or a backend
+        instance. Defaults to the ``HBAYESDM_BACKEND`` environment variable,
+        or ``'pystan'``.
+
+    Returns
+    -------
+    Backend
+        The backend.
+    """
+    if isinstance(backend, Backend):
+        return backend
+    name = backend or os.environ.get('HBAYESDM_BACKEND') or DEFAULT_BACKEND
+    if name not in BACKENDS:
+        raise RuntimeError(
+            'Unknown backend: %r (available: %s)'
+            % (name, ', '.join(BACKENDS)))
+    return _backend(name)
+
+
+def to_inference_data(fit: Any, log_likelihood: Optional[str] = None) \
+        -> az.InferenceData:
+    """Convert the fit of any backend to ArviZ's ``InferenceData``.
+
+    Parameters
+    ----------
+    fit
+        Fit returned by a backend (e.g., ``TaskModel.fit``).
+    log_likelihood
+        Name of the pointwise log-likelihood variable (e.g., ``'log_lik'``).
+
+    Returns
+    -------
+    az.InferenceData
+        Posterior draws (and log-likelihood) of the fit.
+    """
+    if isinstance(fit, DrawsFit):
+        return fit.to_inference_data(log_likelihood)
+    return az.from_pystan(fit, log_likelihood=log_likelihood)
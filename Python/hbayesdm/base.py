@@ -1,22 +1,38 @@
+import hashlib
 import multiprocessing
 import os
-import pickle
-import tempfile
+import signal
+import subprocess
+import sys
 import warnings
 from abc import ABCMeta, abstractmethod
 from collections import OrderedDict
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Callable, Dict, List, Sequence, Tuple, Union
+from typing import (Any, Callable, Dict, List, Optional, Sequence, Set, Tuple,
+                    Union)
 
 import re
 import arviz as az
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-from pystan import StanModel
-from pystan import __version__ as _pystan_version
 from scipy import stats
 
+from hbayesdm.backends import (Backend, DrawsFit, get_backend,
+                               to_inference_data)
+from hbayesdm.convergence import (check_auto_control, convergence_stats,
+                                  is_converged)
+from hbayesdm.checkpoint import Checkpoint, data_hash
+from hbayesdm.parvals import ParVals
+from hbayesdm.store import DrawStore, StoredFit
+from hbayesdm.summaries import (ChoiceProportions, DrawSummary,
+                                parse_statistics, summarize)
+from hbayesdm.cache import (ModelCache, compiler_version, model_hash,
+                            registry, source_hashes)
+from hbayesdm.variants import parameter_declarations, variant_model_source
+from hbayesdm.warmstart import save_adaptation, warm_start
+
 __all__ = ['TaskModel']
 
 PATH_ROOT = Path(__file__).absolute().parent
@@ -25,11 +41,282 @@ PATH_STAN = (PATH_COMMON / 'stan_files').resolve()
 PATH_EXTDATA = (PATH_COMMON / 'extdata').resolve()
 
 
+def stan_model_source(model: str, variant: Optional[str] = None) \
+        -> Tuple[str, Optional[str]]:
+    """Return the name and the Stan code of a variant of a model.
+
+    Parameters
+    ----------
+    model
+        Full name of the model.
+    variant
+        Variant of the model (e.g., ``'lean'``), or ``None`` for the original
+        model.
+
+    Returns
+    -------
+    name
+        Name of the model in the cache, e.g. ``'ra_prospect.lean'``, with
+        the transformations of the variant that change the program only
+        (e.g., ``'task2AFC_sdt.lean'`` for ``'lean+threaded'``).
+    code
+        Stan code of the variant, or ``None`` if the original ``.stan`` file
+        is used (including when the variant is no different from it).
+    """
+    code = None
+    if variant is not None:
+        variant, code = variant_model_source(
+            PATH_STAN / (model + '.stan'), variant)
+    if code is None:
+        return model, None
+    return model + '.' + variant, code
+
+
+@lru_cache(maxsize=None)
+def stan_model_parameters(model: str) -> 'OrderedDict[str, Set[str]]':
+    """List the parameters of a model, with the data their sizes depend on.
+
+    Parameters
+    ----------
+    model
+        Full name of the model.
+
+    Returns
+    -------
+    OrderedDict
+        Names of the parameters declared in the parameters block of the
+        model, mapped to the names their declarations depend on.
+    """
+    with open(str(PATH_STAN / (model + '.stan')), 'r') as f:
+        return parameter_declarations(f.read())
+
+
+def stan_model_manifest(model: str, variant: Optional[str] = None,
+                        backend: Union[str, Backend, None] = None) \
+        -> Tuple[str, str, 'OrderedDict[str, Any]']:
+    """Return the cache name, key and manifest of a model.
+
+    Parameters
+    ----------
+    model
+        Full name of the model.
+    variant
+        Variant of the model (e.g., ``'lean'``), or ``None`` for the original
+        model.
+    backend
+        Backend compiling the model (see
+        :func:`hbayesdm.backends.get_backend`).
+
+    Returns
+    -------
+    name
+        Name of the model in the cache (see :func:`stan_model_source`).
+    key
+        Content hash of the Stan code, compiler flags and backend version.
+    manifest
+        Hashes of the Stan code and its included files, and versions of the
+        tools used to build the model, to be checked before loading it.
+    """
+    backend = get_backend(backend)
+    name, variant_code = stan_model_source(model, variant)
+    model_path = PATH_STAN / (model + '.stan')
+    code = backend.stan_code(model_path, variant_code)
+    hashes = source_hashes(model_path, [PATH_STAN])
+    if code is not None:
+        hashes['source'] = hashlib.sha256(code.encode()).hexdigest()
+    flags = backend.flags(_is_threaded(name))
+    version = backend.version
+    if backend.name != 'pystan':
+        # Keep the keys of models compiled by PyStan as they were
+        name = name + '@' + backend.name
+        version = backend.name + '-' + version
+    key = model_hash(model_path, flags=flags, version=version, hashes=hashes)
+    manifest = OrderedDict([
+        ('source_hash', hashes['source']),
+        ('include_hashes', hashes['includes']),
+        ('%s_version' % backend.name, backend.version),
+        ('compiler_flags', flags),
+    ])
+    if backend.name != 'pystan':
+        manifest['backend'] = backend.name
+    if variant_code is not None:
+        manifest['variant'] = name.partition('.')[2]
+    return name, key, manifest
+
+
+def _compact_postpreds(values: np.ndarray) -> np.ndarray:
+    """Cast posterior predictions to 8-bit integers if they are choices
+    (integers from ``-1``, for missing trials, to 127), and to single
+    precision otherwise."""
+    values = np.asarray(values)
+    if values.dtype == np.int8:
+        return values
+    if values.size and np.all((values >= -1) & (values <= 127) &
+                              (values == np.round(values))):
+        return values.astype(np.int8)
+    return values.astype(np.float32, copy=False)
+
+
+def _masked_postpreds(values: np.ndarray) -> np.ma.MaskedArray:
+    """Compact posterior predictions, whose missing trials (``-1``) are
+    masked (by a mask shared by all draws)."""
+    values = _compact_postpreds(values)
+    return np.ma.MaskedArray(
+        values, mask=np.broadcast_to(values[:1] == -1, values.shape))
+
+
+def _is_threaded(name: str) -> bool:
+    """Whether a model, by its name in the cache (see
+    :func:`stan_model_source`), uses within-chain parallelism."""
+    return 'threaded' in name.partition('.')[2].split('+')
+
+
+def load_stan_model(model: str, variant: Optional[str] = None,
+                    backend: Union[str, Backend, None] = None) -> Any:
+    """Load a compiled Stan model, compiling it if needed.
+
+    Models already loaded in this process are taken from the in-process
+    registry; otherwise, the model is loaded from the model cache, or
+    compiled and stored there.
+
+    Parameters
+    ----------
+    model
+        Full name of the model.
+    variant
+        Variant of the model (e.g., ``'lean'``), or ``None`` for the original
+        model.
+    backend
+        Backend compiling the model (see
+        :func:`hbayesdm.backends.get_backend`).
+
+    Returns
+    -------
+    sm
+        Compiled model obj to use for sampling & fitting.
+    """
+    backend = get_backend(backend)
+    name, key, manifest = stan_model_manifest(model, variant, backend)
+    return registry.get_or_load(
+        name, key,
+        lambda: _load_or_compile_stan_model(
+            model, variant, backend, name, key, manifest))
+
+
+def _load_or_compile_stan_model(model: str, variant: Optional[str],
+                                backend: Backend, name: str, key: str,
+                                manifest: Dict) -> Any:
+    """Load a compiled Stan model from the cache, compiling it if needed."""
+    source_name, code = stan_model_source(model, variant)
+    model_path = PATH_STAN / (model + '.stan')
+    code = backend.stan_code(model_path, code)
+
+    def compile_stan_model():
+        return backend.compile(source_name.replace('.', '_'), model_path,
+                               code, [PATH_STAN], _is_threaded(source_name))
+
+    cache = ModelCache()
+    sm, created = cache.load_or_store(
+        name, key, compile_stan_model,
+        expected=manifest,
+        manifest=OrderedDict(manifest, compiler_version=compiler_version()))
+    if not created:
+        print('Using cached model:', cache.path(name, key))
+
+    return sm
+
+
+class BackgroundBuild(object):
+    """Compile a Stan model in the background, while the data is prepared.
+
+    If the model is neither loaded in this process nor in the model cache,
+    it is compiled into the cache by a separate process (``hbayesdm
+    precompile``), so that the compilation overlaps with the work done in
+    the meantime and can be cancelled at any time.
+
+    Parameters
+    ----------
+    model
+        Full name of the model.
+    variant
+        Variant of the model (e.g., ``'lean'``), or ``None`` for the original
+        model.
+    backend
+        Backend compiling the model (see
+        :func:`hbayesdm.backends.get_backend`).
+    """
+
+    def __init__(self, model: str, variant: Optional[str] = None,
+                 backend: Union[str, Backend, None] = None):
+        self.model = model
+        self.variant = variant
+        self.backend = get_backend(backend)
+        self._process = None  # type: Optional[subprocess.Popen]
+
+        name, key, manifest = stan_model_manifest(model, variant, self.backend)
+        cache = ModelCache()
+        if (name, key) in registry or \
+                cache.check(cache.path(name, key), manifest) == 'ok':
+            return
+
+        command = [sys.executable, '-m', 'hbayesdm', 'precompile', model,
+                   '--variant', variant or 'full',
+                   '--backend', self.backend.name]
+
+        # The child process should find the same modules as this process
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(p for p in sys.path if p)
+
+        kwargs = {}  # type: Dict[str, Any]
+        if sys.platform == 'win32':
+            kwargs['creationflags'] = subprocess.CREATE_NEW_PROCESS_GROUP
+        else:
+            kwargs['start_new_session'] = True
+        try:
+            self._process = subprocess.Popen(
+                command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL, env=env, **kwargs)
+        except OSError:
+            self._process = None  # Compile it in this process, later
+
+    def result(self) -> Any:
+        """Wait for the build to finish, and return the compiled model.
+
+        If the background build failed, the model is compiled in this process
+        so that any compilation error is raised here.
+        """
+        if self._process is not None:
+            print('Waiting for the compilation of the model:', self.model)
+            self._process.wait()
+            self._process = None
+        return load_stan_model(self.model, self.variant, self.backend)
+
+    def cancel(self):
+        """Stop the background build, along with the compiler it runs."""
+        if self._process is None or self._process.poll() is not None:
+            self._process = None
+            return
+        if sys.platform == 'win32':
+            subprocess.call(
+                ['taskkill', '/F', '/T', '/PID', str(self._process.pid)],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        else:
+            try:
+                os.killpg(self._process.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        self._process.wait()
+        self._process = None
+
+
 class TaskModel(metaclass=ABCMeta):
     """hBayesDM TaskModel Base Class.
 
     The base class that is inherited by all hBayesDM task-models. Child classes
     should implement (i.e. override) the abstract method: `_preprocess_func`.
+
+    A model given ``_saved`` (by :func:`hbayesdm.load`) is restored from a
+    saved fit instead of being fitted.
     """
 
     def __init__(self,
@@ -62,6 +349,14 @@ class TaskModel(metaclass=ABCMeta):
             self.__parameters_desc['log' + p.upper()] = 'log(%s)' % p
 
         # Run model function
+        self.__build = None  # type: Optional[BackgroundBuild]
+        self.__adaptation = None  # type: Optional[List[Dict[str, Any]]]
+        self.__adaptation_dims = None  # type: Optional[Dict[str, int]]
+        self.__stan_model = None  # type: Optional[Tuple[str, Optional[str]]]
+        self.__precision = 'full'
+        if '_saved' in kwargs:
+            self._restore(kwargs['_saved'])
+            return
         model, all_ind_pars, par_vals, fit, raw_data, model_regressor \
             = self._run(**kwargs)
 
@@ -114,24 +409,59 @@ class TaskModel(metaclass=ABCMeta):
         return self.__all_ind_pars
 
     @property
-    def par_vals(self) -> OrderedDict:
+    def par_vals(self) -> ParVals:
         return self.__par_vals
 
     @property
     def fit(self) -> Any:
         return self.__fit
 
+    @property
+    def backend(self) -> Backend:
+        return self.__backend
+
+    @property
+    def adaptation(self) -> Optional[List[Dict[str, Any]]]:
+        """Step size, inverse metric and last draw (``'stepsize'``,
+        ``'inv_metric'`` and ``'init'``) of each chain, or ``None`` if the
+        model was fitted with variational inference."""
+        return self.__adaptation
+
+    @property
+    def adaptation_dims(self) -> Optional[Dict[str, int]]:
+        """Data values defining the dimensions of the parameters."""
+        return self.__adaptation_dims
+
     @property
     def raw_data(self) -> pd.DataFrame:
+        if callable(self.__raw_data):  # read when first used, once loaded
+            self.__raw_data = self.__raw_data()
         return self.__raw_data
 
+    @property
+    def precision(self) -> str:
+        """Precision of the draws (``'full'`` or ``'compact'``)."""
+        return self.__precision
+
     @property
     def model_regressor(self) -> Dict:
         return self.__model_regressor
 
+    @property
+    def model_regressor_summary(self) -> Optional[Dict]:
+        """Statistics of the draws of each model regressor (per trial), as
+        requested with ``regressor_summary``."""
+        return self.__model_regressor_summary
+
+    @property
+    def postpred_summary(self) -> Optional[Dict]:
+        """Summaries of the posterior predictions (per trial, and choice
+        proportions per subject), as requested with ``postpred_summary``."""
+        return self.__postpred_summary
+
     def _run(self,
              data: pd.DataFrame = None,
-             niter: int = 4000,
+             niter: Union[int, str] = 4000,
              nwarmup: int = 1000,
              nchain: int = 4,
              ncore: int = 1,
@@ -144,52 +474,150 @@ class TaskModel(metaclass=ABCMeta):
              adapt_delta: float = 0.95,
              stepsize: float = 1,
              max_treedepth: int = 10,
+             threads_per_chain: int = 1,
+             backend: Union[str, Backend, None] = None,
+             auto_control: Optional[Dict[str, Any]] = None,
+             adaptation_from: Union['TaskModel', str, None] = None,
+             checkpoint: Optional[str] = None,
+             checkpoint_every: int = 500,
+             resume: Optional[str] = None,
+             draws_dir: Optional[str] = None,
+             regressor_summary: Optional[Sequence[str]] = None,
+             postpred_summary: Union[bool, Sequence[str]] = False,
+             gq_thin: int = 1,
+             precision: str = 'full',
+             compress: bool = False,
+             scheduler: Any = None,
              **additional_args: Any) \
-            -> Tuple[str, pd.DataFrame, OrderedDict, Any, Dict]:
-        """Run the hbayesdm modeling function."""
-        self._check_regressor(model_regressor)
-        self._check_postpred(inc_postpred)
-
-        raw_data, initial_columns = self._handle_data_args(data)
-        insensitive_data_columns = self._get_insensitive_data_columns()
-
-        self._check_data_columns(raw_data, insensitive_data_columns)
-        self._check_missing_values(raw_data, insensitive_data_columns)
-
-        general_info = self._prepare_general_info(raw_data)
-        # set default values if not specified
-        for key, value in self.__additional_args.items():
-            if key not in additional_args:
-                additional_args[key] = value
-
-        data_dict = self._preprocess_func(
-            raw_data, general_info, additional_args)
-        pars = self._prepare_pars(model_regressor, inc_postpred)
-
-        n_subj = general_info['n_subj']
-        if inits == 'vb':
-            gen_init = self._prepare_gen_init_vb(data_dict, n_subj)
-        else:
-            gen_init = self._prepare_gen_init(inits, n_subj)
+            -> Tuple[str, pd.DataFrame, ParVals, Any, Dict]:
+        """Run the hbayesdm modeling function.
 
+        Chains (and variational inference) are run by the ``scheduler`` of
+        :func:`hbayesdm.fit_many` if given, or by the backend otherwise.
+        """
         model = self._get_model_full_name()
-        ncore = self._set_number_of_cores(ncore)
+        self.__backend = get_backend(backend)
+        self.__scheduler = scheduler
+        self._check_threads_per_chain(threads_per_chain)
+        if niter == 'auto':
+            auto_control = check_auto_control(auto_control)
+        elif not isinstance(niter, int):
+            raise RuntimeError(
+                '\'niter\' should be an integer or \'auto\'.')
+        if adaptation_from is not None and (vb or resume is not None):
+            raise RuntimeError(
+                '\'adaptation_from\' only warm-starts new MCMC chains, not '
+                'variational inference or resumed chains.')
+        checkpoint = self._check_checkpoint(
+            vb, checkpoint, checkpoint_every, resume)
+        if draws_dir is not None and vb:
+            raise RuntimeError(
+                'Draws are only written to \'draws_dir\' when sampling with '
+                'MCMC.')
+        self._check_gq_thin(gq_thin, vb, checkpoint, draws_dir)
+        if precision not in ('full', 'compact'):
+            raise RuntimeError(
+                '\'precision\' should be \'full\' or \'compact\'.')
+        if compress and checkpoint is None and draws_dir is None:
+            raise RuntimeError(
+                '\'compress\' applies to the draws written to a checkpoint '
+                'or to \'draws_dir\'.')
+        if regressor_summary is not None:
+            if not model_regressor:
+                raise RuntimeError(
+                    '\'regressor_summary\' requires model_regressor=True.')
+            parse_statistics(regressor_summary)
+        if postpred_summary is not False:
+            if not inc_postpred:
+                raise RuntimeError(
+                    '\'postpred_summary\' requires inc_postpred=True.')
+            postpred_summary = ['mean'] + [
+                s for s in ([] if postpred_summary is True
+                            else postpred_summary) if s != 'mean']
+            parse_statistics(postpred_summary)
+
+        # Compile the model (if needed) while the data is being prepared
+        self.__build = BackgroundBuild(
+            model, self._stan_model_variant(
+                model_regressor, inc_postpred, threads_per_chain, gq_thin),
+            self.__backend)
+        gq_build = BackgroundBuild(
+            model, self._gq_model_variant(model_regressor, inc_postpred),
+            self.__backend) if self._separate_gq(gq_thin) else None
+        try:
+            self._check_regressor(model_regressor)
+            self._check_postpred(inc_postpred)
+
+            raw_data, initial_columns = self._handle_data_args(data)
+            insensitive_data_columns = self._get_insensitive_data_columns()
+
+            self._check_data_columns(raw_data, insensitive_data_columns)
+            self._check_missing_values(raw_data, insensitive_data_columns)
+
+            general_info = self._prepare_general_info(raw_data)
+            # set default values if not specified
+            for key, value in self.__additional_args.items():
+                if key not in additional_args:
+                    additional_args[key] = value
+
+            data_dict = self._preprocess_func(
+                raw_data, general_info, additional_args)
+            pars = self._prepare_pars(model_regressor, inc_postpred)
+            dims = self._parameter_dims(data_dict)
+            adaptation = None
+            if adaptation_from is not None:
+                adaptation = warm_start(adaptation_from, model, dims, nchain)
+
+            n_subj = general_info['n_subj']
+            if adaptation is not None or resume is not None:
+                gen_init = 'random'  # chains start from the previous draws
+            elif inits == 'vb':
+                gen_init = self._prepare_gen_init_vb(
+                    data_dict, n_subj, model_regressor, inc_postpred,
+                    threads_per_chain, gq_thin)
+            else:
+                gen_init = self._prepare_gen_init(inits, n_subj)
+
+            ncore = self._set_number_of_cores(ncore)
+
+            self._print_for_user(
+                model, data, vb, nchain, ncore, niter, nwarmup,
+                general_info, additional_args, model_regressor)
 
-        self._print_for_user(
-            model, data, vb, nchain, ncore, niter, nwarmup,
-            general_info, additional_args, model_regressor)
+            sm = self._designate_stan_model(
+                model, model_regressor, inc_postpred, threads_per_chain,
+                gq_thin)
+        except BaseException:
+            self.__build.cancel()
+            if gq_build is not None:
+                gq_build.cancel()
+            raise
 
-        sm = self._designate_stan_model(model)
-        fit = self._fit_stan_model(
-            vb, sm, data_dict, pars, gen_init, nchain, niter, nwarmup, nthin,
-            adapt_delta, stepsize, max_treedepth, ncore)
+        try:
+            fit = self._fit_stan_model(
+                vb, sm, data_dict, pars, gen_init, nchain, niter, nwarmup,
+                nthin, adapt_delta, stepsize, max_treedepth, ncore,
+                threads_per_chain, auto_control, adaptation, checkpoint,
+                checkpoint_every, resume is not None,
+                DrawStore(draws_dir, compress)
+                if draws_dir is not None else None,
+                gq_thin, gq_build, precision, compress)
+        except BaseException:
+            if gq_build is not None:
+                gq_build.cancel()
+            raise
 
         measure = self._define_measure_function(ind_pars)
-        par_vals = self._extract_from_fit(fit, inc_postpred)
+        par_vals = self._extract_from_fit(fit, inc_postpred, precision)
         all_ind_pars = self._measure_all_ind_pars(
             measure, par_vals, general_info['subjs'])
-        model_regressor = self._extract_model_regressor(
-            measure, par_vals) if model_regressor else None
+        model_regressor, model_regressor_summary = \
+            self._extract_model_regressor(
+                ind_pars, par_vals, regressor_summary) \
+            if model_regressor else (None, None)
+        postpred_summary = self._summarize_postpreds(
+            par_vals, postpred_summary, general_info['subjs']) \
+            if postpred_summary is not False else None
 
         self._revert_initial_columns(raw_data, initial_columns)
         self._inform_completion()
@@ -201,9 +629,59 @@ class TaskModel(metaclass=ABCMeta):
         self.__fit = fit
         self.__raw_data = raw_data
         self.__model_regressor = model_regressor
+        self.__model_regressor_summary = model_regressor_summary
+        self.__postpred_summary = postpred_summary
+        self.__adaptation = None if vb else \
+            self._final_adaptation(fit, adaptation)
+        self.__adaptation_dims = dims
+        self.__precision = precision
 
         return model, all_ind_pars, par_vals, fit, raw_data, model_regressor
 
+    def _restore(self, saved: Dict[str, Any]):
+        """Restore a fitted model from the contents of a saved fit.
+
+        Parameters
+        ----------
+        saved
+            Fit, results and metadata read by :func:`hbayesdm.load` (the
+            ``'raw_data'`` may be a function reading them when first used).
+        """
+        self.__backend = get_backend(saved['backend'])
+        self.__scheduler = None
+        self.__model = saved['model']
+        self.__fit = saved['fit']
+        self.__precision = saved['precision']
+        self.__par_vals = self._extract_from_fit(
+            saved['fit'], saved['inc_postpred'], saved['precision'])
+        self.__all_ind_pars = saved['all_ind_pars']
+        self.__raw_data = saved['raw_data']
+        self.__model_regressor = saved['model_regressor']
+        self.__model_regressor_summary = saved['model_regressor_summary']
+        self.__postpred_summary = saved['postpred_summary']
+        self.__adaptation = saved['adaptation']
+        self.__adaptation_dims = saved['adaptation_dims']
+
+    def save(self, path: Union[str, Path], compress: bool = False):
+        """Save the fitted model to a directory, to load it with
+        :func:`hbayesdm.load`.
+
+        The draws of each parameter (and the statistics of the sampler) are
+        written column by column, along with ``all_ind_pars``, the model-based
+        regressors and summaries, ``raw_data``, and the adaptation of the
+        chains (see :mod:`hbayesdm.saving`). The compiled model is not saved.
+
+        Parameters
+        ----------
+        path
+            Path of the directory, which is created if needed. A model saved
+            there before is replaced.
+        compress
+            Whether to compress the draws.
+        """
+        from hbayesdm.saving import save
+        save(self, path, compress)
+
     def _check_regressor(self, requested_by_user: bool):
         """Check if regressors are available for this model.
 
@@ -228,6 +706,103 @@ class TaskModel(metaclass=ABCMeta):
             raise RuntimeError(
                 'Posterior predictions are not yet available for this model.')
 
+    def _check_threads_per_chain(self, threads_per_chain: int):
+        """Check if within-chain parallelism can be used.
+
+        Parameters
+        ----------
+        threads_per_chain
+            Number of threads per chain requested by user.
+        """
+        if not isinstance(threads_per_chain, int) or threads_per_chain < 1:
+            raise RuntimeError(
+                '\'threads_per_chain\' should be a positive integer.')
+        model = self._get_model_full_name()
+        if threads_per_chain > 1 and \
+                not _is_threaded(stan_model_source(model, 'threaded')[0]):
+            raise RuntimeError(
+                'Within-chain parallelism (threads_per_chain > 1) is not '
+                'available for %s, whose likelihood is not computed subject '
+                'by subject.' % model)
+        backend = self.__backend
+        if threads_per_chain > 1 and not backend.supports_threading:
+            raise RuntimeError(
+                'Within-chain parallelism (threads_per_chain > 1) requires '
+                'Stan 2.26 or later, but the %s backend (version %s) is '
+                'built on an older version of Stan.'
+                % (backend.name, backend.version))
+
+    def _check_checkpoint(self, vb: bool, checkpoint: Optional[str],
+                          checkpoint_every: int, resume: Optional[str]) \
+            -> Optional[Checkpoint]:
+        """Check the checkpoint arguments given by user.
+
+        Returns
+        -------
+        Checkpoint
+            The checkpoint to write (and to resume from, with ``resume``), if
+            any.
+        """
+        if checkpoint is None and resume is None:
+            return None
+        if vb:
+            raise RuntimeError(
+                'Checkpoints are only available when sampling with MCMC.')
+        if checkpoint_every <= 0:
+            raise RuntimeError('\'checkpoint_every\' should be positive.')
+        if checkpoint is not None and resume is not None and \
+                Path(checkpoint).resolve() != Path(resume).resolve():
+            raise RuntimeError(
+                'A resumed fit keeps writing its checkpoints to \'resume\'; '
+                'do not give another \'checkpoint\' directory.')
+        if resume is not None:
+            if not Checkpoint(resume).exists():
+                raise RuntimeError('No checkpoint found in: %s' % resume)
+            return Checkpoint(resume)
+        if Checkpoint(checkpoint).exists():
+            raise RuntimeError(
+                'Checkpoint directory already in use: %s (use \'resume\' '
+                'to continue its fit).' % checkpoint)
+        return Checkpoint(checkpoint)
+
+    def _check_gq_thin(self, gq_thin: int, vb: bool,
+                       checkpoint: Optional[Checkpoint],
+                       draws_dir: Optional[str]):
+        """Check the thinning of generated quantities given by user."""
+        if not isinstance(gq_thin, int) or gq_thin < 1:
+            raise RuntimeError('\'gq_thin\' should be a positive integer.')
+        if gq_thin == 1:
+            return
+        if vb:
+            raise RuntimeError(
+                'Generated quantities are only thinned when sampling with '
+                'MCMC.')
+        if checkpoint is not None or draws_dir is not None:
+            raise RuntimeError(
+                '\'gq_thin\' cannot be used with checkpoints or '
+                '\'draws_dir\'.')
+        if not self.__backend.supports_generate_quantities:
+            raise RuntimeError(
+                '\'gq_thin\' requires a backend computing generated '
+                'quantities after sampling (e.g., \'cmdstan\'), not %r.'
+                % self.__backend.name)
+
+    def _separate_gq(self, gq_thin: int) -> bool:
+        """Whether generated quantities are computed after sampling, on every
+        ``gq_thin``-th draw."""
+        return gq_thin > 1
+
+    def _generated_quantities(self) -> List[str]:
+        """List the generated quantities thinned by ``gq_thin``.
+
+        Returns
+        -------
+        List[str]
+            ``log_lik``, model regressors and posterior predictions (the
+            ``mu_*`` parameters are kept on all draws).
+        """
+        return ['log_lik'] + list(self.regressors) + list(self.postpreds)
+
     def _handle_data_args(self, data) -> Tuple[pd.DataFrame, List]:
         """Handle user data arguments and return raw_data.
 
@@ -374,7 +949,7 @@ class TaskModel(metaclass=ABCMeta):
             b_subjs = list(blocks_per_subj)
             b_max = max(b_subjs)
             t_subjs = [list(trials_per_block[subj]) for subj in subjs]
-            t_max = max(max(t_subjs))
+            t_max = max(max(t) for t in t_subjs)
         return {'grouped_data': grouped_data,
                 'subjs': subjs, 'n_subj': n_subj,
                 'b_subjs': b_subjs, 'b_max': b_max,
@@ -439,7 +1014,10 @@ class TaskModel(metaclass=ABCMeta):
     def _prepare_gen_init_vb(self,
                              data_dict: Dict,
                              n_subj: int,
-                             ) -> Union[str, Callable]:
+                             model_regressor: bool = False,
+                             inc_postpred: bool = False,
+                             threads_per_chain: int = 1,
+                             gq_thin: int = 1) -> Union[str, Callable]:
         """Prepare initial values for the parameters using Variational Bayesian
         methods.
 
@@ -449,6 +1027,14 @@ class TaskModel(metaclass=ABCMeta):
             Dict holding the data to pass to Stan.
         n_subj
             Total number of subjects in data.
+        model_regressor
+            Whether user requested to extract model-based regressors.
+        inc_postpred
+            Whether user requested to include posterior predictive checks.
+        threads_per_chain
+            Number of threads to use within each chain.
+        gq_thin
+            Thinning of the generated quantities.
 
         Returns
         -------
@@ -457,10 +1043,11 @@ class TaskModel(metaclass=ABCMeta):
             the variational Bayesian method.
         """
         model = self._get_model_full_name()
-        sm = self._designate_stan_model(model)
+        sm = self._designate_stan_model(
+            model, model_regressor, inc_postpred, threads_per_chain, gq_thin)
 
         try:
-            fit = sm.vb(data=data_dict)
+            dict_vb_raw = self._vb_means(sm, data_dict)
         except Exception:
             warnings.warn(
                 'Failed to get VB estimates for initial values. '
@@ -468,7 +1055,6 @@ class TaskModel(metaclass=ABCMeta):
                 RuntimeWarning, stacklevel=1)
             return 'random'
 
-        dict_vb_raw = dict(zip(fit['mean_par_names'], fit['mean_pars']))
         dict_vb = {}
         tmp = {}
         for param_name, v in dict_vb_raw.items():
@@ -485,15 +1071,7 @@ class TaskModel(metaclass=ABCMeta):
                 vec[i] = idx_vals.get(i+1, np.nan)
             dict_vb[base] = vec # parameter[i] into parameter vector
 
-        dict_init = {}
-        if self.model_type == 'single':
-            for p in self.parameters:
-                dict_init[p] = dict_vb[p]
-        else:
-            dict_init['mu_pr'] = dict_vb["mu_pr"]
-            dict_init['sigma'] = dict_vb["sigma"]
-            for p in self.parameters:
-                dict_init[f"{p}_pr"] = dict_vb[f"{p}_pr"]
+        dict_init = {p: dict_vb[p] for p in self._stan_parameters()}
 
         def gen_init():
             return dict_init
@@ -551,6 +1129,105 @@ class TaskModel(metaclass=ABCMeta):
 
         return gen_init
 
+    def _stan_parameters(self) -> List[str]:
+        """List the parameters declared in the parameters block of the model.
+
+        Returns
+        -------
+        List[str]
+            Names of the (raw) parameters, to which initial values are given.
+        """
+        return list(stan_model_parameters(self._get_model_full_name()))
+
+    def _parameter_dims(self, data_dict: Dict) -> 'OrderedDict[str, int]':
+        """Collect the data values defining the sizes of the parameters.
+
+        Parameters
+        ----------
+        data_dict
+            Dict holding the data to pass to Stan.
+
+        Returns
+        -------
+        OrderedDict
+            Integer data (e.g., ``N``) the declarations of the parameters
+            depend on; fits with the same values have parameters of the same
+            dimensions.
+        """
+        names = set().union(
+            *stan_model_parameters(self._get_model_full_name()).values())
+        return OrderedDict(
+            (k, int(data_dict[k])) for k in sorted(names)
+            if isinstance(data_dict.get(k), (int, np.integer)))
+
+    def _final_adaptation(self, fit: Any,
+                          adaptation: Optional[List[Dict[str, Any]]]) \
+            -> Optional[List[Dict[str, Any]]]:
+        """Collect the adaptation and the last draw of each chain of a fit.
+
+        Parameters
+        ----------
+        fit
+            Fitted result of sampling the stan model.
+        adaptation
+            Adaptation the chains were started from, if any.
+
+        Returns
+        -------
+        List[Dict]
+            ``'stepsize'``, ``'inv_metric'`` and ``'init'`` of each chain, or
+            ``None`` if the backend does not report them.
+        """
+        backend = self.__backend
+        try:
+            last = backend.last_draws(fit)
+        except Exception:
+            return None
+        try:
+            final = backend.adaptation(fit)
+        except Exception:  # e.g., adaptation not engaged
+            final = [{} for _ in last]
+        inits = self._stan_parameters()
+        chains = []
+        for c, (a, draw) in enumerate(zip(final, last)):
+            chain = OrderedDict(adaptation[c]) if adaptation else OrderedDict()
+            chain.update((k, v) for k, v in a.items() if k != 'init')
+            chain['init'] = OrderedDict(
+                (p, np.asarray(draw[p])) for p in inits if p in draw)
+            if 'stepsize' not in chain or 'inv_metric' not in chain:
+                return None
+            chains.append(chain)
+        return chains or None
+
+    def save_adaptation(self, path: Union[str, Path]):
+        """Save the adaptation of this fit, to warm-start later fits.
+
+        Parameters
+        ----------
+        path
+            Path of the file to write, which can be given as
+            ``adaptation_from`` to fit the same model on data of the same
+            dimensions.
+        """
+        if self.__adaptation is None:
+            raise RuntimeError(
+                'Only models fitted with MCMC have an adaptation to save.')
+        save_adaptation(path, self.__model, self.__adaptation,
+                        self.__adaptation_dims)
+
+    def _convergence_pars(self) -> List[str]:
+        """List the parameters whose convergence is tracked by niter='auto'.
+
+        Returns
+        -------
+        List[str]
+            Group-level parameters (``mu_*`` and ``sigma``, or the parameters
+            of single-subject models) and ``log_lik``.
+        """
+        if self.model_type == 'single':
+            return list(self.parameters) + ['log_lik']
+        return ['mu_' + p for p in self.parameters] + ['sigma', 'log_lik']
+
     def _get_model_full_name(self) -> str:
         """Return full name of model.
 
@@ -657,62 +1334,135 @@ class TaskModel(metaclass=ABCMeta):
         # An empty newline before Stan begins
         print()
 
-    def _designate_stan_model(self, model: str) -> StanModel:
+    def _stan_model_variant(self, model_regressor: bool, inc_postpred: bool,
+                            threads_per_chain: int = 1,
+                            gq_thin: int = 1) -> Optional[str]:
+        """Choose the variant of the Stan model to compile and sample.
+
+        Unless model-based regressors or posterior predictions are requested,
+        the lean variant (whose generated quantities only include ``log_lik``
+        and the ``mu_*`` parameters) is used. If generated quantities are
+        computed after sampling (see ``gq_thin``), the params variant (whose
+        generated quantities only include the ``mu_*`` parameters) is used
+        instead. With more than one thread per chain, the threaded variant
+        (computing the likelihood of subjects with ``reduce_sum``) is used.
+
+        Parameters
+        ----------
+        model_regressor
+            Whether user requested to extract model-based regressors.
+        inc_postpred
+            Whether user requested to include posterior predictive checks.
+        threads_per_chain
+            Number of threads to use within each chain.
+        gq_thin
+            Thinning of the generated quantities.
+
+        Returns
+        -------
+        variant
+            Name of the variant, or ``None`` for the original model.
+        """
+        variants = []
+        if self._separate_gq(gq_thin):
+            variants.append('params')
+        elif not (model_regressor or inc_postpred):
+            variants.append('lean')
+        if threads_per_chain > 1:
+            variants.append('threaded')
+        return '+'.join(variants) or None
+
+    def _gq_model_variant(self, model_regressor: bool,
+                          inc_postpred: bool) -> Optional[str]:
+        """Choose the variant of the Stan model computing the generated
+        quantities after sampling (see ``gq_thin``): the lean variant, unless
+        model-based regressors or posterior predictions are requested."""
+        return None if model_regressor or inc_postpred else 'lean'
+
+    def _designate_stan_model(self, model: str,
+                              model_regressor: bool = False,
+                              inc_postpred: bool = False,
+                              threads_per_chain: int = 1,
+                              gq_thin: int = 1) -> Any:
         """Designate the stan model to use for sampling.
 
         Parameters
         ----------
         model
             Full name of the model.
+        model_regressor
+            Whether user requested to extract model-based regressors.
+        inc_postpred
+            Whether user requested to include posterior predictive checks.
+        threads_per_chain
+            Number of threads to use within each chain.
+        gq_thin
+            Thinning of the generated quantities.
 
         Returns
         -------
         sm
-            Compiled StanModel obj to use for sampling & fitting.
+            Compiled model obj of the backend, to use for sampling & fitting.
         """
-        model_path = str(PATH_STAN / (model + '.stan'))
-        tempdir = Path(tempfile.gettempdir())
-
-        if getattr(os, 'getuid', None) is None:
-            uid = 'windows'
-        else:
-            uid = os.getuid()
-
-        cache_file = tempdir / (
-            'cached-hBayesDM_model-%s-pystan_%s_user-%d.pkl' %
-            (model, _pystan_version, uid)
-        )
-
-        if os.path.exists(cache_file):
-            try:
-                with open(cache_file, 'rb') as cached_stan_model:
-                    sm = pickle.load(cached_stan_model)
-                with open(model_path, 'r') as model_stan_code:
-                    assert sm.model_code == model_stan_code.read()
-                does_exist = True
-            except Exception:
-                print('Invalid cached StanModel:', cache_file)
-                print('Remove the cached model...')
-                os.remove(cache_file)
-                does_exist = False
-        else:
-            does_exist = False
-
-        if does_exist:
-            print('Using cached StanModel:', cache_file)
-        else:
-            sm = StanModel(file=model_path, model_name=model,
-                           include_paths=[str(PATH_STAN)])
-            with open(cache_file, 'wb') as f:
-                pickle.dump(sm, f)
+        variant = self._stan_model_variant(
+            model_regressor, inc_postpred, threads_per_chain, gq_thin)
+        self.__stan_model = (model, variant)
+        build = self.__build
+        if build is not None and (build.model, build.variant, build.backend) \
+                == (model, variant, self.__backend):
+            return build.result()
+        return load_stan_model(model, variant, self.__backend)
+
+    def _sample(self, sm: Any, **kwargs: Any) -> Any:
+        """Run the chains with the backend, or on the scheduler if any.
 
-        return sm
+        Parameters
+        ----------
+        sm
+            Compiled model obj of the backend.
+        **kwargs
+            Arguments of the ``sample`` method of the backend.
 
-    def _fit_stan_model(self, vb: bool, sm: StanModel, data_dict: Dict,
+        Returns
+        -------
+        fit
+            Fit returned by the backend (a ``DrawsFit`` with the scheduler).
+        """
+        if self.__scheduler is None:
+            return self.__backend.sample(sm, **kwargs)
+        return self.__scheduler.sample(
+            self.__stan_model, self.__backend, **kwargs)
+
+    def _variational(self, sm: Any, **kwargs: Any) -> Any:
+        """Run variational inference with the backend, or on the scheduler."""
+        if self.__scheduler is None:
+            return self.__backend.variational(sm, **kwargs)
+        return self.__scheduler.variational(
+            self.__stan_model, self.__backend, **kwargs)
+
+    def _vb_means(self, sm: Any, data_dict: Dict) -> Dict[str, float]:
+        """Compute VB means with the backend, or on the scheduler if any."""
+        if self.__scheduler is None:
+            return self.__backend.vb_means(sm, data_dict)
+        return self.__scheduler.vb_means(
+            self.__stan_model, self.__backend, data_dict)
+
+    def _fit_stan_model(self, vb: bool, sm: Any, data_dict: Dict,
                         pars: List, gen_init: Union[str, Callable],
-                        nchain: int, niter: int, nwarmup: int, nthin: int,
-                        adapt_delta: float, stepsize: float,
-                        max_treedepth: int, ncore: int) -> Any:
+                        nchain: int, niter: Union[int, str], nwarmup: int,
+                        nthin: int, adapt_delta: float, stepsize: float,
+                        max_treedepth: int, ncore: int,
+                        threads_per_chain: int = 1,
+                        auto_control: Optional[Dict[str, Any]] = None,
+                        adaptation: Optional[List[Dict[str, Any]]] = None,
+                        checkpoint: Optional[Checkpoint] = None,
+                        checkpoint_every: int = 500,
+                        resume: bool = False,
+                        store: Optional[DrawStore] = None,
+                        gq_thin: int = 1,
+                        gq_build: Optional[BackgroundBuild] = None,
+                        precision: str = 'full',
+                        compress: bool = False) -> Any:
         """Fit the stan model.
 
         Parameters
@@ -720,7 +1470,7 @@ class TaskModel(metaclass=ABCMeta):
         vb
             Whether to perform variational Bayesian analysis.
         sm
-            The StanModel object to use to fit the model.
+            The compiled model of the backend to use to fit the model.
         data_dict
             Dict holding the data to pass to Stan.
         pars
@@ -730,7 +1480,8 @@ class TaskModel(metaclass=ABCMeta):
         nchain
             Number of chains to run.
         niter
-            Number of iterations per chain.
+            Number of iterations per chain, or ``'auto'`` to sample until
+            convergence (see :meth:`_fit_stan_model_blocks`).
         nwarmup
             Number of warm-up iterations.
         nthin
@@ -743,28 +1494,283 @@ class TaskModel(metaclass=ABCMeta):
             Advanced control argument for sampler.
         ncore
             Argument for parallel computing while sampling multiple chains.
+        threads_per_chain
+            Number of threads to use within each chain.
+        auto_control
+            Targets and limits of ``niter='auto'``.
+        adaptation
+            Step size, inverse metric and initial values of each chain, from a
+            previous fit (see ``adaptation_from``).
+        checkpoint
+            Checkpoint to write after each block of iterations.
+        checkpoint_every
+            Number of iterations per block, with a checkpoint.
+        resume
+            Whether to resume the fit of the checkpoint.
+        store
+            Store where to write the draws while sampling (``draws_dir``).
+        gq_thin
+            Keep the generated quantities of every ``gq_thin``-th draw only.
+        gq_build
+            Build of the model computing the generated quantities after
+            sampling, with ``gq_thin`` (see
+            :meth:`_thin_generated_quantities`).
+        precision
+            ``'compact'`` to keep model-based regressors and posterior
+            predictions in lower precision (see :meth:`_compact_draws`).
+        compress
+            Whether to compress the draws written to the checkpoint.
 
         Returns
         -------
         fit
-            The fitted result returned by `vb` or `sampling` function.
+            The fitted result returned by the `variational` or `sample`
+            method of the backend (a ``DrawsFit`` with ``gq_thin``).
         """
-        if vb:
-            return sm.vb(data=data_dict,
-                         pars=pars,
-                         init=gen_init)
+        control = {'adapt_delta': adapt_delta,
+                   'stepsize': stepsize,
+                   'max_treedepth': max_treedepth}
+        # Raw parameters are sampled too, so that the last draws can
+        # initialize later fits (see ``adaptation``)
+        pars = pars + [p for p in self._stan_parameters() if p not in pars]
+        if gq_thin > 1:
+            fit = self._fit_stan_model(
+                vb, sm, data_dict,
+                [p for p in pars if p not in self._generated_quantities()],
+                gen_init, nchain, niter, nwarmup, nthin, adapt_delta,
+                stepsize, max_treedepth, ncore, threads_per_chain,
+                auto_control, adaptation, checkpoint, checkpoint_every,
+                resume, store)
+            fit = self._thin_generated_quantities(
+                fit, data_dict, pars, gq_thin, gq_build, ncore)
+        elif vb:
+            return self._variational(sm,
+                                     data=data_dict,
+                                     pars=pars,
+                                     init=gen_init)
+        elif niter == 'auto' or checkpoint is not None or store is not None:
+            return self._fit_stan_model_blocks(
+                sm, data_dict, pars, gen_init, nchain, niter, nwarmup, nthin,
+                control, ncore, threads_per_chain, auto_control, adaptation,
+                checkpoint, checkpoint_every, resume, store, precision,
+                compress)
         else:
-            return sm.sampling(data=data_dict,
+            fit = self._sample(sm,
+                               data=data_dict,
                                pars=pars,
                                init=gen_init,
                                chains=nchain,
                                iter=niter,
                                warmup=nwarmup,
                                thin=nthin,
-                               control={'adapt_delta': adapt_delta,
-                                        'stepsize': stepsize,
-                                        'max_treedepth': max_treedepth},
-                               n_jobs=ncore)
+                               control=control,
+                               n_jobs=ncore,
+                               threads_per_chain=threads_per_chain,
+                               adaptation=adaptation)
+        if precision == 'compact' and isinstance(fit, DrawsFit):
+            self._compact_draws(fit)
+        return fit
+
+    def _compact_draws(self, draws: DrawsFit) -> DrawsFit:
+        """Keep the draws of model-based regressors in single precision, and
+        those of posterior predictions as 8-bit integers if they are choices
+        (or in single precision otherwise), in place. Parameters keep double
+        precision.
+        """
+        for name in list(draws.draws):
+            if name in self.regressors:
+                draws.draws[name] = draws.draws[name].astype(np.float32)
+            elif name in self.postpreds:
+                draws.draws[name] = _compact_postpreds(draws.draws[name])
+        return draws
+
+    def _thin_generated_quantities(
+            self, fit: Any, data_dict: Dict, pars: List, gq_thin: int,
+            gq_build: BackgroundBuild, ncore: int) -> DrawsFit:
+        """Keep the generated quantities of every ``gq_thin``-th draw only.
+
+        Chains were sampled without the generated quantities, which are then
+        computed from every ``gq_thin``-th draw by the model of ``gq_build``.
+
+        Returns
+        -------
+        fit
+            Draws of the parameters, and thinned draws of the generated
+            quantities.
+        """
+        backend = self.__backend
+        draws = backend.to_draws(fit)
+        if draws is not fit:  # keep the adaptation of the chains
+            try:
+                draws.adaptation = backend.adaptation(fit)
+            except Exception:  # e.g., adaptation not engaged
+                pass
+        generated = [p for p in pars if p in self._generated_quantities()]
+        thinned = DrawsFit(
+            draws.model_name,
+            OrderedDict((n, v[:, ::gq_thin]) for n, v in draws.draws.items()),
+            OrderedDict((n, v[:, ::gq_thin])
+                        for n, v in draws.sample_stats.items()))
+        print('Computing generated quantities of %d draws per chain.'
+              % thinned.draws[next(iter(thinned.draws))].shape[1])
+        gq = backend.generate_quantities(
+            gq_build.result(), data_dict, thinned, generated, ncore)
+        draws.draws.update(gq.draws)
+        return draws
+
+    def _fit_stan_model_blocks(
+            self, sm: Any, data_dict: Dict, pars: List,
+            gen_init: Union[str, Callable], nchain: int,
+            niter: Union[int, str], nwarmup: int, nthin: int, control: Dict,
+            ncore: int, threads_per_chain: int,
+            auto_control: Optional[Dict[str, Any]],
+            adaptation: Optional[List[Dict[str, Any]]] = None,
+            checkpoint: Optional[Checkpoint] = None,
+            checkpoint_every: int = 500,
+            resume: bool = False,
+            store: Optional[DrawStore] = None,
+            precision: str = 'full',
+            compress: bool = False) -> DrawsFit:
+        """Sample in blocks of iterations.
+
+        The first block includes the warm-up; the following ones resume each
+        chain from its last draw, with the step size and inverse metric
+        adapted during the warm-up. With ``niter='auto'``, the
+        rank-normalized R-hat and the bulk and tail ESS of the group-level
+        parameters and ``log_lik`` are computed over all draws after each
+        block, and sampling stops when they meet the targets of
+        ``auto_control`` or when ``max_iter`` iterations have been run.
+        Otherwise, blocks of ``checkpoint_every`` iterations are run until
+        ``niter`` iterations. With the ``adaptation`` of a previous fit, the
+        first block starts from it.
+
+        With a ``store``, the draws of each block are appended to it instead
+        of being kept in memory. With a ``checkpoint``, the draws (in the
+        ``store``, or in the checkpoint directory) and then the state of the
+        chains are written after each block; with ``resume``, the chains of
+        the checkpoint are continued. With ``precision='compact'``, the draws
+        of each block are compacted (see :meth:`_compact_draws`) before they
+        are kept, and with ``compress``, those of the checkpoint directory are
+        compressed.
+
+        Returns
+        -------
+        fit
+            Draws of all the blocks, with the adaptation of each chain
+            (memory-mapped from the ``store``, if any).
+        """
+        backend = self.__backend
+        model = self._get_model_full_name()
+        inits = self._stan_parameters()
+        if niter == 'auto':
+            track = [p for p in self._convergence_pars() if p in pars]
+            max_iter = auto_control['max_iter']
+            block = auto_control['block']
+        else:
+            max_iter = niter
+            block = checkpoint_every if checkpoint is not None \
+                or store is not None else niter
+        block = -(-block // nthin) * nthin  # whole number of thinned draws
+
+        blocks = []  # type: List[DrawsFit]
+        n_iter = 0
+        seed = np.random.randint(0, 2 ** 31 - nchain * (max_iter + 1))
+        in_memory = store is None
+        if checkpoint is not None:
+            settings = OrderedDict([
+                ('model', model),
+                ('data', data_hash(data_dict)),
+                ('pars', pars),
+                ('nchain', nchain),
+                ('nthin', nthin),
+                ('precision', precision),
+            ])
+            if resume:
+                state = checkpoint.load(settings)
+                n_iter, seed = state['iterations'], state['seed']
+                adaptation, store = state['adaptation'], state['store']
+                print('Resuming from %d iterations per chain.' % n_iter)
+            else:
+                if store is None:
+                    store = DrawStore(checkpoint.path / 'draws', compress)
+                checkpoint.create(settings, store)
+        if store is not None and not resume:
+            store.create(model, nchain)
+
+        def draws_so_far(names):
+            if store is not None:
+                return DrawsFit.concat([store.fit()], names)
+            return DrawsFit.concat(blocks, names)
+
+        def finished():
+            if niter != 'auto':
+                return n_iter >= niter
+            stats = convergence_stats(
+                draws_so_far(track).to_inference_data(), track)
+            print('Iterations per chain: %d, max R-hat: %.3f, '
+                  'min bulk ESS: %.0f, min tail ESS: %.0f'
+                  % (n_iter, stats['rhat'], stats['ess_bulk'],
+                     stats['ess_tail']))
+            if is_converged(stats, auto_control):
+                return True
+            if n_iter >= max_iter:
+                warnings.warn(
+                    'Sampling stopped after %d iterations per chain '
+                    '(auto_control[\'max_iter\']) before reaching the '
+                    'convergence targets.' % n_iter,
+                    RuntimeWarning, stacklevel=1)
+                return True
+            return False
+
+        while n_iter == 0 or not finished():
+            if n_iter == 0:
+                iter_block = min(nwarmup + block, max_iter)
+                nwarmup = min(nwarmup, iter_block - 1)
+            else:
+                iter_block, nwarmup = min(block, max_iter - n_iter), 0
+            fit = self._sample(sm,
+                               data=data_dict,
+                               pars=pars,
+                               init=gen_init,
+                               chains=nchain,
+                               iter=iter_block,
+                               warmup=nwarmup,
+                               thin=nthin,
+                               control=control,
+                               n_jobs=ncore,
+                               threads_per_chain=threads_per_chain,
+                               adaptation=adaptation,
+                               seed=seed + nchain * (n_iter // block))
+            if n_iter == 0 and (adaptation is None or nwarmup > 0):
+                adaptation = backend.adaptation(fit)
+            draws = backend.to_draws(fit)
+            del fit
+            for a, last in zip(adaptation, draws.last_draws()):
+                a['init'] = {p: last[p] for p in inits if p in last}
+            draws = DrawsFit.concat([draws], pars)
+            if precision == 'compact':
+                self._compact_draws(draws)
+            if store is not None:
+                if precision == 'full':
+                    for pp in self.postpreds:  # stored draws are read-only
+                        if pp in draws.draws:
+                            draws.draws[pp][draws.draws[pp] == -1] = np.nan
+                store.append(draws)
+            else:
+                blocks.append(draws)
+            del draws
+            n_iter += iter_block
+            if checkpoint is not None:
+                checkpoint.save(n_iter, seed, adaptation)
+
+        if store is None:
+            fit = DrawsFit.concat(blocks, pars)
+        elif in_memory:  # draws of the checkpoint only
+            fit = DrawsFit.concat([store.fit()], pars)
+        else:
+            fit = store.fit()
+        fit.adaptation = adaptation
+        return fit
 
     def _define_measure_function(self, ind_pars: str) -> Callable:
         """Define which function to use to summarize results.
@@ -785,7 +1791,8 @@ class TaskModel(metaclass=ABCMeta):
             'mode': stats.mode,
         }[ind_pars]
 
-    def _extract_from_fit(self, fit: Any, inc_postpred: bool) -> OrderedDict:
+    def _extract_from_fit(self, fit: Any, inc_postpred: bool,
+                          precision: str = 'full') -> ParVals:
         """Extract from the stan fit object.
 
         Parameters
@@ -794,21 +1801,42 @@ class TaskModel(metaclass=ABCMeta):
             Fitted result of sampling the stan model.
         inc_postpred
             Whether user requested to include posterior predictive checks.
+        precision
+            With ``'compact'``, model-based regressors are extracted in single
+            precision, and posterior predictions as masked arrays of 8-bit
+            integers (or of single precision), whose missing trials are
+            masked; otherwise, missing trials are ``NaN``.
 
         Returns
         -------
         par_vals
-            Entire raw draws of MCMC sampler, for each parameter (& subject).
+            Entire raw draws of MCMC sampler, for each parameter (& subject),
+            extracted from the fit when first used.
         """
-        par_vals = fit.extract(permuted=True)
-        if inc_postpred:
-            for pp in self.postpreds:
-                par_vals[pp][par_vals[pp] == -1] = np.nan
-        return par_vals
+        transforms = {}  # type: Dict[str, Callable]
+        if precision == 'compact':
+            def single(values):
+                return np.asarray(values).astype(np.float32, copy=False)
+
+            transforms = {r: single for r in self.regressors}
+            if inc_postpred:
+                transforms.update(
+                    (pp, _masked_postpreds) for pp in self.postpreds)
+        elif inc_postpred and not isinstance(fit, StoredFit):
+            def missing_to_nan(values):
+                values = np.asarray(values, dtype=float)
+                return np.where(values == -1, np.nan, values)
+
+            transforms = {pp: missing_to_nan for pp in self.postpreds}
+        # Raw parameters, only sampled for the last draws of the chains (see
+        # ``adaptation``), are left out
+        raw = set(self._stan_parameters()).difference(
+            self._prepare_pars(True, True))
+        return ParVals(fit, self.__backend, transforms, raw)
 
     def _measure_all_ind_pars(self,
                               measure: Callable,
-                              par_vals: OrderedDict,
+                              par_vals: ParVals,
                               subjs: List) -> pd.DataFrame:
         """Measure all individual parameters (per subject).
 
@@ -860,26 +1888,97 @@ class TaskModel(metaclass=ABCMeta):
             return pd.DataFrame(cols, index=subjs)
 
     def _extract_model_regressor(
-            self, measure: Callable, par_vals: OrderedDict) -> Dict:
+            self, ind_pars: str, par_vals: ParVals,
+            statistics: Optional[Sequence[str]] = None) \
+            -> Tuple[Dict, Optional[Dict]]:
         """Model regressors (for model-based neuroimaging, etc.).
 
+        The draws of each regressor are read in chunks, chain by chain, and
+        summarized per element (e.g., per subject and trial), without
+        keeping them all in memory (see :mod:`hbayesdm.summaries`).
+
         Parameters
         ----------
-        measure
-            Function to use to summarize the samples.
+        ind_pars
+            How to summarize the draws ('mean', 'median' or 'mode').
         par_vals
             Raw draws of MCMC sampler.
+        statistics
+            Additional statistics to compute, if any.
 
         Returns
         -------
         model_regressor
             Dict containing summarized model regressor values.
+        model_regressor_summary
+            Dict containing the ``statistics`` of each model regressor, or
+            None if not requested.
+        """
+        wanted = list(statistics or [])
+        if ind_pars != 'mode' and ind_pars not in wanted:
+            wanted.append(ind_pars)
+
+        model_regressor = {}
+        summaries = {} if statistics is not None else None
+        for r in self.regressors:
+            result = summarize(
+                lambda: par_vals.iter_draws(r), wanted) if wanted else {}
+            if ind_pars == 'mode':
+                values = par_vals[r]
+                model_regressor[r] = np.asarray(
+                    stats.mode(values, axis=0)[0]).reshape(values.shape[1:])
+                par_vals.release(r)
+            else:
+                model_regressor[r] = result[ind_pars]
+            if summaries is not None:
+                summaries[r] = OrderedDict(
+                    (k, v) for k, v in result.items()
+                    if k != ind_pars or ind_pars in statistics)
+        return model_regressor, summaries
+
+    def _summarize_postpreds(self, par_vals: ParVals,
+                             statistics: Sequence[str],
+                             subjs: List) -> Dict:
+        """Summarize the posterior predictions while reading their draws.
+
+        The draws of each prediction are read in chunks, chain by chain, so
+        that the full array of predictions is never held in memory (see
+        :mod:`hbayesdm.summaries`).
+
+        Parameters
+        ----------
+        par_vals
+            Raw draws of MCMC sampler.
+        statistics
+            Statistics to compute for each trial.
+        subjs
+            List of all the subjects in the data.
+
+        Returns
+        -------
+        postpred_summary
+            Dict containing, for each posterior prediction, the
+            ``statistics`` of each trial and, for predicted choices, the
+            proportion of each choice per subject (``'choice_prop'``, as a
+            Pandas DataFrame).
         """
-        return {r: np.apply_over_axes(
-            measure,
-            par_vals[r],
-            [i + 1 for i in range(dim_size)]
-        ).squeeze() for r, dim_size in self.regressors.items()}
+        summaries = {}
+        for pp in self.postpreds:
+            summary = DrawSummary(statistics)
+            proportions = ChoiceProportions()
+            for chunk in par_vals.iter_draws(pp):
+                summary.update(chunk)
+                proportions.update(
+                    chunk[:, None] if self.model_type == 'single' else chunk)
+            if summary.needs_histogram:
+                for chunk in par_vals.iter_draws(pp):
+                    summary.update_histogram(chunk)
+            result = summary.result()
+            choice_prop = proportions.result()
+            if choice_prop is not None:
+                result['choice_prop'] = pd.DataFrame(choice_prop, index=subjs)
+            summaries[pp] = result
+        return summaries
 
     def _revert_initial_columns(self,
                                 raw_data: pd.DataFrame,
@@ -946,7 +2045,7 @@ class TaskModel(metaclass=ABCMeta):
 
         if type == 'dist':
             kwargs.setdefault('color', 'black')
-            axes = az.plot_posterior(self.fit,
+            axes = az.plot_posterior(to_inference_data(self.fit),
                                      kind='hist',
                                      var_names=var_names,
                                      credible_interval=credible_interval,
@@ -957,7 +2056,7 @@ class TaskModel(metaclass=ABCMeta):
             for ax, (p, desc) in zip(axes, self.parameters_desc.items()):
                 ax.set_title('{} ({})'.format(p, desc))
         elif type == 'trace':
-            az.plot_trace(self.fit, var_names=var_names)
+            az.plot_trace(to_inference_data(self.fit), var_names=var_names)
 
         plt.show()
 
@@ -984,7 +2083,7 @@ class TaskModel(metaclass=ABCMeta):
         else:
             kind = 'forestplot'
 
-        az.plot_forest(self.fit,
+        az.plot_forest(to_inference_data(self.fit),
                        kind=kind,
                        var_names=var_names,
                        credible_interval=credible_interval,
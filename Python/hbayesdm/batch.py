@@ -0,0 +1,231 @@
+"""Fitting many models and datasets on a shared budget of cores."""
+import multiprocessing
+import threading
+from concurrent.futures import (Future, ProcessPoolExecutor,
+                                ThreadPoolExecutor, as_completed)
+from typing import (Any, Callable, Dict, Iterator, List, Optional, Sequence,
+                    Tuple, Union)
+
+from hbayesdm.backends import Backend, DrawsFit, get_backend
+from hbayesdm.base import TaskModel, load_stan_model
+
+__all__ = ['CoreScheduler', 'fit_many']
+
+
+def _load(stan_model: Tuple[str, Optional[str]], backend: str) \
+        -> Tuple[Backend, Any]:
+    """Load a compiled model in a worker process (once per process)."""
+    backend = get_backend(backend)
+    return backend, load_stan_model(stan_model[0], stan_model[1], backend)
+
+
+def _sample_chain(stan_model: Tuple[str, Optional[str]], backend: str,
+                  kwargs: Dict[str, Any]) -> DrawsFit:
+    """Run a single chain (in a worker process)."""
+    backend, sm = _load(stan_model, backend)
+    fit = backend.sample(sm, **kwargs)
+    draws = backend.to_draws(fit)
+    if kwargs.get('adaptation') is None:
+        draws.adaptation = backend.adaptation(fit)
+    return draws
+
+
+def _variational(stan_model: Tuple[str, Optional[str]], backend: str,
+                 kwargs: Dict[str, Any]) -> Any:
+    """Run variational inference (in a worker process)."""
+    backend, sm = _load(stan_model, backend)
+    return backend.variational(sm, **kwargs)
+
+
+def _vb_means(stan_model: Tuple[str, Optional[str]], backend: str,
+              data: Dict) -> Dict[str, float]:
+    """Compute the means of the variational approximation (in a worker)."""
+    backend, sm = _load(stan_model, backend)
+    return backend.vb_means(sm, data)
+
+
+class CoreScheduler(object):
+    """Run the chains of many fits on a shared pool of processes.
+
+    Each chain takes as many cores as its ``threads_per_chain``, and is only
+    started when enough cores are free, so that at most ``max_cores`` cores
+    are busy at any time. Worker processes keep the compiled models they have
+    loaded, which are reused by the following chains of the same models.
+
+    Parameters
+    ----------
+    max_cores
+        Number of cores to use. Use -1 to use all the CPUs of the machine.
+    """
+
+    def __init__(self, max_cores: int = -1):
+        local_cores = multiprocessing.cpu_count()
+        if max_cores == -1 or max_cores > local_cores:
+            max_cores = local_cores
+        if max_cores < 1:
+            raise RuntimeError('\'max_cores\' should be positive, or -1.')
+        self.max_cores = max_cores
+        self._free = max_cores
+        self._condition = threading.Condition()
+        self._executor = ProcessPoolExecutor(
+            max_workers=max_cores,
+            mp_context=multiprocessing.get_context('spawn'))
+
+    def submit(self, cores: int, fn: Callable, *args: Any) -> Future:
+        """Run a function in a worker once ``cores`` cores are free.
+
+        Blocks until the cores are available, and frees them when the
+        function returns.
+        """
+        cores = min(cores, self.max_cores)
+        with self._condition:
+            self._condition.wait_for(lambda: self._free >= cores)
+            self._free -= cores
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._release(cores)
+            raise
+        future.add_done_callback(lambda _: self._release(cores))
+        return future
+
+    def _release(self, cores: int):
+        with self._condition:
+            self._free += cores
+            self._condition.notify_all()
+
+    def sample(self, stan_model: Tuple[str, Optional[str]], backend: Backend,
+               chains: int, init: Union[str, Callable, List[Dict]],
+               threads_per_chain: int = 1,
+               adaptation: Optional[List[Dict[str, Any]]] = None,
+               seed: Optional[int] = None,
+               **kwargs: Any) -> DrawsFit:
+        """Run the chains of a fit, each as a separate task.
+
+        Arguments are those of :meth:`hbayesdm.backends.Backend.sample`,
+        with the name and variant of the model instead of the model itself.
+        Chains run on their own get successive seeds from ``seed``.
+        """
+        futures = []
+        for chain in range(chains):
+            if isinstance(init, list):
+                chain_init = [init[chain]]  # type: Union[str, List[Dict]]
+            elif callable(init):
+                chain_init = [init()]
+            else:
+                chain_init = init
+            futures.append(self.submit(
+                threads_per_chain, _sample_chain, stan_model, backend.name,
+                dict(kwargs, chains=1, n_jobs=1, init=chain_init,
+                     threads_per_chain=threads_per_chain,
+                     seed=seed + chain if seed is not None else None,
+                     adaptation=adaptation[chain:chain + 1]
+                     if adaptation is not None else None)))
+        return DrawsFit.from_chains([f.result() for f in futures])
+
+    def variational(self, stan_model: Tuple[str, Optional[str]],
+                    backend: Backend, init: Union[str, Callable],
+                    **kwargs: Any) -> Any:
+        """Run variational inference as a task."""
+        return self.submit(
+            1, _variational, stan_model, backend.name,
+            dict(kwargs, init=[init()] if callable(init) else init)).result()
+
+    def vb_means(self, stan_model: Tuple[str, Optional[str]],
+                 backend: Backend, data: Dict) -> Dict[str, float]:
+        """Compute the means of the variational approximation as a task."""
+        return self.submit(
+            1, _vb_means, stan_model, backend.name, data).result()
+
+    def shutdown(self, wait: bool = True):
+        """Stop the worker processes."""
+        self._executor.shutdown(wait=wait)
+
+
+def _model_function(model: Union[str, Callable]) -> Callable:
+    if callable(model):
+        return model
+    import hbayesdm.models
+    function = getattr(hbayesdm.models, str(model), None)
+    if function is None or model not in hbayesdm.models.__all__:
+        raise RuntimeError('Unknown model: %r' % (model,))
+    return function
+
+
+def fit_many(jobs: Sequence[Dict[str, Any]],
+             max_cores: int = -1,
+             return_exceptions: bool = False) \
+        -> Iterator[Tuple[int, Union[TaskModel, BaseException]]]:
+    """Fit many models and/or datasets, sharing a budget of cores.
+
+    The chains of all the fits are scheduled on a shared pool of
+    ``max_cores`` processes, so that the machine stays busy without being
+    oversubscribed, and each worker process reuses the models it has already
+    loaded. Data are preprocessed and results summarized concurrently in
+    threads of this process.
+
+    Parameters
+    ----------
+    jobs
+        Fits to run, as dicts holding the model under ``'model'`` (its name,
+        e.g. ``'prl_ewa'``, or its function) and the arguments of the model
+        function (e.g., ``data``, ``niter``, ``nchain``). ``ncore`` is
+        ignored: chains are run by the shared pool.
+    max_cores
+        Number of cores to use. Defaults to -1, i.e., all the CPUs of the
+        machine.
+    return_exceptions
+        Whether to yield the exceptions raised by failed fits, instead of
+        raising them.
+
+    Yields
+    ------
+    index
+        Index of the job in ``jobs``.
+    model_data
+        The ``hbayesdm.TaskModel`` instance fitted for the job (or the
+        exception it raised, with ``return_exceptions``).
+
+    Examples
+    --------
+
+    .. code:: python
+
+        jobs = [dict(model=model, data=path, niter=2000, nwarmup=1000)
+                for model in ('prl_ewa', 'prl_fictitious')
+                for path in cohort_files]
+        for i, output in hbayesdm.fit_many(jobs, max_cores=32):
+            print(jobs[i]['model'], jobs[i]['data'], output.all_ind_pars)
+    """
+    jobs = [dict(job) for job in jobs]
+    for job in jobs:
+        if 'model' not in job:
+            raise RuntimeError('Each job should give its \'model\'.')
+        job['model'] = _model_function(job['model'])
+        job.pop('ncore', None)
+
+    scheduler = CoreScheduler(max_cores)
+
+    def run(job):
+        job = dict(job)
+        return job.pop('model')(scheduler=scheduler, **job)
+
+    # Jobs wait for cores most of the time; a few more threads than cores
+    # keep the pool busy while others preprocess data or summarize results.
+    threads = ThreadPoolExecutor(
+        max_workers=max(1, min(len(jobs), 2 * scheduler.max_cores)))
+    futures = {threads.submit(run, job): i for i, job in enumerate(jobs)}
+    try:
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                result = e
+            yield futures[future], result
+    finally:
+        for future in futures:
+            future.cancel()
+        threads.shutdown(wait=True)
+        scheduler.shutdown()
@@ -0,0 +1,726 @@
+"""Persistent, content-addressed cache of compiled Stan models.
+
+Compiled models are stored under a per-user cache directory (or the directory
+given by the ``HBAYESDM_CACHE_DIR`` environment variable), so that they
+survive reboots and clean-ups of the temporary directory. Each entry is keyed
+by a hash of everything that affects the compiled result: the Stan source,
+the files it ``#include``-s, the compiler flags and the PyStan version.
+The total size of the cache is bounded (``HBAYESDM_CACHE_SIZE``, in bytes or
+with a ``K``/``M``/``G`` suffix); when it grows beyond the bound, the least
+recently used entries are removed first.
+
+Within a process, loaded models are additionally memoized by
+:data:`registry`, so that the same model is never unpickled twice.
+"""
+import hashlib
+import json
+import os
+import pickle
+import re
+import shlex
+import subprocess
+import sys
+import sysconfig
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from typing import (Any, Callable, Dict, Iterable, List, Optional, Sequence,
+                    Tuple, Union)
+
+__all__ = ['FileLock', 'ModelCache', 'ModelRegistry', 'compiler_flags',
+           'compiler_version', 'default_cache_dir', 'file_hash', 'model_hash',
+           'registry', 'source_hashes']
+
+ENV_CACHE_DIR = 'HBAYESDM_CACHE_DIR'
+ENV_CACHE_SIZE = 'HBAYESDM_CACHE_SIZE'
+ENV_REGISTRY_SIZE = 'HBAYESDM_REGISTRY_SIZE'
+
+#: Default upper bound of the total size of the cache (4 GiB).
+DEFAULT_MAX_SIZE = 4 * 1024 ** 3
+
+#: Default number of loaded models held in memory by each process.
+DEFAULT_MAX_ENTRIES = 16
+
+_SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3,
+               'T': 1024 ** 4}
+_RE_SIZE = re.compile(r'^\s*(\d+(?:\.\d*)?)\s*([KMGT]?)(?:i?B)?\s*$', re.I)
+_RE_INCLUDE = re.compile(r'^\s*#include\s+[<"]?([^\s>"]+)[>"]?', re.M)
+
+# Environment variables honoured by the C++ toolchain used to build models
+_COMPILER_ENV = ('CC', 'CXX', 'CFLAGS', 'CXXFLAGS', 'CPPFLAGS', 'LDFLAGS')
+
+
+def default_cache_dir() -> Path:
+    """Return the directory used to cache compiled models.
+
+    The ``HBAYESDM_CACHE_DIR`` environment variable takes precedence.
+    Otherwise, the platform-specific per-user cache directory is used
+    (e.g., ``~/.cache/hbayesdm`` on Linux).
+
+    Returns
+    -------
+    Path
+        Path of the cache directory (which may not exist yet).
+    """
+    path = os.environ.get(ENV_CACHE_DIR)
+    if path:
+        return Path(path).expanduser()
+
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or \
+            str(Path.home() / 'AppData' / 'Local')
+        return Path(base) / 'hbayesdm' / 'Cache'
+    if sys.platform == 'darwin':
+        return Path.home() / 'Library' / 'Caches' / 'hbayesdm'
+    base = os.environ.get('XDG_CACHE_HOME') or str(Path.home() / '.cache')
+    return Path(base) / 'hbayesdm'
+
+
+def _parse_size(size: Union[int, str]) -> int:
+    """Parse a size given in bytes, or as a string like ``'512M'``."""
+    if isinstance(size, int):
+        return size
+    m = _RE_SIZE.match(size)
+    if not m:
+        raise ValueError('Invalid cache size: ' + repr(size))
+    return int(float(m.group(1)) * _SIZE_UNITS[m.group(2).upper()])
+
+
+def _included_files(path: Path, include_paths: Sequence[Path]) -> List[Path]:
+    """Collect files ``#include``-d by a Stan file, recursively."""
+    found = []  # type: List[Path]
+    pending = [path]
+    while pending:
+        with open(str(pending.pop()), 'r') as f:
+            code = f.read()
+        for name in _RE_INCLUDE.findall(code):
+            for base in include_paths:
+                candidate = (base / name.lstrip('/\\')).resolve()
+                if candidate.exists():
+                    break
+            else:
+                raise FileNotFoundError(
+                    'Cannot find the included Stan file: ' + name)
+            if candidate not in found:
+                found.append(candidate)
+                pending.append(candidate)
+    return found
+
+
+def compiler_flags(extra_compile_args: Sequence[str] = ()) -> List[str]:
+    """Return the compiler settings that affect a compiled model.
+
+    Parameters
+    ----------
+    extra_compile_args
+        Extra arguments passed to the compiler when building a model.
+
+    Returns
+    -------
+    List[str]
+        Compiler, flags from Python's build configuration and the environment,
+        and the extra arguments, in a stable order.
+    """
+    flags = ['%s=%s' % (var, sysconfig.get_config_var(var) or '')
+             for var in ('CC', 'CXX', 'CFLAGS')]
+    flags += ['$%s=%s' % (var, os.environ[var])
+              for var in _COMPILER_ENV if var in os.environ]
+    flags += list(extra_compile_args)
+    return flags
+
+
+@lru_cache(maxsize=None)
+def compiler_version() -> str:
+    """Return the version string of the C++ compiler building the models.
+
+    Returns
+    -------
+    str
+        First line of ``<compiler> --version``, or an empty string if the
+        compiler cannot be found.
+    """
+    cc = os.environ.get('CXX') or os.environ.get('CC') or \
+        sysconfig.get_config_var('CXX') or sysconfig.get_config_var('CC')
+    try:
+        out = subprocess.run(shlex.split(cc or '')[:1] + ['--version'],
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.DEVNULL,
+                             universal_newlines=True, timeout=10).stdout
+    except (OSError, ValueError, subprocess.SubprocessError):
+        return ''
+    return out.strip().split('\n')[0]
+
+
+def file_hash(path: Union[str, Path]) -> str:
+    """Return the hexadecimal SHA-256 digest of a file's content."""
+    h = hashlib.sha256()
+    with open(str(path), 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def source_hashes(model_path: Union[str, Path],
+                  include_paths: Sequence[Union[str, Path]] = ()) \
+        -> Dict[str, Any]:
+    """Hash a Stan file and the files it ``#include``-s.
+
+    Parameters
+    ----------
+    model_path
+        Path to the ``.stan`` file.
+    include_paths
+        Directories searched for ``#include``-d files.
+
+    Returns
+    -------
+    Dict
+        ``'source'``: digest of the Stan file, and ``'includes'``: digests of
+        the included files, keyed by their names.
+    """
+    model_path = Path(model_path).resolve()
+    include_paths = [Path(p) for p in include_paths] or [model_path.parent]
+    return {
+        'source': file_hash(model_path),
+        'includes': OrderedDict(
+            (path.name, file_hash(path))
+            for path in _included_files(model_path, include_paths)),
+    }
+
+
+def model_hash(model_path: Union[str, Path],
+               include_paths: Sequence[Union[str, Path]] = (),
+               flags: Iterable[str] = (),
+               version: str = '',
+               hashes: Optional[Dict[str, Any]] = None) -> str:
+    """Compute the content hash identifying a compiled Stan model.
+
+    Parameters
+    ----------
+    model_path
+        Path to the ``.stan`` file.
+    include_paths
+        Directories searched for ``#include``-d files.
+    flags
+        Compiler flags used to build the model.
+    version
+        Version of the Stan interface (e.g., PyStan) building the model.
+    hashes
+        Result of :func:`source_hashes`, if already computed.
+
+    Returns
+    -------
+    str
+        Hexadecimal SHA-256 digest.
+    """
+    if hashes is None:
+        hashes = source_hashes(model_path, include_paths)
+
+    h = hashlib.sha256()
+    h.update(b'version\0' + version.encode() + b'\0')
+    for flag in flags:
+        h.update(b'flag\0' + flag.encode() + b'\0')
+    h.update(b'file\0' + Path(model_path).name.encode() + b'\0')
+    h.update(bytes.fromhex(hashes['source']))
+    for name, digest in hashes['includes'].items():
+        h.update(b'file\0' + name.encode() + b'\0')
+        h.update(bytes.fromhex(digest))
+    return h.hexdigest()
+
+
+def _atomic_write(path: Path, data: bytes):
+    """Write a file atomically, through a temporary file in its directory."""
+    fd, tmp = tempfile.mkstemp(dir=str(path.parent),
+                               prefix='.' + path.name + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, str(path))
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class FileLock(object):
+    """Exclusive inter-process lock on a file.
+
+    The lock is released when the context exits, or when the process holding
+    it dies. After acquiring it, ``waited`` tells whether the lock was held by
+    another process in the meantime.
+
+    Parameters
+    ----------
+    path
+        Path of the lock file (created if it does not exist).
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.waited = False
+        self._fd = None  # type: Optional[int]
+
+    def acquire(self):
+        fd = os.open(str(self.path), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            self.waited = not _lock_file(fd, blocking=False)
+            if self.waited:
+                print('Waiting for another process to build:',
+                      self.path.with_suffix(''))
+                _lock_file(fd, blocking=True)
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+
+    def release(self):
+        if self._fd is not None:
+            _unlock_file(self._fd)
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self) -> 'FileLock':
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+if sys.platform == 'win32':
+    import msvcrt
+
+    def _lock_file(fd: int, blocking: bool) -> bool:
+        os.lseek(fd, 0, os.SEEK_SET)
+        while True:
+            try:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                return True
+            except OSError:
+                if not blocking:
+                    return False
+                time.sleep(0.1)
+
+    def _unlock_file(fd: int):
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _lock_file(fd: int, blocking: bool) -> bool:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            return True
+        except BlockingIOError:
+            return False
+
+    def _unlock_file(fd: int):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+class ModelCache(object):
+    """On-disk cache of compiled Stan models with LRU eviction.
+
+    Each entry consists of the pickled model (``<model>-<key>.pkl``) and a
+    small JSON manifest next to it (``<model>-<key>.json``) that records the
+    hashes of the sources, the versions of the tools used to build it, the
+    build time, and the size and checksum of the pickle. Entries are
+    validated with their manifests, before the pickle is ever read.
+    Files are written atomically, and concurrent builds of the same entry
+    are serialized with a lock file (``<model>-<key>.lock``), so the cache
+    can be shared by several processes.
+
+    Parameters
+    ----------
+    directory
+        Directory to store compiled models. Defaults to
+        :func:`default_cache_dir`.
+    max_size
+        Upper bound of the total size of the cache, in bytes or as a string
+        like ``'2G'``. Defaults to ``HBAYESDM_CACHE_SIZE``, or 4 GiB if unset.
+    """
+
+    suffix = '.pkl'
+    manifest_suffix = '.json'
+    lock_suffix = '.lock'
+
+    def __init__(self,
+                 directory: Union[str, Path, None] = None,
+                 max_size: Union[int, str, None] = None):
+        if directory is None:
+            directory = default_cache_dir()
+        if max_size is None:
+            max_size = os.environ.get(ENV_CACHE_SIZE, DEFAULT_MAX_SIZE)
+        self.__directory = Path(directory).expanduser()
+        self.__max_size = _parse_size(max_size)
+
+    @property
+    def directory(self) -> Path:
+        return self.__directory
+
+    @property
+    def max_size(self) -> int:
+        return self.__max_size
+
+    def path(self, model: str, key: str) -> Path:
+        """Return the path of the cache entry for a model and its hash."""
+        return self.directory / ('%s-%s%s' % (model, key, self.suffix))
+
+    def manifest_path(self, path: Path) -> Path:
+        """Return the path of the manifest of a cache entry."""
+        return path.with_suffix(self.manifest_suffix)
+
+    def read_manifest(self, path: Path) -> Optional[Dict[str, Any]]:
+        """Read the manifest of a cache entry.
+
+        Returns
+        -------
+        Dict
+            The manifest, or ``None`` if it is missing or unreadable.
+        """
+        try:
+            with open(str(self.manifest_path(path)), 'r') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return manifest if isinstance(manifest, dict) else None
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """List the entries in the cache, most recently used first.
+
+        Returns
+        -------
+        List[Dict]
+            Each item holds the ``path``, ``size`` (in bytes), the time it was
+            last used (``last_used``, in seconds since the epoch), and its
+            ``manifest`` (``None`` if missing).
+        """
+        if not self.directory.exists():
+            return []
+        entries = []
+        for path in self.directory.glob('*' + self.suffix):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append({'path': path, 'size': st.st_size,
+                            'last_used': st.st_mtime,
+                            'manifest': self.read_manifest(path)})
+        entries.sort(key=lambda e: e['last_used'], reverse=True)
+        return entries
+
+    def size(self) -> int:
+        """Return the total size of the cache in bytes."""
+        return sum(e['size'] for e in self.entries())
+
+    def check(self, path: Path,
+              expected: Optional[Dict[str, Any]] = None,
+              checksum: bool = False) -> str:
+        """Check a cache entry using its manifest, without loading it.
+
+        Parameters
+        ----------
+        path
+            Path of the cache entry.
+        expected
+            Values that the manifest should hold (e.g., the current hashes of
+            the sources). Entries that differ are reported as stale.
+        checksum
+            Whether to also compare the checksum of the pickle with the one
+            recorded in the manifest. This reads the whole pickle.
+
+        Returns
+        -------
+        str
+            ``'ok'``, ``'missing'`` (no such entry), ``'no-manifest'``,
+            ``'corrupt'`` (size or checksum mismatch), or ``'stale'``.
+        """
+        try:
+            size = path.stat().st_size
+        except FileNotFoundError:
+            return 'missing'
+        manifest = self.read_manifest(path)
+        if manifest is None:
+            return 'no-manifest'
+        if manifest.get('size') != size:
+            return 'corrupt'
+        for k, v in (expected or {}).items():
+            if manifest.get(k) != v:
+                return 'stale'
+        if checksum and manifest.get('sha256') != file_hash(path):
+            return 'corrupt'
+        return 'ok'
+
+    def load(self, model: str, key: str,
+             expected: Optional[Dict[str, Any]] = None) -> Optional[Any]:
+        """Load a cached object, marking it as recently used.
+
+        The entry is first validated with its manifest (see :meth:`check`);
+        an entry that is invalid, or cannot be unpickled, is removed from the
+        cache.
+
+        Returns
+        -------
+        Any
+            The cached object, or ``None`` if no valid entry exists.
+        """
+        path = self.path(model, key)
+        status = self.check(path, expected)
+        if status == 'missing':
+            return None
+        if status != 'ok':
+            print('Invalid cached StanModel (%s):' % status, path)
+            print('Remove the cached model...')
+            self.remove(path)
+            return None
+        try:
+            with open(str(path), 'rb') as f:
+                obj = pickle.load(f)
+        except Exception:
+            print('Invalid cached StanModel:', path)
+            print('Remove the cached model...')
+            self.remove(path)
+            return None
+        self._touch(path)
+        return obj
+
+    def store(self, model: str, key: str, obj: Any,
+              manifest: Optional[Dict[str, Any]] = None) -> Path:
+        """Store an object in the cache, then evict old entries if needed.
+
+        Parameters
+        ----------
+        model
+            Name of the model.
+        key
+            Content hash of the model.
+        obj
+            Object to store.
+        manifest
+            Additional information to record in the manifest of the entry.
+
+        Returns
+        -------
+        Path
+            Path of the stored entry.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.path(model, key)
+        data = pickle.dumps(obj)
+
+        manifest = OrderedDict(manifest or {})
+        manifest.update([
+            ('model', model),
+            ('key', key),
+            ('built', time.strftime('%Y-%m-%dT%H:%M:%S%z')),
+            ('size', len(data)),
+            ('sha256', hashlib.sha256(data).hexdigest()),
+        ])
+
+        # The manifest goes first: readers only consider an entry once its
+        # pickle exists, and each file appears atomically by renaming.
+        _atomic_write(self.manifest_path(path),
+                      json.dumps(manifest, indent=2).encode())
+        _atomic_write(path, data)
+
+        self.evict(keep=(path,))
+        return path
+
+    def lock(self, model: str, key: str) -> 'FileLock':
+        """Return an inter-process lock for a cache entry."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        return FileLock(self.path(model, key).with_suffix(self.lock_suffix))
+
+    def load_or_store(self, model: str, key: str,
+                      create: Callable[[], Any],
+                      expected: Optional[Dict[str, Any]] = None,
+                      manifest: Optional[Dict[str, Any]] = None) \
+            -> Tuple[Any, bool]:
+        """Load a cached object, or create and store it if not cached.
+
+        Creation is serialized with a per-entry lock, so that when several
+        processes miss the same entry at once, only one of them creates it
+        and the others wait for it and load its result.
+
+        Parameters
+        ----------
+        model
+            Name of the model.
+        key
+            Content hash of the model.
+        create
+            Function creating the object (e.g., compiling the model).
+        expected
+            Values that the manifest of a valid entry should hold.
+        manifest
+            Additional information to record in the manifest of a new entry.
+
+        Returns
+        -------
+        obj
+            The cached or newly created object.
+        created
+            Whether the object has been created by this call.
+        """
+        obj = self.load(model, key, expected)
+        if obj is not None:
+            return obj, False
+
+        with self.lock(model, key) as lock:
+            if lock.waited:
+                # Another process held the lock, and may have stored it
+                obj = self.load(model, key, expected)
+                if obj is not None:
+                    return obj, False
+            obj = create()
+            self.store(model, key, obj, manifest)
+        return obj, True
+
+    def evict(self, keep: Sequence[Path] = ()) -> List[Path]:
+        """Remove least recently used entries until the cache fits its bound.
+
+        Parameters
+        ----------
+        keep
+            Entries that should not be removed (e.g., the one just stored).
+
+        Returns
+        -------
+        List[Path]
+            Paths of the removed entries.
+        """
+        entries = self.entries()
+        total = sum(e['size'] for e in entries)
+        removed = []
+        for entry in reversed(entries):
+            if total <= self.max_size:
+                break
+            if entry['path'] in keep:
+                continue
+            self.remove(entry['path'])
+            total -= entry['size']
+            removed.append(entry['path'])
+        return removed
+
+    def remove(self, path: Path):
+        """Remove a single entry (and its manifest) from the cache."""
+        for p in (path, self.manifest_path(path)):
+            try:
+                os.remove(str(p))
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        """Remove all entries from the cache."""
+        for entry in self.entries():
+            self.remove(entry['path'])
+        # Remove manifests left without their entries
+        for path in self.directory.glob('*' + self.manifest_suffix):
+            if not path.with_suffix(self.suffix).exists():
+                os.remove(str(path))
+
+    @staticmethod
+    def _touch(path: Path):
+        # Access times are unreliable (e.g., `noatime` mounts), so the
+        # modification time records when an entry was last used.
+        try:
+            os.utime(str(path), None)
+        except OSError:
+            pass
+
+
+class ModelRegistry(object):
+    """Process-wide, thread-safe memo of loaded Stan models.
+
+    Models are keyed by their name and content hash, so that each compiled
+    model is loaded from the disk cache (and unpickled) at most once per
+    process. When more than ``max_entries`` models are held, the least
+    recently used one is dropped.
+
+    Parameters
+    ----------
+    max_entries
+        Maximum number of models to hold. Defaults to
+        ``HBAYESDM_REGISTRY_SIZE``, or 16 if unset.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None):
+        if max_entries is None:
+            max_entries = int(os.environ.get(ENV_REGISTRY_SIZE,
+                                             DEFAULT_MAX_ENTRIES))
+        self.__max_entries = max_entries
+        self.__models = OrderedDict()  # type: OrderedDict
+        self.__loading = {}  # type: Dict[Tuple[str, str], threading.Lock]
+        self.__lock = threading.Lock()
+
+    @property
+    def max_entries(self) -> int:
+        return self.__max_entries
+
+    @max_entries.setter
+    def max_entries(self, value: int):
+        with self.__lock:
+            self.__max_entries = value
+            self._shrink()
+
+    def __len__(self) -> int:
+        return len(self.__models)
+
+    def __contains__(self, item: Tuple[str, str]) -> bool:
+        return item in self.__models
+
+    def get(self, model: str, key: str) -> Optional[Any]:
+        """Return a registered model, or ``None`` if it is not registered."""
+        with self.__lock:
+            obj = self.__models.get((model, key))
+            if obj is not None:
+                self.__models.move_to_end((model, key))
+            return obj
+
+    def put(self, model: str, key: str, obj: Any):
+        """Register a loaded model."""
+        with self.__lock:
+            self.__models[(model, key)] = obj
+            self.__models.move_to_end((model, key))
+            self._shrink()
+
+    def get_or_load(self, model: str, key: str,
+                    loader: Callable[[], Any]) -> Any:
+        """Return a registered model, loading it with `loader` if needed.
+
+        Concurrent calls for the same model wait for a single load.
+        """
+        obj = self.get(model, key)
+        if obj is not None:
+            return obj
+
+        with self.__lock:
+            lock = self.__loading.setdefault((model, key), threading.Lock())
+        with lock:
+            obj = self.get(model, key)
+            if obj is None:
+                obj = loader()
+                self.put(model, key, obj)
+        with self.__lock:
+            self.__loading.pop((model, key), None)
+        return obj
+
+    def clear(self):
+        """Drop all registered models."""
+        with self.__lock:
+            self.__models.clear()
+
+    def _shrink(self):
+        while len(self.__models) > max(self.__max_entries, 0):
+            self.__models.popitem(last=False)
+
+
+#: Registry of the models loaded in the current process.
+registry = ModelRegistry()
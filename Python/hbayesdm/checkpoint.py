@@ -0,0 +1,135 @@
+"""Checkpoints of long-running fits, to resume them after an interruption.
+
+With a checkpoint, chains are run in blocks of iterations (as with
+``niter='auto'``). After each block, its draws are appended to a draw store
+(see :mod:`hbayesdm.store`; by default, the ``draws`` subdirectory of the
+checkpoint directory), and then the state of the chains is written
+(``state.json``): the step size, inverse metric and last draw of each chain,
+the seed of the random number generator, and the number of iterations and
+draws so far. A fit resumed from the checkpoint continues the same chains
+from there, so that at most one block of iterations is lost.
+"""
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Union
+
+from hbayesdm.backends import _to_json
+from hbayesdm.store import DrawStore
+from hbayesdm.warmstart import chains_from_json
+
+__all__ = ['Checkpoint', 'data_hash']
+
+_STATE = 'state.json'
+
+
+def data_hash(data: Dict[str, Any]) -> str:
+    """Hash the data passed to Stan, to check that a fit resumes on them."""
+    return hashlib.sha256(json.dumps(
+        _to_json(data), sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class Checkpoint(object):
+    """A checkpoint directory.
+
+    Parameters
+    ----------
+    path
+        Path of the directory, which is created if needed.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+
+    def exists(self) -> bool:
+        """Whether the directory holds a checkpoint."""
+        return (self.path / _STATE).exists()
+
+    def create(self, settings: Dict[str, Any], store: DrawStore):
+        """Start a new checkpoint for a fit.
+
+        Parameters
+        ----------
+        settings
+            Settings of the fit (model, data, parameters, chains, ...), which
+            a resumed fit should share.
+        store
+            Store where the draws of the fit are appended.
+        """
+        if self.exists():
+            raise RuntimeError(
+                'Checkpoint directory already in use: %s (use \'resume\' to '
+                'continue its fit).' % self.path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._settings = OrderedDict(settings)
+        self._store = store
+
+    def load(self, settings: Dict[str, Any]) -> Dict[str, Any]:
+        """Load the state of the chains, and the draws so far.
+
+        Parameters
+        ----------
+        settings
+            Settings of the resumed fit, which should match those the
+            checkpoint was created with.
+
+        Returns
+        -------
+        Dict
+            ``'iterations'`` (per chain, including warm-up), ``'seed'``,
+            ``'adaptation'`` of each chain, and ``'store'`` (the store of the
+            draws so far, without those of an interrupted block).
+        """
+        if not self.exists():
+            raise RuntimeError('No checkpoint found in: %s' % self.path)
+        with open(str(self.path / _STATE), 'r') as f:
+            state = json.load(f)
+        settings_json = _to_json(settings)
+        keys = list(settings_json) + [k for k in state['settings']
+                                      if k not in settings_json]
+        different = [k for k in keys
+                     if state['settings'].get(k) != settings_json.get(k)]
+        if different:
+            raise RuntimeError(
+                'Cannot resume from %s: the fit differs in %s.'
+                % (self.path, ', '.join(different)))
+        self._settings = OrderedDict(settings)
+        self._store = DrawStore(self.path / state['store'])
+        self._store.truncate(int(state['n_draws']))
+        return {'iterations': int(state['iterations']),
+                'seed': int(state['seed']),
+                'adaptation': chains_from_json(state['adaptation']),
+                'store': self._store}
+
+    def save(self, iterations: int, seed: int,
+             adaptation: List[Dict[str, Any]]):
+        """Write the state of the chains, once their draws are stored.
+
+        Parameters
+        ----------
+        iterations
+            Number of iterations run so far per chain, including warm-up.
+        seed
+            Seed of the random number generator of the fit.
+        adaptation
+            Step size, inverse metric and last draw of each chain.
+        """
+        store = self._store.path.resolve()
+        try:  # relative to the checkpoint, unless stored elsewhere
+            store = store.relative_to(self.path.resolve())
+        except ValueError:
+            pass
+        state = OrderedDict([
+            ('settings', self._settings),
+            ('iterations', iterations),
+            ('seed', seed),
+            ('store', str(store)),
+            ('n_draws', self._store.n_draws),
+            ('adaptation', adaptation),
+        ])
+        tmp = self.path / (_STATE + '.tmp')
+        with open(str(tmp), 'w') as f:
+            json.dump(_to_json(state), f)
+        os.replace(str(tmp), str(self.path / _STATE))
@@ -0,0 +1,198 @@
+"""Command-line interface of hBayesDM.
+
+.. code:: bash
+
+    hbayesdm precompile                      # compile all models
+    hbayesdm precompile prl_fictitious -j 4  # compile a subset of models
+    hbayesdm precompile --variant lean       # compile only lean variants
+    hbayesdm precompile --backend cmdstan    # compile CmdStan executables
+    hbayesdm cache ls                        # list compiled models
+    hbayesdm cache verify                    # check cached models
+    hbayesdm cache prune                     # remove stale/invalid models
+"""
+import argparse
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from hbayesdm.backends import BACKENDS
+from hbayesdm.variants import VARIANTS
+
+__all__ = ['main']
+
+
+def _precompile(args: argparse.Namespace) -> int:
+    from hbayesdm.compiler import precompile
+
+    status = precompile(models=args.models or None, jobs=args.jobs,
+                        force=args.force,
+                        variants=args.variants or ('full', 'lean'),
+                        backend=args.backend)
+    n_compiled = sum(s == 'compiled' for s in status.values())
+    print('%d model(s) compiled, %d already cached.'
+          % (n_compiled, len(status) - n_compiled))
+    return 0
+
+
+def _format_size(size: float) -> str:
+    for unit in ('B', 'K', 'M', 'G'):
+        if size < 1024 or unit == 'G':
+            break
+        size /= 1024
+    return ('%d%s' if unit == 'B' else '%.1f%s') % (size, unit)
+
+
+def _cache_status(checksum: bool = False) -> List[Dict[str, Any]]:
+    """Check all entries of the model cache against the current sources."""
+    from hbayesdm.backends import get_backend
+    from hbayesdm.base import stan_model_manifest
+    from hbayesdm.cache import ModelCache
+    from hbayesdm.compiler import available_models
+
+    cache = ModelCache()
+    models = set(available_models())
+    current = {}  # type: Dict[str, Any]
+
+    entries = cache.entries()
+    for entry in entries:
+        manifest = entry['manifest'] or {}
+        model = manifest.get('model') or entry['path'].stem.rsplit('-', 1)[0]
+        base, _, variant = model.partition('@')[0].partition('.')
+        backend = get_backend(manifest.get('backend', 'pystan'))
+        if base not in models or not backend.available():
+            # Models no longer shipped are stale, whatever their backend;
+            # those of backends missing here cannot be checked further
+            status = cache.check(entry['path'], None, checksum)
+            if status == 'ok' and base not in models:
+                status = 'stale'
+            entry.update(model=model, status=status)
+            continue
+        if model not in current:
+            current[model] = stan_model_manifest(
+                base, variant or None, backend)[2]
+        status = cache.check(entry['path'], current[model], checksum)
+        entry.update(model=model, status=status)
+    return entries
+
+
+def _cache_ls(args: argparse.Namespace) -> int:
+    from hbayesdm.cache import ModelCache
+
+    entries = _cache_status()
+    fmt = '{:<32} {:<12} {:>8} {:<19} {:<19} {}'
+    print('Cache directory:', ModelCache().directory)
+    print(fmt.format('MODEL', 'KEY', 'SIZE', 'BUILT', 'LAST USED', 'STATUS'))
+    for e in entries:
+        manifest = e['manifest'] or {}
+        print(fmt.format(
+            e['model'],
+            manifest.get('key', e['path'].stem.rsplit('-', 1)[-1])[:12],
+            _format_size(e['size']),
+            manifest.get('built', '-')[:19],
+            time.strftime('%Y-%m-%dT%H:%M:%S',
+                          time.localtime(e['last_used'])),
+            e['status']))
+    print('%d model(s), %s in total.'
+          % (len(entries), _format_size(sum(e['size'] for e in entries))))
+    return 0
+
+
+def _cache_verify(args: argparse.Namespace) -> int:
+    entries = _cache_status(checksum=True)
+    invalid = [e for e in entries if e['status'] != 'ok']
+    for e in invalid:
+        print('{:<11} {}'.format(e['status'], e['path']))
+    print('%d of %d model(s) valid.'
+          % (len(entries) - len(invalid), len(entries)))
+    return 1 if any(e['status'] in ('corrupt', 'no-manifest')
+                    for e in invalid) else 0
+
+
+def _cache_prune(args: argparse.Namespace) -> int:
+    from hbayesdm.cache import ModelCache
+
+    cache = ModelCache()
+    if args.all:
+        removed = [e['path'] for e in cache.entries()]
+        cache.clear()
+    else:
+        removed = [e['path'] for e in _cache_status(checksum=args.checksum)
+                   if e['status'] != 'ok']
+        for path in removed:
+            cache.remove(path)
+        removed += cache.evict()
+    for path in removed:
+        print('Removed', path)
+    print('%d model(s) removed.' % len(removed))
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Build the parser for command-line arguments."""
+    parser = argparse.ArgumentParser(
+        prog='hbayesdm',
+        description='Command-line tools for hBayesDM.')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    p = subparsers.add_parser(
+        'precompile',
+        help='Compile Stan models ahead of time into the model cache.')
+    p.add_argument(
+        'models', nargs='*', metavar='MODEL',
+        help='Model(s) to compile (e.g., prl_fictitious). '
+             'Defaults to all models.')
+    p.add_argument(
+        '-j', '--jobs', type=int, default=1,
+        help='Number of models to compile in parallel (-1 for all CPUs).')
+    p.add_argument(
+        '-f', '--force', action='store_true',
+        help='Recompile models even if they are already cached.')
+    p.add_argument(
+        '--variant', dest='variants', action='append',
+        metavar='VARIANT',
+        help='Variant of the models to compile (may be repeated): full, '
+             + ', '.join(sorted(VARIANTS)) + ', or a combination of them '
+             '(e.g., lean+threaded). Defaults to full and lean.')
+    p.add_argument(
+        '--backend', choices=list(BACKENDS),
+        help='Backend compiling the models. Defaults to the HBAYESDM_BACKEND '
+             'environment variable, or pystan.')
+    p.set_defaults(func=_precompile)
+
+    p = subparsers.add_parser(
+        'cache',
+        help='Inspect and clean up the cache of compiled models.')
+    cache_subparsers = p.add_subparsers(dest='cache_command')
+    cache_subparsers.required = True
+
+    p = cache_subparsers.add_parser(
+        'ls', help='List the cached models and their state.')
+    p.set_defaults(func=_cache_ls)
+
+    p = cache_subparsers.add_parser(
+        'verify',
+        help='Check the checksums of cached models against their manifests.')
+    p.set_defaults(func=_cache_verify)
+
+    p = cache_subparsers.add_parser(
+        'prune', help='Remove stale or invalid models from the cache.')
+    p.add_argument(
+        '--checksum', action='store_true',
+        help='Also remove models whose checksums do not match.')
+    p.add_argument(
+        '--all', action='store_true',
+        help='Remove all models from the cache.')
+    p.set_defaults(func=_cache_prune)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Entry point of the ``hbayesdm`` command."""
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except RuntimeError as e:
+        print('hbayesdm: error:', e, file=sys.stderr)
+        return 1
@@ -0,0 +1,134 @@
+"""Ahead-of-time compilation of the Stan models shipped with hBayesDM."""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from hbayesdm.backends import Backend, get_backend
+from hbayesdm.base import PATH_STAN, load_stan_model, stan_model_manifest
+from hbayesdm.cache import ModelCache
+from hbayesdm.variants import VARIANTS
+
+__all__ = ['available_models', 'precompile']
+
+
+def available_models() -> List[str]:
+    """List the names of all Stan models shipped with hBayesDM.
+
+    Returns
+    -------
+    List[str]
+        Model names (e.g., ``'prl_fictitious'``), in alphabetical order.
+    """
+    return sorted(path.stem for path in PATH_STAN.glob('*.stan'))
+
+
+def _compile(model: str, variant: Optional[str],
+             backend: str) -> Tuple[str, Optional[str]]:
+    """Compile a single model into the cache (run in a worker process)."""
+    load_stan_model(model, variant, backend)
+    return model, variant
+
+
+def precompile(models: Union[str, Sequence[str], None] = None,
+               jobs: int = 1,
+               force: bool = False,
+               variants: Union[str, Sequence[str]] = ('full', 'lean'),
+               backend: Union[str, Backend, None] = None) -> Dict[str, str]:
+    """Compile Stan models ahead of time and store them in the model cache.
+
+    Models already in the cache are skipped, so that the first call to each
+    model function does not pay for the compilation of its Stan program.
+
+    Parameters
+    ----------
+    models
+        Name(s) of the models to compile (e.g., ``'prl_fictitious'`` or
+        ``['igt_orl', 'igt_vpp']``). Defaults to all available models.
+    jobs
+        Number of models to compile in parallel. Defaults to 1.
+        Use -1 to use all the CPUs of the machine.
+    force
+        Whether to compile the models even if they are already cached.
+    variants
+        Variant(s) of the models to compile: ``'full'`` for the original
+        models (used when model-based regressors or posterior predictions
+        are requested), ``'lean'`` for the models only generating
+        ``log_lik`` and the ``mu_*`` parameters (used otherwise), and
+        ``'threaded'`` for the models using within-chain parallelism;
+        variants can be combined with ``+`` (e.g., ``'lean+threaded'``).
+        Defaults to ``'full'`` and ``'lean'``.
+    backend
+        Backend compiling the models: ``'pystan'`` or ``'cmdstan'``.
+        Defaults to the ``HBAYESDM_BACKEND`` environment variable, or
+        ``'pystan'``.
+
+    Returns
+    -------
+    Dict[str, str]
+        Status of each model: ``'cached'`` if all its variants were found in
+        the cache, or ``'compiled'`` if some have been compiled now.
+    """
+    if models is None:
+        models = available_models()
+    elif isinstance(models, str):
+        models = [models]
+
+    unknown = sorted(set(models).difference(available_models()))
+    if unknown:
+        raise RuntimeError(
+            'Unknown model(s) to compile: ' + ', '.join(unknown))
+
+    if isinstance(variants, str):
+        variants = [variants]
+    unknown = sorted(v for v in variants if v != 'full' and
+                     not set(v.split('+')) <= set(VARIANTS))
+    if unknown:
+        raise RuntimeError(
+            'Unknown model variant(s) to compile: ' + ', '.join(unknown))
+
+    backend = get_backend(backend)
+
+    local_cores = multiprocessing.cpu_count()
+    if jobs == -1 or jobs > local_cores:
+        jobs = local_cores
+
+    cache = ModelCache()
+    status = {model: 'cached' for model in models}
+    pending = []  # type: List[Tuple[str, Optional[str]]]
+    names = set()
+    for model in models:
+        for variant in variants:
+            variant = None if variant == 'full' else variant
+            name, key, manifest = stan_model_manifest(model, variant, backend)
+            if name in names:
+                continue  # the same program as another variant
+            names.add(name)
+
+            path = cache.path(name, key)
+            if force or cache.check(path, manifest) != 'ok':
+                if force:
+                    cache.remove(path)
+                pending.append((model, variant))
+
+    def _label(model, variant):
+        return model if variant is None else model + ' (%s)' % variant
+
+    if len(pending) == 1 or jobs == 1:
+        for i, (model, variant) in enumerate(pending):
+            _compile(model, variant, backend.name)
+            status[model] = 'compiled'
+            print('[%d / %d] Compiled %s'
+                  % (i + 1, len(pending), _label(model, variant)))
+    elif pending:
+        print('Compiling %d model(s) with %d job(s)...'
+              % (len(pending), min(jobs, len(pending))))
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(_compile, *p, backend.name)
+                       for p in pending]
+            for i, future in enumerate(as_completed(futures)):
+                model, variant = future.result()
+                status[model] = 'compiled'
+                print('[%d / %d] Compiled %s'
+                      % (i + 1, len(pending), _label(model, variant)))
+
+    return status
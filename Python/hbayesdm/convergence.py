@@ -0,0 +1,100 @@
+"""Convergence-driven sampling length (``niter='auto'``).
+
+Chains are run in blocks of iterations: the first block includes the
+warm-up, and the following ones resume each chain from its last draw with the
+step size and inverse metric adapted during the warm-up. After each block,
+the rank-normalized R-hat and the bulk and tail effective sample sizes
+(ESS) of the tracked parameters are computed on all the draws so far, and
+sampling stops once they meet the targets, or when the cap on iterations is
+reached.
+"""
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence
+
+import arviz as az
+import numpy as np
+
+__all__ = ['AUTO_CONTROL', 'check_auto_control', 'convergence_stats',
+           'is_converged']
+
+#: Default targets and limits of ``niter='auto'``.
+AUTO_CONTROL = OrderedDict([
+    ('rhat', 1.01),       # maximum rank-normalized R-hat
+    ('ess_bulk', 400),    # minimum bulk ESS (over all chains)
+    ('ess_tail', 400),    # minimum tail ESS (over all chains)
+    ('block', 500),       # iterations per block, after warm-up
+    ('max_iter', 10000),  # maximum iterations per chain, including warm-up
+])
+
+
+def check_auto_control(auto_control: Optional[Dict[str, Any]]) \
+        -> 'OrderedDict[str, Any]':
+    """Fill in the defaults of ``auto_control``, and check its values.
+
+    Parameters
+    ----------
+    auto_control
+        Targets and limits given by user (see :data:`AUTO_CONTROL`).
+
+    Returns
+    -------
+    OrderedDict
+        Targets and limits to use.
+    """
+    control = OrderedDict(AUTO_CONTROL)
+    unknown = sorted(set(auto_control or {}).difference(control))
+    if unknown:
+        raise RuntimeError(
+            'Unknown key(s) in \'auto_control\': ' + ', '.join(unknown) +
+            ' (available: ' + ', '.join(control) + ')')
+    control.update(auto_control or {})
+    if control['rhat'] <= 1:
+        raise RuntimeError('\'auto_control[\'rhat\']\' should be above 1.')
+    for key in ('ess_bulk', 'ess_tail', 'block', 'max_iter'):
+        if control[key] <= 0:
+            raise RuntimeError(
+                '\'auto_control[\'%s\']\' should be positive.' % key)
+    return control
+
+
+def convergence_stats(data: az.InferenceData,
+                      var_names: Sequence[str]) -> 'OrderedDict[str, float]':
+    """Compute the worst convergence statistics over the tracked parameters.
+
+    Parameters
+    ----------
+    data
+        Draws of all chains so far.
+    var_names
+        Parameters to track; those missing from the draws are ignored.
+
+    Returns
+    -------
+    OrderedDict
+        Maximum rank-normalized R-hat (``'rhat'``), and minimum bulk and tail
+        ESS (``'ess_bulk'``, ``'ess_tail'``). Elements whose statistics are
+        undefined (e.g., constant values) are ignored.
+    """
+    names = [v for v in var_names if v in data.posterior.data_vars]
+
+    def worst(dataset, reduce):
+        values = np.concatenate(
+            [np.ravel(dataset[v].values) for v in names] or [[np.nan]])
+        values = values[np.isfinite(values)]
+        return float(reduce(values)) if values.size else np.nan
+
+    return OrderedDict([
+        ('rhat', worst(az.rhat(data, var_names=names, method='rank'),
+                       np.max)),
+        ('ess_bulk', worst(az.ess(data, var_names=names, method='bulk'),
+                           np.min)),
+        ('ess_tail', worst(az.ess(data, var_names=names, method='tail'),
+                           np.min)),
+    ])
+
+
+def is_converged(stats: Dict[str, float], control: Dict[str, Any]) -> bool:
+    """Whether the convergence statistics meet the targets of ``control``."""
+    return bool(stats['rhat'] <= control['rhat'] and
+                stats['ess_bulk'] >= control['ess_bulk'] and
+                stats['ess_tail'] >= control['ess_tail'])
@@ -5,6 +5,7 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import arviz as az
 
+from hbayesdm.backends import to_inference_data
 from hbayesdm.base import TaskModel
 
 __all__ = ['rhat', 'print_fit', 'hdi', 'plot_hdi', 'extract_ic']
@@ -31,7 +32,7 @@ def rhat(model_data: TaskModel,
         Or if `less` was specified, the dictionary values will hold `True` if
         all Rhat values (of that parameter) are less than or equal to `less`.
     """
-    rhat_data = az.rhat(model_data.fit)
+    rhat_data = az.rhat(to_inference_data(model_data.fit))
     if less is None:
         return {v.name: v.values.tolist()
                 for v in rhat_data.data_vars.values()}
@@ -61,7 +62,7 @@ def print_fit(*args: TaskModel, ic: str = 'looic') -> pd.DataFrame:
             'Information Criterion (ic) must be one of ' + repr(ic_options))
     dataset_dict = {
         model_data.model:
-            az.from_pystan(model_data.fit, log_likelihood='log_lik')
+            to_inference_data(model_data.fit, log_likelihood='log_lik')
         for model_data in args
     }
 
@@ -163,7 +164,7 @@ def extract_ic(model_data: TaskModel,
         raise RuntimeError(
             'Information Criterion (ic) must be one of ' + repr(ic_options))
 
-    dat = az.from_pystan(model_data.fit, log_likelihood='log_lik')
+    dat = to_inference_data(model_data.fit, log_likelihood='log_lik')
 
     ret = {}
 
@@ -1,4 +1,4 @@
-from typing import Sequence, Union, Any
+from typing import Dict, Optional, Sequence, Union, Any
 from collections import OrderedDict
 
 from numpy import Inf, exp
@@ -51,7 +51,7 @@ class AltDelta(TaskModel):
 
 def alt_delta(
         data: Union[pd.DataFrame, str, None] = None,
-        niter: int = 4000,
+        niter: Union[int, str] = 4000,
         nwarmup: int = 1000,
         nchain: int = 4,
         ncore: int = 1,
@@ -64,6 +64,19 @@ def alt_delta(
         adapt_delta: float = 0.95,
         stepsize: float = 1,
         max_treedepth: int = 10,
+        threads_per_chain: int = 1,
+        backend: Optional[str] = None,
+        auto_control: Optional[Dict[str, float]] = None,
+        adaptation_from: Union[TaskModel, str, None] = None,
+        checkpoint: Optional[str] = None,
+        checkpoint_every: int = 500,
+        resume: Optional[str] = None,
+        draws_dir: Optional[str] = None,
+        regressor_summary: Optional[Sequence[str]] = None,
+        postpred_summary: Union[bool, Sequence[str]] = False,
+        gq_thin: int = 1,
+        precision: str = 'full',
+        compress: bool = False,
         **additional_args: Any) -> TaskModel:
     """Aversive Learning Task - Rescorla-Wagner (Delta) Model
 
@@ -125,6 +138,8 @@ def alt_delta(
         Data columns should be labeled as: "subjID", "choice", "outcome", "bluePunish", "orangePunish".
     niter
         Number of iterations, including warm-up. Defaults to 4000.
+        Use ``'auto'`` to sample in blocks until the group-level parameters and
+        ``log_lik`` have converged (see ``auto_control``).
     nwarmup
         Number of iterations used for warm-up only. Defaults to 1000.
 
@@ -184,6 +199,86 @@ def alt_delta(
     max_treedepth
         Integer value specifying how many leapfrog steps the MCMC sampler can take
         on each new iteration. See note below.
+    threads_per_chain
+        Number of threads used within each chain to compute the likelihood of
+        subjects in parallel. Defaults to 1. Values above 1 require a Stan
+        backend with threading support (Stan 2.26 or later), and are not
+        available for single-subject models nor for ``choiceRT_lba`` and
+        ``task2AFC_sdt``.
+    backend
+        Stan backend to use: ``'pystan'`` or ``'cmdstan'``. Defaults to the
+        ``HBAYESDM_BACKEND`` environment variable, or ``'pystan'``.
+    auto_control
+        Targets and limits of ``niter='auto'``, as a dict with the keys:
+        ``'rhat'`` (maximum rank-normalized R-hat, defaults to 1.01),
+        ``'ess_bulk'`` and ``'ess_tail'`` (minimum bulk and tail effective
+        sample sizes, default to 400), ``'block'`` (iterations per block after
+        warm-up, defaults to 500), and ``'max_iter'`` (maximum iterations per
+        chain, including warm-up, defaults to 10000).
+    adaptation_from
+        A model previously fitted with MCMC (see ``adaptation``), or the path
+        of a file written by its ``save_adaptation`` method. Chains start from
+        the step size, inverse metric and last draws of the previous fit,
+        which allows a much shorter warm-up (``nwarmup``, which can even be
+        0). The previous fit should be of the same model, on data of the same
+        dimensions (e.g., the same number of subjects); otherwise it is
+        ignored with a warning. Not available with ``vb`` or ``resume``.
+    checkpoint
+        Path of a directory where to write checkpoints while sampling, to
+        resume the fit if it is interrupted (see ``resume``). Chains are then
+        run in blocks of ``checkpoint_every`` iterations, after each of which
+        the draws so far and the state of the chains are written.
+    checkpoint_every
+        Number of iterations per chain between checkpoints (or between writes
+        to ``draws_dir``). Defaults to 500. The first checkpoint is written
+        after the warm-up and as many iterations. With ``niter='auto'``,
+        checkpoints are written after each block instead.
+    resume
+        Path of a checkpoint directory, to continue its fit from the last
+        checkpoint. The model, data, and sampling arguments should be the same,
+        except for ``niter`` which can be increased to draw more samples.
+        Checkpoints keep being written in the same directory.
+    draws_dir
+        Path of a directory where to write the draws while sampling, instead of
+        keeping them in memory. Chains are then run in blocks of
+        ``checkpoint_every`` iterations, whose draws are appended to the
+        directory, and ``par_vals`` holds read-only arrays memory-mapped from
+        it, so that memory use does not grow with the number of draws.
+    regressor_summary
+        Statistics of the draws of the model-based regressors to compute for
+        each trial (with ``model_regressor=True``), e.g.,
+        ``['mean', 'sd', 'q2.5', 'q97.5', 'hdi95']``. Draws are summarized in
+        chunks as they are read, chain by chain: means and standard deviations
+        are exact, and quantiles and HDIs are approximated (within a small
+        fraction of the range of the draws) when there are too many draws to
+        keep in memory.
+    postpred_summary
+        Whether to summarize the posterior predictions (with
+        ``inc_postpred=True``) while reading their draws, chain by chain: the
+        mean of each trial, the proportion of each predicted choice per
+        subject, and the other statistics given as a list (e.g.,
+        ``['q2.5', 'q97.5']``; see ``regressor_summary``). Defaults to
+        ``False``. The full predictions are then only read from the fit if
+        accessed in ``par_vals``.
+    gq_thin
+        Keep the generated quantities (``log_lik``, model-based regressors and
+        posterior predictions) of every ``gq_thin``-th draw only, while the
+        parameters keep all draws (after ``nthin``). Defaults to 1. Chains are
+        sampled without these quantities, which are computed afterwards on the
+        kept draws only; this requires the CmdStan backend.
+    precision
+        Precision of the draws kept in memory or written to disk: ``'full'``
+        (default) keeps all of them in double precision; ``'compact'`` keeps
+        the parameters in double precision, the model-based regressors in
+        single precision, and the posterior predictions of choices as 8-bit
+        integers (or in single precision, e.g., for response times). In
+        ``par_vals``, posterior predictions are then NumPy masked arrays,
+        whose missing trials are masked.
+    compress
+        Whether to compress the draws written to ``draws_dir`` or to a
+        checkpoint directory (block by block, with zlib). Defaults to
+        ``False``. Compressed draws are decompressed when read, instead of
+        being memory-mapped.
     **additional_args
         Not used for this model.
 
@@ -195,10 +290,18 @@ def alt_delta(
         - ``model``: String value that is the name of the model ('alt_delta').
         - ``all_ind_pars``: Pandas DataFrame containing the summarized parameter values
           (as specified by ``ind_pars``) for each subject.
-        - ``par_vals``: OrderedDict holding the posterior samples over different parameters.
-        - ``fit``: A PyStan StanFit object that contains the fitted Stan model.
+        - ``par_vals``: Read-only mapping holding the posterior samples over
+          different parameters, which are extracted from the fit when first
+          used (its ``release()`` method frees them from memory).
+        - ``fit``: The fitted Stan model (a PyStan StanFit object, or a
+          ``DrawsFit`` object with the CmdStan backend, ``niter='auto'`` or
+          ``gq_thin``).
         - ``raw_data``: Pandas DataFrame containing the raw data used to fit the model,
           as specified by the user.
+        - ``adaptation``: Step size, inverse metric and last draw of each
+          chain, to warm-start later fits (see ``adaptation_from``).
+        - ``postpred_summary``: Dict holding the summaries of each posterior
+          prediction requested with ``postpred_summary``.
         
 
     Examples
@@ -239,4 +342,17 @@ def alt_delta(
         adapt_delta=adapt_delta,
         stepsize=stepsize,
         max_treedepth=max_treedepth,
+        threads_per_chain=threads_per_chain,
+        backend=backend,
+        auto_control=auto_control,
+        adaptation_from=adaptation_from,
+        checkpoint=checkpoint,
+        checkpoint_every=checkpoint_every,
+        resume=resume,
+        draws_dir=draws_dir,
+        regressor_summary=regressor_summary,
+        postpred_summary=postpred_summary,
+        gq_thin=gq_thin,
+        precision=precision,
+        compress=compress,
         **additional_args)
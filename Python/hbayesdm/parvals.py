@@ -0,0 +1,95 @@
+"""Draws of the parameters of a fit, extracted on first use."""
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Iterator, Optional, Sequence
+
+import numpy as np
+
+from hbayesdm.backends import Backend
+
+__all__ = ['ParVals']
+
+
+class ParVals(Mapping):
+    """Read-only mapping of the draws of each parameter of a fit.
+
+    Keys are those of the ``extract`` method of the fit (parameters and
+    ``lp__``) but for ``exclude``, and values are read-only NumPy arrays of
+    the draws of all chains, of shape ``(n_draws, *dims)``. The draws of a
+    parameter are only extracted from the fit when first used, and kept until
+    :meth:`release`.
+
+    Parameters
+    ----------
+    fit
+        Fitted result of sampling the stan model.
+    backend
+        Backend the fit comes from.
+    transforms
+        Functions to apply to the draws of some parameters once extracted
+        (e.g., to replace the ``-1`` of missing posterior predictions).
+    exclude
+        Parameters of the fit to leave out (e.g., raw parameters only sampled
+        to initialize later fits).
+    """
+
+    def __init__(self, fit: Any, backend: Backend,
+                 transforms: Optional[Dict[str, Callable]] = None,
+                 exclude: Sequence[str] = ()):
+        self._fit = fit
+        self._backend = backend
+        self._names = [n for n in backend.par_names(fit) if n not in exclude]
+        self._transforms = transforms or {}
+        self._cache = OrderedDict()  # type: OrderedDict
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        values = self._cache.get(name)
+        if values is None:
+            if name not in self._names:
+                raise KeyError(name)
+            values = self._backend.extract(self._fit, [name])[name]
+            if name in self._transforms:
+                values = self._transforms[name](values)
+            values = values.view()
+            values.flags.writeable = False
+            self._cache[name] = values
+        return values
+
+    def __contains__(self, name: Any) -> bool:
+        return name in self._names
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._names)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def __repr__(self) -> str:
+        return 'ParVals(%r)' % self._names
+
+    def iter_draws(self, name: str, chunk_size: Optional[int] = None) \
+            -> Iterator[np.ndarray]:
+        """Iterate over the draws of a parameter in chunks of at most
+        ``chunk_size`` draws (see :meth:`Backend.iter_draws`), without
+        keeping them in memory (unless they already are).
+        """
+        if name not in self._names:
+            raise KeyError(name)
+        values = self._cache.get(name)
+        if values is not None:
+            chunk_size = chunk_size or max(len(values), 1)
+            chunks = (values[i:i + chunk_size]
+                      for i in range(0, len(values), chunk_size))
+        else:
+            chunks = self._backend.iter_draws(self._fit, name, chunk_size)
+        transform = self._transforms.get(name) if values is None else None
+        for chunk in chunks:
+            yield transform(chunk) if transform is not None else chunk
+
+    def release(self, *names: str):
+        """Drop the draws kept in memory, of all parameters or of ``names``.
+
+        They are extracted again from the fit when used.
+        """
+        for name in names or list(self._cache):
+            self._cache.pop(name, None)
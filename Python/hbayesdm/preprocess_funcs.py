@@ -1,4 +1,7 @@
 import os
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, Tuple
 
 import numpy as np
 import pandas as pd
@@ -6,40 +9,108 @@ import pandas as pd
 from hbayesdm.base import PATH_COMMON
 
 
-def alt_preprocess_func(self, raw_data, general_info, additional_args):
-    # Iterate through grouped_data
-    subj_group = iter(general_info['grouped_data'])
+def _cumcount(codes: np.ndarray) -> np.ndarray:
+    """Number of previous rows of the same group, for each row."""
+    counts = np.bincount(codes)
+    order = np.argsort(codes, kind='stable')
+    count = np.empty(len(codes), dtype=int)
+    count[order] = np.arange(len(codes)) - np.repeat(
+        np.cumsum(counts) - counts, counts)
+    return count
+
+
+def trial_index(general_info: Dict) -> Tuple[np.ndarray, ...]:
+    """Position of each trial (row of the raw data) in padded data arrays.
+
+    Rows are grouped as in ``general_info['grouped_data']``: subjects (and
+    their blocks) in order of appearance, and the trials of each in the order
+    of the rows.
+
+    Parameters
+    ----------
+    general_info
+        General information about the raw data (see
+        ``TaskModel._prepare_general_info``).
+
+    Returns
+    -------
+    Tuple[np.ndarray, ...]
+        Subject, block (for models with blocks) and trial of each row, to
+        index arrays of shape ``(n_subj, [b_max,] t_max)``.
+    """
+    grouped_data = general_info['grouped_data']
+    group = grouped_data.ngroup().to_numpy()
+    trial = _cumcount(group)
+    if general_info['b_subjs'] is None:
+        return group, trial
+
+    # Groups are (subject, block) pairs, numbered in order of appearance
+    subj = pd.factorize(grouped_data.obj['subjid'])[0]
+    group_subj = np.empty(group.max() + 1, dtype=int)
+    group_subj[group] = subj
+    return subj, _cumcount(group_subj)[group], trial
+
+
+def pad_trials(general_info: Dict,
+               columns: Dict[str, Tuple[Any, type, Any]]) \
+        -> 'OrderedDict[str, np.ndarray]':
+    """Write the values of each trial to padded data arrays.
+
+    All the values are scattered at once to the positions given by
+    :func:`trial_index`, instead of subject by subject.
+
+    Parameters
+    ----------
+    general_info
+        General information about the raw data (see
+        ``TaskModel._prepare_general_info``).
+    columns
+        For each array to write, the values of each row of the raw data (a
+        column, or values computed from columns), the dtype of the array,
+        and the value of the padding (trials a subject does not have).
+        Values of shape ``(n_rows, ...)`` give arrays with the same trailing
+        dimensions.
+
+    Returns
+    -------
+    OrderedDict[str, np.ndarray]
+        Arrays of shape ``(n_subj, [b_max,] t_max, ...)``, by name.
+    """
+    index = trial_index(general_info)
+    shape = (general_info['n_subj'],) + \
+        ((general_info['b_max'],) if len(index) == 3 else ()) + \
+        (general_info['t_max'],)
+    flat = np.ravel_multi_index(index, shape)
+    data_arrays = OrderedDict()  # type: OrderedDict
+    for name, (values, dtype, fill) in columns.items():
+        values = np.asarray(values)
+        array = np.full(shape + values.shape[1:], fill, dtype=dtype)
+        array.reshape((-1,) + values.shape[1:])[flat] = values
+        data_arrays[name] = array
+    return data_arrays
+
 
+def alt_preprocess_func(self, raw_data, general_info, additional_args):
     # Use general_info(s) about raw_data
     # subjs = general_info['subjs']
     n_subj = general_info['n_subj']
     t_subjs = general_info['t_subjs']
     t_max = general_info['t_max']
 
-    # Initialize (model-specific) data arrays
-    choice = np.full((n_subj, t_max), -1, dtype=int)
-    outcome = np.full((n_subj, t_max), 0, dtype=float)
-    blue_punish = np.full((n_subj, t_max), 0, dtype=float)
-    orange_punish = np.full((n_subj, t_max), 0, dtype=float)
-
-    # Write from subj_data to the data arrays
-    for s in range(n_subj):
-        _, subj_data = next(subj_group)
-        t = t_subjs[s]
-        choice[s][:t] = subj_data['choice']
-        outcome[s][:t] = subj_data['outcome']
-        blue_punish[s][:t] = subj_data['bluepunish']
-        orange_punish[s][:t] = subj_data['orangepunish']
+    # Write the data of each trial to (model-specific) padded data arrays
+    data_arrays = pad_trials(general_info, {
+        'choice': (raw_data['choice'], int, -1),
+        'outcome': (raw_data['outcome'], float, 0),
+        'bluePunish': (raw_data['bluepunish'], float, 0),
+        'orangePunish': (raw_data['orangepunish'], float, 0),
+    })
 
     # Wrap into a dict for pystan
     data_dict = {
         'N': n_subj,
         'T': t_max,
         'Tsubj': t_subjs,
-        'choice': choice,
-        'outcome': outcome,
-        'bluePunish': blue_punish,
-        'orangePunish': orange_punish,
+        **data_arrays,
     }
 
     # Returned data_dict will directly be passed to pystan
@@ -47,42 +118,30 @@ def alt_preprocess_func(self, raw_data, general_info, additional_args):
 
 
 def bandit2arm_preprocess_func(self, raw_data, general_info, additional_args):
-    # Iterate through grouped_data
-    subj_group = iter(general_info['grouped_data'])
-
     # Use general_info(s) about raw_data
     # subjs = general_info['subjs']
     n_subj = general_info['n_subj']
     t_subjs = general_info['t_subjs']
     t_max = general_info['t_max']
 
-    # Initialize (model-specific) data arrays
-    choice = np.full((n_subj, t_max), -1, dtype=int)
-    outcome = np.full((n_subj, t_max), 0, dtype=float)
-
-    # Write from subj_data to the data arrays
-    for s in range(n_subj):
-        _, subj_data = next(subj_group)
-        t = t_subjs[s]
-        choice[s][:t] = subj_data['choice']
-        outcome[s][:t] = subj_data['outcome']
+    # Write the data of each trial to (model-specific) padded data arrays
+    data_arrays = pad_trials(general_info, {
+        'choice': (raw_data['choice'], int, -1),
+        'outcome': (raw_data['outcome'], float, 0),
+    })
 
     # Wrap into a dict for pystan
     data_dict = {
         'N': n_subj,
         'T': t_max,
         'Tsubj': t_subjs,
-        'choice': choice,
-        'outcome': outcome,
+        **data_arrays,
     }
 
     # Returned data_dict will directly be passed to pystan
     return data_dict
 
 def banditNarm_preprocess_func(self, raw_data, general_info, additional_args):
-    # Iterate through grouped_data
-    subj_group = iter(general_info['grouped_data'])
-
     # Use general_info(s) about raw_data
     # subjs = general_info['subjs']
     n_subj = general_info['n_subj']
@@ -96,27 +155,19 @@ def banditNarm_preprocess_func(self, raw_data, general_info, additional_args):
     if n_arm_arg is not None:
         n_arm = n_arm_arg
 
-    # Initialize (model-specific) data arrays
-    rew = np.full((n_subj, t_max), 0, dtype=float)
-    los = np.full((n_subj, t_max), 0, dtype=float)
-    choice = np.full((n_subj, t_max), -1, dtype=int)
-
-    # Write from subj_data to the data arrays
-    for s in range(n_subj):
-        _, subj_data = next(subj_group)
-        t = t_subjs[s]
-        rew[s][:t] = subj_data['gain']
-        los[s][:t] = -1 * np.abs(subj_data['loss'])  # Use abs
-        choice[s][:t] = subj_data['choice']
+    # Write the data of each trial to (model-specific) padded data arrays
+    data_arrays = pad_trials(general_info, {
+        'rew': (raw_data['gain'], float, 0),
+        'los': (-1 * np.abs(raw_data['loss']), float, 0),  # Use abs
+        'choice': (raw_data['choice'], int, -1),
+    })
 
     # Wrap into a dict for pystan
     data_dict = {
         'N': n_subj,
         'T': t_max,
         'Tsubj': t_subjs,
-        'rew': rew,
-        'los': los,
-        'choice': choice,
+        **data_arrays,
         'Narm': n_arm,
     }
 
@@ -125,36 +176,25 @@ def banditNarm_preprocess_func(self, raw_data, general_info, additional_args):
 
 
 def bandit4arm_preprocess_func(self, raw_data, general_info, additional_args):
-    # Iterate through grouped_data
-    subj_group = iter(general_info['grouped_data'])
-
     # Use general_info(s) about raw_data
     # subjs = general_info['subjs']
     n_subj = general_info['n_subj']
     t_subjs = general_info['t_subjs']
     t_max = general_info['t_max']
 
-    # Initialize (model-specific) data arrays
-    rew = np.full((n_subj, t_max), 0, dtype=float)
-    los = np.full((n_subj, t_max), 0, dtype=float)
-    choice = np.full((n_subj, t_max), -1, dtype=int)
-
-    # Write from subj_data to the data arrays
-    for s in range(n_subj):
-        _, subj_data = next(subj_group)
-        t = t_subjs[s]
-        rew[s][:t] = subj_data['gain']
-        los[s][:t] = -1 * np.abs(subj_data['loss'])  # Use abs
-        choice[s][:t] = subj_data['choice']
+    # Write the data of each trial to (model-specific) padded data arrays
+    data_arrays = pad_trials(general_info, {
+        'rew': (raw_data['gain'], float, 0),
+        'los': (-1 * np.abs(raw_data['loss']), float, 0),  # Use abs
+        'choice': (raw_data['choice'], int, -1),
+    })
 
     # Wrap into a dict for pystan
     data_dict = {
         'N': n_subj,
         'T': t_max,
         'Tsubj': t_subjs,
-        'rew': rew,
-        'los': los,
-        'choice': choice,
+        **data_arrays,
     }
 
     # Returned data_dict will directly be passed to pystan
@@ -162,33 +202,24 @@ def bandit4arm_preprocess_func(self, raw_data, general_info, additional_args):
 
 
 def bandit4arm2_preprocess_func(self, raw_data, general_info, additional_args):
-    # Iterate through grouped_data
-    subj_group = iter(general_info['grouped_data'])
-
     # Use general_info(s) about raw_data
     # subjs = general_info['subjs']
     n_subj = general_info['n_subj']
     t_subjs = general_info['t_subjs']
     t_max = general_info['t_max']
 
-    # Initialize (model-specific) data arrays
-    choice = np.full((n_subj, t_max), -1, dtype=int)
-    outcome = np.full((n_subj, t_max), 0, dtype=float)
-
-    # Write from subj_data to the data arrays
-    for s in range(n_subj):
-        _, subj_data = next(subj_group)
-        t = t_subjs[s]
-        choice[s][:t] = subj_data['choice']
-        outcome[s][:t] = subj_data['outcome']
+    # Write the data of each trial to (model-specific) padded data arrays
+    data_arrays = pad_trials(general_info, {
+        'choice': (raw_data['choice'], int, -1),
+        'outcome': (raw_data['outcome'], float, 0),
+    })
 
     # Wrap into a dict for pystan
     data_dict = {
         'N': n_subj,
         'T': t_max,
         'Tsubj': t_subjs,
-        'choice': choice,
-        'outcome': outcome,
+        **data_arrays,
     }
 
     # Returned data_dict will directly be passed to pystan
@@ -196,34 +227,25 @@ def bandit4arm2_preprocess_func(self, raw_data, general_info, additional_args):
 
 
 def bart_preprocess_func(self, raw_data, general_info, additional_args):
-    # Iterate through grouped_data
-    subj_group = iter(general_info['grouped_data'])
-
     # Use general_info(s) about raw_data
     # subjs = general_info['subjs']
     n_subj = general_info['n_subj']
     t_subjs = general_info['t_subjs']
     t_max = general_info['t_max']
 
-    # Initialize (model-specific) data arrays
-    pumps = np.full((n_subj, t_max), 0, dtype=int)
-    explosion = np.full((n_subj, t_max), 0, dtype=int)
-
-    # Write from subj_data to the data arrays
-    for s in range(n_subj):
-        _, subj_data = next(subj_group)
-        t = t_subjs[s]
-        pumps[s][:t] = subj_data['pumps']
-        explosion[s][:t] = subj_data['explosion']
+    # Write the data of each trial to (model-specific) padded data arrays
+    data_arrays = pad_trials(general_info, {
+        'pumps': (raw_data['pumps'], int, 0),
+        'explosion': (raw_data['explosion'], int, 0),
+    })
 
     # Wrap into a dict for pystan
     data_dict = {
         'N': n_subj,
         'T': t_max,
         'Tsubj': t_subjs,
-        'P': np.max(pumps) + 1,
-        'pumps': pumps,
-        'explosion': explosion,
+        'P': np.max(data_arrays['pumps']) + 1,
+        **data_arrays,
     }
 
     # Returned data_dict will directly be passed to pystan
@@ -235,39 +257,15 @@ def choiceRT_preprocess_func(self, raw_data, general_info, additional_args):
     # subjs = general_info['subjs']
     n_subj = general_info['n_subj']
 
-    # Number of upper/lower boundary responses
-    Nu = np.full(n_subj, 0, dtype=int)
-    Nl = np.full(n_subj, 0, dtype=int)
-
-    # Write Nu, Nl
-    subj_group = iter(general_info['grouped_data'])
-    for s in range(n_subj):
-        _, subj_data = next(subj_group)
-        value_counts = subj_data['choice'].value_counts()
-        Nu[s] = value_counts.at[2]
-        Nl[s] = value_counts.at[1]
-
-    # Reaction-times for upper/lower boundary responses
-    RTu = np.full((n_subj, np.max(Nu)), -1, dtype=float)
-    RTl = np.full((n_subj, np.max(Nl)), -1, dtype=float)
-
-    # Write RTu, RTl
-    subj_group = iter(general_info['grouped_data'])
-    for s in range(n_subj):
-        _, subj_data = next(subj_group)
-        if Nu[s] > 0:
-            RTu[s][:Nu[s]] = subj_data['rt'][subj_data['choice'] == 2]
-        if Nl[s] > 0:
-            RTl[s][:Nl[s]] = subj_data['rt'][subj_data['choice'] == 1]
+    # Number of upper/lower boundary responses, and their reaction-times
+    subj = trial_index(general_info)[0]
+    choice = raw_data['choice'].to_numpy()
+    rt = raw_data['rt'].to_numpy(dtype=float)
+    Nu, RTu = _pad_responses(subj[choice == 2], rt[choice == 2], n_subj)
+    Nl, RTl = _pad_responses(subj[choice == 1], rt[choice == 1], n_subj)
 
     # Minimum reaction time
-    minRT = np.full(n_subj, -1, dtype=float)
-
-    # Write minRT
-    subj_group = iter(general_info['grouped_data'])
-    for s in range(n_subj):
-        _, subj_data = next(subj_group)
-        minRT[s] = min(subj_data['rt'])
+    minRT = general_info['grouped_data']['rt'].min().to_numpy(dtype=float)
 
     # Use additional_args if provided
     RTbound = additional_args.get('RTbound', 0.1)
@@ -289,6 +287,18 @@ def choiceRT_preprocess_func(self, raw_data, general_info, additional_args):
     return data_dict
 
 
+def _pad_responses(subj: np.ndarray, rt: np.ndarray,
+                   n_subj: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Number of responses of each subject, and their padded reaction-times.
+
+    Reaction-times are in the order of the data, and padded with ``-1``.
+    """
+    n_responses = np.bincount(subj, minlength=n_subj)
+    rts = np.full((n_subj, np.max(n_responses)), -1, dtype=float)
+    rts[subj, _cumcount(subj)] = rt
+    return n_responses, rts
+
+
 def choiceRT_single_preprocess_func(self, raw_data, general_info, additional_args):
     # DataFrames per upper/lower boundary responses
     df_upper = raw_data.loc[raw_data['choice'] == 2]
@@ -323,42 +333,27 @@ def choiceRT_single_preprocess_func(self, raw_data, general_info, additional_arg
 
 
 def cra_preprocess_func(self, raw_data, general_info, additional_args):
-    # Iterate through grouped_data
-    subj_group = iter(general_info['grouped_data'])
-
     # Use general_info(s) about raw_data
     # subjs = general_info['subjs']
     n_subj = general_info['n_subj']
     t_subjs = general_info['t_subjs']
     t_max = general_info['t_max']
 
-    # Initialize (model-specific) data arrays
-    choice = np.full((n_subj, t_max), 0, dtype=int)
-    prob = np.full((n_subj, t_max), 0, dtype=float)
-    ambig = np.full((n_subj, t_max), 0, dtype=float)
-    reward_var = np.full((n_subj, t_max), 0, dtype=float)
-    reward_fix = np.full((n_subj, t_max), 0, dtype=float)
-
-    # Write from subj_data to the data arrays
-    for s in range(n_subj):
-        _, subj_data = next(subj_group)
-        t = t_subjs[s]
-        choice[s][:t] = subj_data['choice']
-        prob[s][:t] = subj_data['prob']
-        ambig[s][:t] = subj_data['ambig']
-        reward_var[s][:t] = subj_data['rewardvar']
-        reward_fix[s][:t] = subj_data['rewardfix']
+    # Write the data of each trial to (model-specific) padded data arrays
+    data_arrays = pad_trials(general_info, {
+        'choice': (raw_data['choice'], int, 0),
+        'prob': (raw_data['prob'], float, 0),
+        'ambig': (raw_data['ambig'], float, 0),
+        'reward_var': (raw_data['rewardvar'], float, 0),
+        'reward_fix': (raw_data['rewardfix'], float, 0),
+    })
 
     # Wrap into a dict for pystan
     data_dict = {
         'N': n_subj,
         'T': t_max,
         'Tsubj': t_subjs,
-        'choice': choice,
-        'prob': prob,
-        'ambig': ambig,
-        'reward_var': reward_var,
-        'reward_fix': reward_fix,
+        **data_arrays,
     }
 
     # Returned data_dict will directly be passed to pystan
@@ -366,48 +361,29 @@ def cra_preprocess_func(self, raw_data, general_info, additional_args):
 
 
 def dbdm_preprocess_func(self, raw_data, general_info, additional_args):
-    # Iterate through grouped_data
-    subj_group = iter(general_info['grouped_data'])
-
     # Use general_info(s) about raw_data
     # subjs = general_info['subjs']
     n_subj = general_info['n_subj']
     t_subjs = general_info['t_subjs']
     t_max = general_info['t_max']
 
-    # Initialize (model-specific) data arrays
-    opt1hprob = np.full((n_subj, t_max), 0, dtype=float)
-    opt2hprob = np.full((n_subj, t_max), 0, dtype=float)
-    opt1hval = np.full((n_subj, t_max), 0, dtype=float)
-    opt1lval = np.full((n_subj, t_max), 0, dtype=float)
-    opt2hval = np.full((n_subj, t_max), 0, dtype=float)
-    opt2lval = np.full((n_subj, t_max), 0, dtype=float)
-    choice = np.full((n_subj, t_max), -1, dtype=int)
-
-    # Write from subj_data to the data arrays
-    for s in range(n_subj):
-        _, subj_data = next(subj_group)
-        t = t_subjs[s]
-        opt1hprob[s][:t] = subj_data['opt1hprob']
-        opt2hprob[s][:t] = subj_data['opt2hprob']
-        opt1hval[s][:t] = subj_data['opt1hval']
-        opt1lval[s][:t] = subj_data['opt1lval']
-        opt2hval[s][:t] = subj_data['opt2hval']
-        opt2lval[s][:t] = subj_data['opt2lval']
-        choice[s][:t] = subj_data['choice']
+    # Write the data of each trial to (model-specific) padded data arrays
+    data_arrays = pad_trials(general_info, {
+        'opt1hprob': (raw_data['opt1hprob'], float, 0),
+        'opt2hprob': (raw_data['opt2hprob'], float, 0),
+        'opt1hval': (raw_data['opt1hval'], float, 0),
+        'opt1lval': (raw_data['opt1lval'], float, 0),
+        'opt2hval': (raw_data['opt2hval'], float, 0),
+        'opt2lval': (raw_data['opt2lval'], float, 0),
+        'choice': (raw_data['choice'], int, -1),
+    })
 
     # Wrap into a dict for pystan
     data_dict = {
         'N': n_subj,
         'T': t_max,
         'Tsubj': t_subjs,
-        'opt1hprob': opt1hprob,
-        'opt2hprob': opt2hprob,
-        'opt1hval': opt1hval,
-        'opt1lval': opt1lval,
-        'opt2hval': opt2hval,
-        'opt2lval': opt2lval,
-        'choice': choice,
+        **data_arrays,
     }
 
     # Returned data_dict will directly be passed to pystan
@@ -415,42 +391,27 @@ def dbdm_preprocess_func(self, raw_data, general_info, additional_args):
 
 
 def dd_preprocess_func(self, raw_data, general_info, additional_args):
-    # Iterate through grouped_data
-    subj_group = iter(general_info['grouped_data'])
-
     # Use general_info(s) about raw_data
     # subjs = general_info['subjs']
     n_subj = general_info['n_subj']
     t_subjs = general_info['t_subjs']
     t_max = general_info['t_max']
 
-    # Initialize (model-specific) data arrays
-    delay_later = np.full((n_subj, t_max), 0, dtype=float)
-    amount_later = np.full((n_subj, t_max), 0, dtype=float)
-    delay_sooner = np.full((n_subj, t_max), 0, dtype=float)
-    amount_sooner = np.full((n_subj, t_max), 0, dtype=float)
-    choice = np.full((n_subj, t_max), -1, dtype=int)
-
-    # Write from subj_data to the data arrays
-    for s in range(n_subj):
-        _, subj_data = next(subj_group)
-        t = t_subjs[s]
-        delay_later[s][:t] = subj_data['delaylater']
-        amount_later[s][:t] = subj_data['amountlater']
-        delay_sooner[s][:t] = subj_data['delaysooner']
-        amount_sooner[s][:t] = subj_data['amountsooner']
-        choice[s][:t] = subj_data['choice']
+    # Write the data of each trial to (model-specific) padded data arrays
+    data_arrays = pad_trials(general_info, {
+        'delay_later': (raw_data['delaylater'], float, 0),
+        'amount_later': (raw_data['amountlater'], float, 0),
+        'delay_sooner': (raw_data['delaysooner'], float, 0),
+        'amount_sooner': (raw_data['amountsooner'], float, 0),
+        'choice': (raw_data['choice'], int, -1),
+    })
 
     # Wrap into a dict for pystan
     data_dict = {
         'N': n_subj,
         'T': t_max,
         'Tsubj': t_subjs,
-        'delay_later': delay_later,
-        'amount_later': amount_later,
-        'delay_sooner': delay_sooner,
-        'amount_sooner': amount_sooner,
-        'choice': choice,
+        **data_arrays,
     }
 
     # Returned data_dict will directly be passed to pystan
@@ -483,36 +444,25 @@ def dd_single_preprocess_func(self, raw_data, general_info, additional_args):
 
 
 def gng_preprocess_func(self, raw_data, general_info, additional_args):
-    # Iterate through grouped_data
-    subj_group = iter(general_info['grouped_data'])
-
     # Use general_info(s) about raw_data
     # subjs = general_info['subjs']
     n_subj = general_info['n_subj']
     t_subjs = general_info['t_subjs']
     t_max = general_info['t_max']
 
-    # Initialize (model-specific) data arrays
-    cue = np.full((n_subj, t_max), 1, dtype=int)
-    pressed = np.full((n_subj, t_max), -1, dtype=int)
-    outcome = np.full((n_subj, t_max), 0, dtype=float)
-
-    # Write from subj_data to the data arrays
-    for s in range(n_subj):
-        _, subj_data = next(subj_group)
-        t = t_subjs[s]
-        cue[s][:t] = subj_data['cue']
-        pressed[s][:t] = subj_data['keypressed']
-        outcome[s][:t] = subj_data['outcome']
+    # Write the data of each trial to (model-specific) padded data arrays
+    data_arrays = pad_trials(general_info, {
+        'cue': (raw_data['cue'], int, 1),
+        'pressed': (raw_data['keypressed'], int, -1),
+        'outcome': (raw_data['outcome'], float, 0),
+    })
 
     # Wrap into a dict for pystan
     data_dict = {
         'N': n_subj,
         'T': t_max,
         'Tsubj': t_subjs,
-        'cue': cue,
-        'pressed': pressed,
-        'outcome': outcome,
+        **data_arrays,
     }
 
     # Returned data_dict will directly be passed to pystan
@@ -520,14 +470,8 @@ def gng_preprocess_func(self, raw_data, general_info, additional_args):
 
 
 def hgf_ibrb_preprocess_func(self, raw_data, general_info, additional_args):
-    # Extract from raw_data
-    subjIDs = raw_data["subjid"]
-    trialNums = raw_data["trialnum"]
-    raw_u = raw_data["u"]
-    raw_y = raw_data["y"]
-
     # Use general_info(s) about raw_data
-    subjs = general_info['subjs']
+    # subjs = general_info['subjs']
     n_subj = general_info['n_subj']
     t_max = general_info['t_max']
 
@@ -535,17 +479,12 @@ def hgf_ibrb_preprocess_func(self, raw_data, general_info, additional_args):
     u = np.full((n_subj, t_max), -1, dtype=int)
     y = np.full((n_subj, t_max), -1, dtype=int)
 
-    # Write from raw_data to the data arrays
-    subjs_in_order = list(dict.fromkeys(subjs))
-    id_map = {str(s): idx for idx, s in enumerate(subjs_in_order)}
-    data_length = len(subjIDs)
-    for i in range(data_length):
-        n = id_map[str(subjIDs[i])]
-        t = int(trialNums[i]) - 1
-        if raw_u[i] in (0, 1):
-            u[n, t] = int(raw_u[i])
-        if raw_y[i] in (0, 1):
-            y[n, t] = int(raw_y[i])
+    # Write from raw_data to the data arrays, at the given trial numbers,
+    # the inputs and responses that are 0 or 1
+    subj = pd.factorize(raw_data['subjid'])[0]
+    trial = raw_data['trialnum'].to_numpy().astype(int) - 1
+    _write_binary(u, (subj, trial), raw_data['u'])
+    _write_binary(y, (subj, trial), raw_data['y'])
 
     # Wrap into a dict for pystan
     data_list = {
@@ -574,21 +513,17 @@ def hgf_ibrb_preprocess_func(self, raw_data, general_info, additional_args):
 def hgf_ibrb_single_preprocess_func(self, raw_data, general_info, additional_args):
     # Extract from raw_data
     trial_nums = raw_data["trialnum"]
-    raw_u = raw_data["u"]
-    raw_y = raw_data["y"]
 
     # Initialize (model-specific) data arrays
     t_max = max(trial_nums)
     u = np.full(t_max, -1, dtype=int)
     y = np.full(t_max, -1, dtype=int)
 
-    # Write from raw_data to the data arrays
-    for i in range(len(trial_nums)):
-        t = trial_nums[i] - 1
-        if raw_u[t] in (0, 1):
-            u[t] = int(raw_u[i])
-        if raw_y[t] in (0, 1):
-            y[t] = int(raw_y[i])
+    # Write from raw_data to the data arrays, at the given trial numbers,
+    # the inputs and responses that are 0 or 1
+    trial = trial_nums.to_numpy().astype(int) - 1
+    _write_binary(u, (trial,), raw_data['u'])
+    _write_binary(y, (trial,), raw_data['y'])
 
     # Wrap into a dict for pystan
     data_list = {
@@ -613,26 +548,27 @@ def hgf_ibrb_single_preprocess_func(self, raw_data, general_info, additional_arg
     return data_list
 
 
-def igt_preprocess_func(self, raw_data, general_info, additional_args):
-    # Iterate through grouped_data
-    subj_group = iter(general_info['grouped_data'])
+def _write_binary(array: np.ndarray, index: Tuple[np.ndarray, ...],
+                  values: pd.Series):
+    """Write ``values`` that are 0 or 1 to ``array`` at ``index``."""
+    valid = values.isin((0, 1)).to_numpy()
+    array[tuple(i[valid] for i in index)] = \
+        values.to_numpy()[valid].astype(int)
 
+
+def igt_preprocess_func(self, raw_data, general_info, additional_args):
     # Use general_info(s) about raw_data
     # subjs = general_info['subjs']
     n_subj = general_info['n_subj']
     t_subjs = general_info['t_subjs']
     t_max = general_info['t_max']
 
-    # Initialize (model-specific) data arrays
-    y_data = np.full((n_subj, t_max), -1, dtype=int)
-    rl_matrix = np.full((n_subj, t_max), 0, dtype=float)
-
-    # Write from subj_data to the data arrays
-    for s in range(n_subj):
-        _, subj_data = next(subj_group)
-        t = t_subjs[s]
-        y_data[s][:t] = subj_data['choice']
-        rl_matrix[s][:t] = subj_data['gain'] - np.abs(subj_data['loss'])
+    # Write the data of each trial to (model-specific) padded data arrays
+    data_arrays = pad_trials(general_info, {
+        'choice': (raw_data['choice'], int, -1),
+        'rl_matrix': (raw_data['gain'] - np.abs(raw_data['loss']), float, 0),
+    })
+    rl_matrix = data_arrays['rl_matrix']
 
     # Use additional_args if provided
     payscale = additional_args.get('payscale', 100)
@@ -642,7 +578,7 @@ def igt_preprocess_func(self, raw_data, general_info, additional_args):
         'N': n_subj,
         'T': t_max,
         'Tsubj': t_subjs,
-        'choice': y_data,
+        'choice': data_arrays['choice'],
         'outcome': rl_matrix / payscale,
         'sign_out': np.sign(rl_matrix),
     }
@@ -652,48 +588,29 @@ def igt_preprocess_func(self, raw_data, general_info, additional_args):
 
 
 def peer_preprocess_func(self, raw_data, general_info, additional_args):
-    # Iterate through grouped_data
-    subj_group = iter(general_info['grouped_data'])
-
     # Use general_info(s) about raw_data
     # subjs = general_info['subjs']
     n_subj = general_info['n_subj']
     t_subjs = general_info['t_subjs']
     t_max = general_info['t_max']
 
-    # Initialize (model-specific) data arrays
-    condition = np.full((n_subj, t_max), 0, dtype=int)
-    p_gamble = np.full((n_subj, t_max), 0, dtype=float)
-    safe_Hpayoff = np.full((n_subj, t_max), 0, dtype=float)
-    safe_Lpayoff = np.full((n_subj, t_max), 0, dtype=float)
-    risky_Hpayoff = np.full((n_subj, t_max), 0, dtype=float)
-    risky_Lpayoff = np.full((n_subj, t_max), 0, dtype=float)
-    choice = np.full((n_subj, t_max), -1, dtype=int)
-
-    # Write from subj_data to the data arrays
-    for s in range(n_subj):
-        _, subj_data = next(subj_group)
-        t = t_subjs[s]
-        condition[s][:t] = subj_data['condition']
-        p_gamble[s][:t] = subj_data['pgamble']
-        safe_Hpayoff[s][:t] = subj_data['safehpayoff']
-        safe_Lpayoff[s][:t] = subj_data['safelpayoff']
-        risky_Hpayoff[s][:t] = subj_data['riskyhpayoff']
-        risky_Lpayoff[s][:t] = subj_data['riskylpayoff']
-        choice[s][:t] = subj_data['choice']
+    # Write the data of each trial to (model-specific) padded data arrays
+    data_arrays = pad_trials(general_info, {
+        'condition': (raw_data['condition'], int, 0),
+        'p_gamble': (raw_data['pgamble'], float, 0),
+        'safe_Hpayoff': (raw_data['safehpayoff'], float, 0),
+        'safe_Lpayoff': (raw_data['safelpayoff'], float, 0),
+        'risky_Hpayoff': (raw_data['riskyhpayoff'], float, 0),
+        'risky_Lpayoff': (raw_data['riskylpayoff'], float, 0),
+        'choice': (raw_data['choice'], int, -1),
+    })
 
     # Wrap into a dict for pystan
     data_dict = {
         'N': n_subj,
         'T': t_max,
         'Tsubj': t_subjs,
-        'condition': condition,
-        'p_gamble': p_gamble,
-        'safe_Hpayoff': safe_Hpayoff,
-        'safe_Lpayoff': safe_Lpayoff,
-        'risky_Hpayoff': risky_Hpayoff,
-        'risky_Lpayoff': risky_Lpayoff,
-        'choice': choice,
+        **data_arrays,
     }
 
     # Returned data_dict will directly be passed to pystan
@@ -701,33 +618,24 @@ def peer_preprocess_func(self, raw_data, general_info, additional_args):
 
 
 def prl_preprocess_func(self, raw_data, general_info, additional_args):
-    # Iterate through grouped_data
-    subj_group = iter(general_info['grouped_data'])
-
     # Use general_info(s) about raw_data
     # subjs = general_info['subjs']
     n_subj = general_info['n_subj']
     t_subjs = general_info['t_subjs']
     t_max = general_info['t_max']
 
-    # Initialize (model-specific) data arrays
-    choice = np.full((n_subj, t_max), -1, dtype=int)
-    outcome = np.full((n_subj, t_max), 0, dtype=float)
-
-    # Write from subj_data to the data arrays
-    for s in range(n_subj):
-        _, subj_data = next(subj_group)
-        t = t_subjs[s]
-        choice[s][:t] = subj_data['choice']
-        outcome[s][:t] = np.sign(subj_data['outcome'])  # Use sign
+    # Write the data of each trial to (model-specific) padded data arrays
+    data_arrays = pad_trials(general_info, {
+        'choice': (raw_data['choice'], int, -1),
+        'outcome': (np.sign(raw_data['outcome']), float, 0),  # Use sign
+    })
 
     # Wrap into a dict for pystan
     data_dict = {
         'N': n_subj,
         'T': t_max,
         'Tsubj': t_subjs,
-        'choice': choice,
-        'outcome': outcome,
+        **data_arrays,
     }
 
     # Returned data_dict will directly be passed to pystan
@@ -735,9 +643,6 @@ def prl_preprocess_func(self, raw_data, general_info, additional_args):
 
 
 def prl_multipleB_preprocess_func(self, raw_data, general_info, additional_args):
-    # Iterate through grouped_data
-    subj_block_group = iter(general_info['grouped_data'])
-
     # Use general_info(s) about raw_data
     # subjs = general_info['subjs']
     n_subj = general_info['n_subj']
@@ -746,17 +651,12 @@ def prl_multipleB_preprocess_func(self, raw_data, general_info, additional_args)
     t_subjs = general_info['t_subjs']
     t_max = general_info['t_max']
 
-    # Initialize (model-specific) data arrays
-    choice = np.full((n_subj, b_max, t_max), -1, dtype=int)
-    outcome = np.full((n_subj, b_max, t_max), 0, dtype=float)
-
-    # Write from subj_block_data to the data arrays
-    for s in range(n_subj):
-        for b in range(b_subjs[s]):
-            _, subj_block_data = next(subj_block_group)
-            t = t_subjs[s][b]
-            choice[s][b][:t] = subj_block_data['choice']
-            outcome[s][b][:t] = np.sign(subj_block_data['outcome'])  # Use sign
+    # Write the data of each trial to (model-specific) padded data arrays,
+    # per subject and block
+    data_arrays = pad_trials(general_info, {
+        'choice': (raw_data['choice'], int, -1),
+        'outcome': (np.sign(raw_data['outcome']), float, 0),  # Use sign
+    })
 
     # Wrap into a dict for pystan
     data_dict = {
@@ -765,8 +665,7 @@ def prl_multipleB_preprocess_func(self, raw_data, general_info, additional_args)
         'Bsubj': b_subjs,
         'T': t_max,
         'Tsubj': t_subjs,
-        'choice': choice,
-        'outcome': outcome,
+        **data_arrays,
     }
 
     # Returned data_dict will directly be passed to pystan
@@ -774,39 +673,26 @@ def prl_multipleB_preprocess_func(self, raw_data, general_info, additional_args)
 
 
 def pst_preprocess_func(self, raw_data, general_info, additional_args):
-    # Iterate through grouped_data
-    subj_group = iter(general_info['grouped_data'])
-
     # Use general_info(s) about raw_data
     # subjs = general_info['subjs']
     n_subj = general_info['n_subj']
     t_subjs = general_info['t_subjs']
     t_max = general_info['t_max']
 
-    # Initialize (model-specific) data arrays
-    option1 = np.full((n_subj, t_max), -1, dtype=int)
-    option2 = np.full((n_subj, t_max), -1, dtype=int)
-    choice = np.full((n_subj, t_max), -1, dtype=int)
-    reward = np.full((n_subj, t_max), -1, dtype=float)
-
-    # Write from subj_data to the data arrays
-    for s in range(n_subj):
-        _, subj_data = next(subj_group)
-        t = t_subjs[s]
-        option1[s][:t] = subj_data['type'] // 10
-        option2[s][:t] = subj_data['type'] % 10
-        choice[s][:t] = subj_data['choice']
-        reward[s][:t] = subj_data['reward']
+    # Write the data of each trial to (model-specific) padded data arrays
+    data_arrays = pad_trials(general_info, {
+        'option1': (raw_data['type'] // 10, int, -1),
+        'option2': (raw_data['type'] % 10, int, -1),
+        'choice': (raw_data['choice'], int, -1),
+        'reward': (raw_data['reward'], float, -1),
+    })
 
     # Wrap into a dict for pystan
     data_dict = {
         'N': n_subj,
         'T': t_max,
         'Tsubj': t_subjs,
-        'option1': option1,
-        'option2': option2,
-        'choice': choice,
-        'reward': reward,
+        **data_arrays,
     }
 
     # Returned data_dict will directly be passed to pystan
@@ -814,29 +700,19 @@ def pst_preprocess_func(self, raw_data, general_info, additional_args):
   
   
 def pstRT_preprocess_func(self, raw_data, general_info, additional_args):
-    subj_group = iter(general_info['grouped_data'])
-
     # Use general_info(s) about raw_data
     n_subj = general_info['n_subj']
     t_subjs = general_info['t_subjs']
     t_max = general_info['t_max']
-    
-    # Initialize (model-specific) data arrays
-    i_subjs = np.full((n_subj, t_max), -1, dtype=int)
-    cond = np.full((n_subj, t_max), -1, dtype=int)
-    choice = np.full((n_subj, t_max), -1, dtype=int)
-    RT = np.full((n_subj, t_max), -1, dtype=float)
-    fd = np.full((n_subj, t_max), -1, dtype=int)
-
-    # Write from subj_data to the data arrays
-    for s in range(n_subj):
-        _, subj_data = next(subj_group)
-        t = t_subjs[s]
-        i_subjs[s][:t] = subj_data['iter']
-        cond[s][:t] = subj_data['cond']
-        choice[s][:t] = subj_data['choice']
-        RT[s][:t] = subj_data['rt']
-        fd[s][:t] = subj_data['feedback']
+
+    # Write the data of each trial to (model-specific) padded data arrays
+    data_arrays = pad_trials(general_info, {
+        'Isubj': (raw_data['iter'], int, -1),
+        'cond': (raw_data['cond'], int, -1),
+        'choice': (raw_data['choice'], int, -1),
+        'RT': (raw_data['rt'], float, -1),
+        'fd': (raw_data['feedback'], int, -1),
+    })
     
     # Task conditions and reward probabilities
     df_prob = raw_data[['cond', 'prob']].drop_duplicates()
@@ -845,13 +721,7 @@ def pstRT_preprocess_func(self, raw_data, general_info, additional_args):
     prob = df_prob['prob'].to_numpy()
     
     # Minimum reaction time
-    minRT = np.full(n_subj, -1, dtype=float)
-
-    # Write minRT
-    subj_group = iter(general_info['grouped_data'])
-    for s in range(n_subj):
-        _, subj_data = next(subj_group)
-        minRT[s] = min(subj_data['rt'])
+    minRT = general_info['grouped_data']['rt'].min().to_numpy(dtype=float)
 
     # Use additional_args if provided
     RTbound = additional_args.get('RTbound', 0.1)
@@ -862,12 +732,8 @@ def pstRT_preprocess_func(self, raw_data, general_info, additional_args):
         'N': n_subj,
         'T': t_max,
         'Tsubj': t_subjs,
-        'Isubj': i_subjs,
+        **data_arrays,
         'n_cond': n_cond,
-        'cond': cond,
-        'choice': choice,
-        'RT': RT,
-        'fd': fd,
         'initQ': initQ,
         'minRT': minRT,
         'RTbound': RTbound,
@@ -879,39 +745,26 @@ def pstRT_preprocess_func(self, raw_data, general_info, additional_args):
   
 
 def ra_preprocess_func(self, raw_data, general_info, additional_args):
-    # Iterate through grouped_data
-    subj_group = iter(general_info['grouped_data'])
-
     # Use general_info(s) about raw_data
     # subjs = general_info['subjs']
     n_subj = general_info['n_subj']
     t_subjs = general_info['t_subjs']
     t_max = general_info['t_max']
 
-    # Initialize (model-specific) data arrays
-    gain = np.full((n_subj, t_max), 0, dtype=float)
-    loss = np.full((n_subj, t_max), 0, dtype=float)
-    cert = np.full((n_subj, t_max), 0, dtype=float)
-    gamble = np.full((n_subj, t_max), -1, dtype=int)
-
-    # Write from subj_data to the data arrays
-    for s in range(n_subj):
-        _, subj_data = next(subj_group)
-        t = t_subjs[s]
-        gain[s][:t] = subj_data['gain']
-        loss[s][:t] = np.abs(subj_data['loss'])  # Use abs
-        cert[s][:t] = subj_data['cert']
-        gamble[s][:t] = subj_data['gamble']
+    # Write the data of each trial to (model-specific) padded data arrays
+    data_arrays = pad_trials(general_info, {
+        'gain': (raw_data['gain'], float, 0),
+        'loss': (np.abs(raw_data['loss']), float, 0),  # Use abs
+        'cert': (raw_data['cert'], float, 0),
+        'gamble': (raw_data['gamble'], int, -1),
+    })
 
     # Wrap into a dict for pystan
     data_dict = {
         'N': n_subj,
         'T': t_max,
         'Tsubj': t_subjs,
-        'gain': gain,
-        'loss': loss,
-        'cert': cert,
-        'gamble': gamble,
+        **data_arrays,
     }
 
     # Returned data_dict will directly be passed to pystan
@@ -919,118 +772,73 @@ def ra_preprocess_func(self, raw_data, general_info, additional_args):
 
 
 def rdt_preprocess_func(self, raw_data, general_info, additional_args):
-    # Iterate through grouped_data
-    subj_group = iter(general_info['grouped_data'])
-
     # Use general_info(s) about raw_data
     # subjs = general_info['subjs']
     n_subj = general_info['n_subj']
     t_subjs = general_info['t_subjs']
     t_max = general_info['t_max']
 
-    # Initialize (model-specific) data arrays
-    gain = np.full((n_subj, t_max), 0, dtype=float)
-    loss = np.full((n_subj, t_max), 0, dtype=float)
-    cert = np.full((n_subj, t_max), 0, dtype=float)
-    type = np.full((n_subj, t_max), -1, dtype=int)
-    gamble = np.full((n_subj, t_max), -1, dtype=int)
-    outcome = np.full((n_subj, t_max), 0, dtype=float)
-    happy = np.full((n_subj, t_max), 0, dtype=float)
-    RT_happy = np.full((n_subj, t_max), 0, dtype=float)
-
-    # Write from subj_data to the data arrays
-    for s in range(n_subj):
-        _, subj_data = next(subj_group)
-        t = t_subjs[s]
-        gain[s][:t] = subj_data['gain']
-        loss[s][:t] = np.abs(subj_data['loss'])  # Use abs
-        cert[s][:t] = subj_data['cert']
-        type[s][:t] = subj_data['type']
-        gamble[s][:t] = subj_data['gamble']
-        outcome[s][:t] = subj_data['outcome']
-        happy[s][:t] = subj_data['happy']
-        RT_happy[s][:t] = subj_data['rthappy']
+    # Write the data of each trial to (model-specific) padded data arrays
+    data_arrays = pad_trials(general_info, {
+        'gain': (raw_data['gain'], float, 0),
+        'loss': (np.abs(raw_data['loss']), float, 0),  # Use abs
+        'cert': (raw_data['cert'], float, 0),
+        'type': (raw_data['type'], int, -1),
+        'gamble': (raw_data['gamble'], int, -1),
+        'outcome': (raw_data['outcome'], float, 0),
+        'happy': (raw_data['happy'], float, 0),
+        'RT_happy': (raw_data['rthappy'], float, 0),
+    })
 
     # Wrap into a dict for pystan
     data_dict = {
         'N': n_subj,
         'T': t_max,
         'Tsubj': t_subjs,
-        'gain': gain,
-        'loss': loss,
-        'cert': cert,
-        'type': type,
-        'gamble': gamble,
-        'outcome': outcome,
-        'happy': happy,
-        'RT_happy': RT_happy,
+        **data_arrays,
     }
 
     # Returned data_dict will directly be passed to pystan
     return data_dict
 
 def task2AFC_preprocess_func(self, raw_data, general_info, additional_args):
-    # Iterate through grouped_data
-    subj_group = iter(general_info['grouped_data'])
     # Use general_info(s) about raw_data
     # subjs = general_info['subjs']
     n_subj = general_info['n_subj']
 
-    #Initialize (model-specific) data arrays
-    h = np.full((n_subj), 0, dtype = int)
-    f = np.full((n_subj), 0, dtype = int)
-    signal = np.full((n_subj), 0, dtype = int)
-    noise = np.full((n_subj), 0, dtype = int)
-
-    #Write data to the data arrays
-    for s in range(n_subj):
-        _, subj_data = next(subj_group)
-
-        for stim in subj_data['stimulus']:
-            if stim == 1:
-                signal[s] += 1
-            elif stim == 0:
-                noise[s] += 1
-        for stim, resp in zip(subj_data['stimulus'], subj_data['response']):
-            if stim == 1 and resp == 1:
-                h[s] += 1
-            elif stim == 0 and resp == 1:
-                f[s] += 1
+    # Count the trials of each subject
+    subj = trial_index(general_info)[0]
+    stimulus = raw_data['stimulus'].to_numpy()
+    response = raw_data['response'].to_numpy()
+
+    def count(trials):
+        return np.bincount(subj[trials], minlength=n_subj)
 
     # Wrap into a dict for pystan
     data_dict = {
         'N' : n_subj,
-        'h' : h,
-        'f' : f,
-        'signal' : signal,
-        'noise' : noise,
+        'h' : count((stimulus == 1) & (response == 1)),
+        'f' : count((stimulus == 0) & (response == 1)),
+        'signal' : count(stimulus == 1),
+        'noise' : count(stimulus == 0),
     }
 
     # Returned data_dict will directly be passed to pystan
     return data_dict
 
 def ts_preprocess_func(self, raw_data, general_info, additional_args):
-    # Iterate through grouped_data
-    subj_group = iter(general_info['grouped_data'])
-
     # Use general_info(s) about raw_data
     # subjs = general_info['subjs']
     n_subj = general_info['n_subj']
     t_subjs = general_info['t_subjs']
     t_max = general_info['t_max']
 
-    # Initialize (model-specific) data arrays
-    level1_choice = np.full((n_subj, t_max), 1, dtype=int)
-    level2_choice = np.full((n_subj, t_max), 1, dtype=int)
-    reward = np.full((n_subj, t_max), 0, dtype=int)
-
-    # Write from subj_data to the data arrays
-    for s in range(n_subj):
-        _, subj_data = next(subj_group)
-        t = t_subjs[s]
-        level1_choice[s][:t] = subj_data['level1choice']
-        level2_choice[s][:t] = subj_data['level2choice']
-        reward[s][:t] = subj_data['reward']
+    # Write the data of each trial to (model-specific) padded data arrays
+    data_arrays = pad_trials(general_info, {
+        'level1_choice': (raw_data['level1choice'], int, 1),
+        'level2_choice': (raw_data['level2choice'], int, 1),
+        'reward': (raw_data['reward'], int, 0),
+    })
 
     # Use additional_args if provided
     trans_prob = additional_args.get('trans_prob', 0.7)
@@ -1040,9 +848,7 @@ def ts_preprocess_func(self, raw_data, general_info, additional_args):
         'N': n_subj,
         'T': t_max,
         'Tsubj': t_subjs,
-        'level1_choice': level1_choice,
-        'level2_choice': level2_choice,
-        'reward': reward,
+        **data_arrays,
         'trans_prob': trans_prob,
     }
 
@@ -1051,43 +857,55 @@ def ts_preprocess_func(self, raw_data, general_info, additional_args):
 
 
 def ug_preprocess_func(self, raw_data, general_info, additional_args):
-    # Iterate through grouped_data
-    subj_group = iter(general_info['grouped_data'])
-
     # Use general_info(s) about raw_data
     # subjs = general_info['subjs']
     n_subj = general_info['n_subj']
     t_subjs = general_info['t_subjs']
     t_max = general_info['t_max']
 
-    # Initialize (model-specific) data arrays
-    offer = np.full((n_subj, t_max), 0, dtype=float)
-    accept = np.full((n_subj, t_max), -1, dtype=int)
-
-    # Write from subj_data to the data arrays
-    for s in range(n_subj):
-        _, subj_data = next(subj_group)
-        t = t_subjs[s]
-        offer[s][:t] = subj_data['offer']
-        accept[s][:t] = subj_data['accept']
+    # Write the data of each trial to (model-specific) padded data arrays
+    data_arrays = pad_trials(general_info, {
+        'offer': (raw_data['offer'], float, 0),
+        'accept': (raw_data['accept'], int, -1),
+    })
 
     # Wrap into a dict for pystan
     data_dict = {
         'N': n_subj,
         'T': t_max,
         'Tsubj': t_subjs,
-        'offer': offer,
-        'accept': accept,
+        **data_arrays,
     }
 
     # Returned data_dict will directly be passed to pystan
     return data_dict
 
 
-def wcs_preprocess_func(self, raw_data, general_info, additional_args):
-    # Iterate through grouped_data
-    subj_group = iter(general_info['grouped_data'])
+@lru_cache(maxsize=None)
+def _wcs_answer_sheet() -> Tuple[np.ndarray, np.ndarray]:
+    """Read the predefined answer sheet of the WCS task, once per process.
+
+    Returns
+    -------
+    answer : np.ndarray
+        Deck (from 0) matching the card of each trial, on each of the 3
+        rules (color, form, number), of shape ``(3, 128)``.
+    deck_match_rule : np.ndarray
+        Whether each deck matches the card of each trial on each rule, of
+        shape ``(128, 3, 4)``.
 
+    Both arrays are shared between calls, and read-only.
+    """
+    answersheet = PATH_COMMON / 'extdata' / 'wcs_answersheet.txt'
+    answer = pd.read_csv(
+        answersheet, sep='\t', header=0, index_col=0).to_numpy() - 1
+    deck_match_rule = np.eye(4)[answer.T]
+    answer.setflags(write=False)
+    deck_match_rule.setflags(write=False)
+    return answer, deck_match_rule
+
+
+def wcs_preprocess_func(self, raw_data, general_info, additional_args):
     # Use general_info(s) about raw_data
     # subjs = general_info['subjs']
     n_subj = general_info['n_subj']
@@ -1096,42 +914,29 @@ def wcs_preprocess_func(self, raw_data, general_info, additional_args):
     t_max = 128
 
     # Read from predefined answer sheet
-    answersheet = PATH_COMMON / 'extdata' / 'wcs_answersheet.txt'
-    answer = pd.read_csv(
-        answersheet, sep='\t', header=0, index_col=0).to_numpy() - 1
-
-    # Initialize data arrays
-    choice = np.full((n_subj, 4, t_max), 0, dtype=int)
-    outcome = np.full((n_subj, t_max), -1, dtype=int)
-    choice_match_att = np.full((n_subj, t_max, 1, 3), 0, dtype=int)
-    deck_match_rule = np.full((t_max, 3, 4), 0, dtype=float)
-
-    # Write choice, outcome, choice_match_att
-    for s in range(n_subj):
-        trials = t_subjs[s]
-        _, subj_data = next(subj_group)
-        subj_data_choice = subj_data['choice'].to_numpy() - 1
-        subj_data_outcome = subj_data['outcome'].to_numpy()
-        for t in range(trials):
-            c = subj_data_choice[t]
-            o = subj_data_outcome[t]
-            choice[s][c][t] = 1
-            outcome[s][t] = o
-            choice_match_att[s][t][0][:] = (c == answer[:, t])
-
-    # Write deck_match_rule
-    for t in range(t_max):
-        for r in range(3):
-            deck_match_rule[t][r][answer[r][t]] = 1
+    answer, deck_match_rule = _wcs_answer_sheet()
+
+    # Write the data of each trial to (model-specific) padded data arrays,
+    # the chosen deck as one-hot vectors, and whether it matches the card
+    # on each rule
+    _, trial = trial_index(general_info)
+    deck = raw_data['choice'].to_numpy() - 1
+    data_arrays = pad_trials(dict(general_info, t_max=t_max), {
+        'choice': (np.eye(4, dtype=int)[deck], int, 0),
+        'outcome': (raw_data['outcome'], int, -1),
+        'choice_match_att': ((deck == answer[:, trial]).T[:, None],
+                             int, 0),
+    })
 
     # Wrap into a dict for pystan
     data_dict = {
         'N': n_subj,
         'T': t_max,
         'Tsubj': t_subjs,
-        'choice': choice,
-        'outcome': outcome,
-        'choice_match_att': choice_match_att,
+        # Decks along the second axis: (n_subj, 4, t_max)
+        'choice': data_arrays['choice'].transpose(0, 2, 1).copy(),
+        'outcome': data_arrays['outcome'],
+        'choice_match_att': data_arrays['choice_match_att'],
         'deck_match_rule': deck_match_rule,
     }
 
@@ -1140,60 +945,39 @@ def wcs_preprocess_func(self, raw_data, general_info, additional_args):
 
 
 def cgt_preprocess_func(self, raw_data, general_info, additional_args):
-    # Iterate through grouped_data
-    subj_group = iter(general_info['grouped_data'])
-
     # Use general_info(s) about raw_data
     # subjs = general_info['subjs']
     n_subj = general_info['n_subj']
     t_subjs = general_info['t_subjs']
     t_max = general_info['t_max']
 
-    uniq_bets = np.unique(raw_data['percentagestaked'])
-    n_bets = len(uniq_bets)
-    bets_asc = np.sort(uniq_bets / 100)
-    bets_dsc = np.flip(np.sort(uniq_bets / 100))
+    bets = raw_data['percentagestaked'].to_numpy() / 100
+    bets_asc = np.unique(bets)
+    n_bets = len(bets_asc)
     bet_delay = np.arange(n_bets) / 4
 
-    bet_time = raw_data['percentagestaked'] / 100
-    for b in range(n_bets):
-        bet_time[bet_time == bets_asc[b]] = b + 1
-    raw_data['bet_time'] = np.where(raw_data['gambletype'] == 0,
-                                    n_bets + 1 - bet_time,
-                                    bet_time)
-
-    col_chosen = np.full((n_subj, t_max), 0, dtype=int)
-    bet_chosen = np.full((n_subj, t_max), 0, dtype=int)
-    prop_red = np.full((n_subj, t_max), 0, dtype=float)
-    prop_chosen = np.full((n_subj, t_max), 0, dtype=float)
-    gain = np.full((n_subj, t_max, n_bets), 0, dtype=float)
-    loss = np.full((n_subj, t_max, n_bets), 0, dtype=float)
-
-    for s in range(n_subj):
-        t = t_subjs[s]
-        _, subj_data = next(subj_group)
-
-        col_chosen[s, :t] = np.where(subj_data['redchosen'] == 1, 1, 2)
-        bet_chosen[s, :t] = subj_data['bet_time']
-        prop_red[s, :t] = subj_data['nredboxes'] / 10
-        prop_chosen[s, :t] = np.where(subj_data['redchosen'] == 1,
-                                      prop_red[s][:t],
-                                      1 - prop_red[s][:t])
-
-        for b in range(n_bets):
-            gain[s, :t, b] = subj_data['trialinitialpoints'] / 100 \
-                + subj_data['trialinitialpoints'] / 100 \
-                * np.where(subj_data['gambletype'] == 1,
-                           bets_asc[b],
-                           bets_dsc[b])
-            loss[s, :t, b] = subj_data['trialinitialpoints'] / 100 \
-                - subj_data['trialinitialpoints'] / 100 \
-                * np.where(subj_data['gambletype'] == 1,
-                           bets_asc[b],
-                           bets_dsc[b])
-
-    # Remove the unnecessary intermediate column
-    raw_data.drop(columns='bet_time', inplace=True)
+    # Rank of each bet, in the order in which bets were offered (ascending
+    # or descending)
+    ascending = raw_data['gambletype'].to_numpy() == 1
+    bet_time = np.searchsorted(bets_asc, bets) + 1
+    bet_time = np.where(ascending, bet_time, n_bets + 1 - bet_time)
+
+    # Points to gain or lose with each bet, for each trial
+    red_chosen = raw_data['redchosen'].to_numpy() == 1
+    prop_red = raw_data['nredboxes'].to_numpy() / 10
+    points = raw_data['trialinitialpoints'].to_numpy()[:, None] / 100
+    bet_values = np.where(ascending[:, None], bets_asc, bets_asc[::-1])
+
+    # Write the data of each trial to (model-specific) padded data arrays
+    data_arrays = pad_trials(general_info, {
+        'gain': (points + points * bet_values, float, 0),
+        'loss': (points - points * bet_values, float, 0),
+        'prop_red': (prop_red, float, 0),
+        'prop_chosen': (np.where(red_chosen, prop_red, 1 - prop_red),
+                        float, 0),
+        'col_chosen': (np.where(red_chosen, 1, 2), int, 0),
+        'bet_chosen': (bet_time, int, 0),
+    })
 
     # Wrap into a dict for pystan
     data_dict = {
@@ -1202,12 +986,7 @@ def cgt_preprocess_func(self, raw_data, general_info, additional_args):
         'B': n_bets,
         'Tsubj': t_subjs,
         'bet_delay': bet_delay,
-        'gain': gain,
-        'loss': loss,
-        'prop_red': prop_red,
-        'prop_chosen': prop_chosen,
-        'col_chosen': col_chosen,
-        'bet_chosen': bet_chosen
+        **data_arrays,
     }
 
     # Returned data_dict will directly be passed to pystan
@@ -0,0 +1,254 @@
+"""Saving fitted models, and loading them back without refitting.
+
+A saved model is a directory holding:
+
+- ``draws``: a draw store (see :mod:`hbayesdm.store`) of the draws of each
+  parameter and of the statistics of the sampler, one column per parameter,
+  optionally compressed block by block;
+- ``all_ind_pars.tsv`` and ``raw_data.tsv``: the summarized parameters of
+  each subject, and the data the model was fitted on;
+- ``model_regressor``, ``model_regressor_summary`` and ``postpred_summary``:
+  NumPy files (``.npy``) of the summaries computed during the fit, if any;
+- ``model.json``: the name of the model, the backend and the precision of
+  the fit, the adaptation of its chains, and the names of the summaries. It
+  is written last, so that only complete saves are loaded.
+
+Nothing is unpickled when a model is loaded: draws and summaries are
+memory-mapped (or decompressed) when first used, and the raw data are only
+read when accessed, so that loading a large fit to read a few parameters is
+fast.
+"""
+import json
+import os
+import shutil
+import sys
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Union
+
+import numpy as np
+import pandas as pd
+
+from hbayesdm.backends import DrawsFit, _to_json
+from hbayesdm.base import TaskModel, _compact_postpreds
+from hbayesdm.store import DrawStore, StoredFit
+from hbayesdm.warmstart import chains_from_json
+
+__all__ = ['load', 'save']
+
+_METADATA = 'model.json'
+_FORMAT = 1
+_SUMMARIES = ('model_regressor', 'model_regressor_summary',
+              'postpred_summary')
+
+
+def save(model: TaskModel, path: Union[str, Path], compress: bool = False):
+    """Save a fitted model to a directory (see :meth:`TaskModel.save`).
+
+    Parameters
+    ----------
+    model
+        The fitted model.
+    path
+        Path of the directory, which is created if needed. A model saved
+        there before is replaced.
+    compress
+        Whether to compress the draws.
+    """
+    path = Path(path)
+    if path.exists() and any(path.iterdir()) and \
+            not (path / _METADATA).exists():
+        raise RuntimeError(
+            'Cannot save the model to %s: the directory is not empty.' % path)
+    fit = model.fit
+    if isinstance(fit, StoredFit) and \
+            fit.store.path.resolve() == (path / 'draws').resolve():
+        raise RuntimeError(
+            'Cannot save the model to %s, from which its draws are read.'
+            % path)
+    path.mkdir(parents=True, exist_ok=True)
+    if (path / _METADATA).exists():
+        os.remove(str(path / _METADATA))
+    for name in _SUMMARIES:
+        shutil.rmtree(str(path / name), ignore_errors=True)
+
+    draws = _draws_to_save(model)
+    store = DrawStore(path / 'draws', compress)
+    store.create(model.model, draws.n_chains)
+    store.append(draws)
+    del draws
+
+    model.all_ind_pars.to_csv(str(path / 'all_ind_pars.tsv'), sep='\t')
+    model.raw_data.to_csv(str(path / 'raw_data.tsv'), sep='\t', index=False)
+
+    summaries = OrderedDict()  # type: OrderedDict
+    if model.model_regressor is not None:
+        summaries['model_regressor'] = list(model.model_regressor)
+        _save_arrays(path / 'model_regressor', model.model_regressor)
+    if model.model_regressor_summary is not None:
+        summaries['model_regressor_summary'] = OrderedDict()
+        for name, result in model.model_regressor_summary.items():
+            summaries['model_regressor_summary'][name] = list(result)
+            _save_arrays(path / 'model_regressor_summary' / name, result)
+    if model.postpred_summary is not None:
+        summaries['postpred_summary'] = OrderedDict()
+        for name, result in model.postpred_summary.items():
+            arrays = OrderedDict(
+                (k, v) for k, v in result.items() if k != 'choice_prop')
+            entry = OrderedDict([('statistics', list(arrays)),
+                                 ('choices', None)])
+            if 'choice_prop' in result:
+                entry['choices'] = list(result['choice_prop'].columns)
+                arrays['choice_prop'] = result['choice_prop'].values
+            summaries['postpred_summary'][name] = entry
+            _save_arrays(path / 'postpred_summary' / name, arrays)
+
+    metadata = OrderedDict([
+        ('format', _FORMAT),
+        ('model', model.model),
+        ('backend', model.backend.name),
+        ('precision', model.precision),
+        ('inc_postpred', any(pp in model.par_vals for pp in model.postpreds)),
+        ('adaptation', model.adaptation),
+        ('adaptation_dims', model.adaptation_dims),
+        ('summaries', summaries),
+    ])
+    tmp = path / (_METADATA + '.tmp')
+    with open(str(tmp), 'w') as f:
+        json.dump(_to_json(metadata), f)
+    os.replace(str(tmp), str(path / _METADATA))
+
+
+def load(path: Union[str, Path]) -> TaskModel:
+    """Load a model saved with ``TaskModel.save``.
+
+    The draws are not read until used: ``par_vals`` reads those of each
+    parameter from the directory when first accessed (ordered by draw, and
+    then by chain, see :class:`hbayesdm.store.StoredFit`), ``fit`` holds them
+    all, memory-mapped, and ``raw_data`` is read when first accessed.
+
+    Parameters
+    ----------
+    path
+        Path of the directory the model was saved to.
+
+    Returns
+    -------
+    TaskModel
+        The fitted model, as it was saved.
+    """
+    import hbayesdm.models
+
+    path = Path(path)
+    if not (path / _METADATA).exists():
+        raise RuntimeError('No saved model found in: %s' % path)
+    with open(str(path / _METADATA), 'r') as f:
+        metadata = json.load(f)
+    if metadata.get('format') != _FORMAT:
+        raise RuntimeError(
+            'Unsupported format of saved model: %s' % metadata.get('format'))
+    function = getattr(hbayesdm.models, metadata['model'], None)
+    if function is None or metadata['model'] not in hbayesdm.models.__all__:
+        raise RuntimeError('Unknown model: %r' % (metadata['model'],))
+    cls = next(v for v in vars(sys.modules[function.__module__]).values()
+               if isinstance(v, type) and
+               issubclass(v, TaskModel) and v is not TaskModel)
+
+    adaptation = metadata['adaptation']
+    if adaptation is not None:
+        adaptation = chains_from_json(adaptation)
+    all_ind_pars = pd.read_csv(str(path / 'all_ind_pars.tsv'), sep='\t',
+                               index_col=0, float_precision='round_trip')
+    all_ind_pars.index.name = None
+
+    summaries = metadata['summaries']
+    model_regressor = None
+    if 'model_regressor' in summaries:
+        model_regressor = _load_arrays(
+            path / 'model_regressor', summaries['model_regressor'])
+    model_regressor_summary = None
+    if 'model_regressor_summary' in summaries:
+        model_regressor_summary = OrderedDict(
+            (name, _load_arrays(path / 'model_regressor_summary' / name,
+                                statistics))
+            for name, statistics in
+            summaries['model_regressor_summary'].items())
+    postpred_summary = None
+    if 'postpred_summary' in summaries:
+        postpred_summary = OrderedDict()
+        for name, entry in summaries['postpred_summary'].items():
+            result = _load_arrays(path / 'postpred_summary' / name,
+                                  entry['statistics'])
+            if entry['choices'] is not None:
+                result['choice_prop'] = pd.DataFrame(
+                    np.load(str(path / 'postpred_summary' / name /
+                                'choice_prop.npy')),
+                    index=all_ind_pars.index, columns=entry['choices'])
+            postpred_summary[name] = result
+
+    def read_raw_data():
+        return pd.read_csv(str(path / 'raw_data.tsv'), sep='\t',
+                           float_precision='round_trip')
+
+    return cls(_saved={
+        'model': metadata['model'],
+        'backend': metadata['backend'],
+        'precision': metadata['precision'],
+        'inc_postpred': metadata['inc_postpred'],
+        'fit': DrawStore(path / 'draws').fit(adaptation),
+        'all_ind_pars': all_ind_pars,
+        'raw_data': read_raw_data,
+        'model_regressor': model_regressor,
+        'model_regressor_summary': model_regressor_summary,
+        'postpred_summary': postpred_summary,
+        'adaptation': adaptation,
+        'adaptation_dims': metadata['adaptation_dims'],
+    })
+
+
+def _draws_to_save(model: TaskModel) -> DrawsFit:
+    """Draws of the fit of a model, by chain, as they are stored.
+
+    Missing posterior predictions are ``NaN`` (as in ``par_vals``), or
+    ``-1`` in compact precision. Draws of variational inference are saved as
+    a single chain.
+    """
+    fit = model.fit
+    if isinstance(fit, DrawsFit):
+        draws = fit
+    elif model.adaptation is None:  # variational inference
+        draws = DrawsFit(model.model, OrderedDict(
+            (n, np.asarray(v)[None]) for n, v in model.par_vals.items()
+            if n != 'lp__'), OrderedDict())
+    else:
+        draws = model.backend.to_draws(fit)
+
+    arrays = OrderedDict(draws.draws)
+    for name in model.postpreds:
+        if name not in arrays:
+            continue
+        values = arrays[name]
+        if model.precision == 'compact':
+            arrays[name] = _compact_postpreds(values)
+        elif not isinstance(fit, StoredFit):
+            values = np.asarray(values, dtype=float)
+            arrays[name] = np.where(values == -1, np.nan, values)
+    if model.precision == 'compact':
+        for name in model.regressors:
+            if name in arrays:
+                arrays[name] = np.asarray(arrays[name]).astype(
+                    np.float32, copy=False)
+    return DrawsFit(draws.model_name, arrays, draws.sample_stats,
+                    draws.adaptation)
+
+
+def _save_arrays(path: Path, arrays: Dict[str, Any]):
+    path.mkdir(parents=True, exist_ok=True)
+    for name, values in arrays.items():
+        np.save(str(path / (name + '.npy')), np.asarray(values))
+
+
+def _load_arrays(path: Path, names: Any) -> 'OrderedDict[str, np.ndarray]':
+    return OrderedDict((name, np.load(str(path / (name + '.npy')),
+                                      mmap_mode='r'))
+                       for name in names)
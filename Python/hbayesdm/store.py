@@ -0,0 +1,311 @@
+"""On-disk stores of posterior draws.
+
+A draw store is a directory holding, for each parameter and each statistic of
+the sampler, a binary file of its draws (``<name>.bin``, or ``<name>__.bin``
+for statistics such as ``lp__``), and an index (``index.json``) of their
+types and dimensions and of the number of draws written. Draws are stored
+draw by draw, with the values of all chains for each draw, so that blocks of
+draws are appended at the end of the files as chains sample, and the draws
+of all chains can be memory-mapped as a single array of shape
+``(n_draws * n_chains, *dims)``.
+
+Stores created with ``compress=True`` hold each appended block of draws as a
+zlib-compressed chunk instead, whose number of draws and size are kept in the
+index; their draws are decompressed, chunk by chunk, when read.
+"""
+import json
+import os
+import zlib
+from collections import OrderedDict
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+
+from hbayesdm.backends import DrawsFit, _chunk_size
+
+__all__ = ['DrawStore', 'StoredFit']
+
+_INDEX = 'index.json'
+_COMPRESSION_LEVEL = 1  # fast, and most of the gain on draws
+
+
+class DrawStore(object):
+    """A directory of draws, appended block by block.
+
+    Parameters
+    ----------
+    path
+        Path of the directory, which is created if needed.
+    compress
+        Whether to compress the draws of a store created (see
+        :meth:`create`); the draws of an existing store are read as they were
+        written.
+    """
+
+    def __init__(self, path: Union[str, Path], compress: bool = False):
+        self.path = Path(path)
+        self.compress = compress
+        self._index = None  # type: Optional[Dict[str, Any]]
+
+    def exists(self) -> bool:
+        """Whether the directory holds a store."""
+        return (self.path / _INDEX).exists()
+
+    @property
+    def index(self) -> Dict[str, Any]:
+        if self._index is None:
+            if not self.exists():
+                raise RuntimeError('No draws found in: %s' % self.path)
+            with open(str(self.path / _INDEX), 'r') as f:
+                self._index = json.load(f)
+        return self._index
+
+    @property
+    def n_draws(self) -> int:
+        """Number of draws per chain written so far."""
+        return int(self.index['n_draws'])
+
+    @property
+    def compressed(self) -> bool:
+        """Whether the draws are stored as compressed chunks."""
+        return bool(self.index.get('compress', False))
+
+    def create(self, model_name: str, n_chains: int):
+        """Start an empty store, replacing the draws already in the directory.
+
+        Parameters
+        ----------
+        model_name
+            Name of the model.
+        n_chains
+            Number of chains.
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+        for stale in self.path.glob('*.bin'):
+            stale.unlink()
+        self._index = OrderedDict([
+            ('model', model_name),
+            ('n_chains', n_chains),
+            ('n_draws', 0),
+            ('compress', self.compress),
+            ('columns', OrderedDict()),
+        ])
+        self._write_index()
+
+    def truncate(self, n_draws: int):
+        """Keep the first ``n_draws`` draws of each chain.
+
+        Draws written after the last update of the index (e.g., by a fit
+        interrupted while appending a block) are removed along with them.
+        Compressed draws are only truncated between appended blocks.
+        """
+        if n_draws > self.n_draws:
+            raise RuntimeError('Only %d draws are stored in %s.'
+                               % (self.n_draws, self.path))
+        for name, column in self.index['columns'].items():
+            if self.compressed:
+                chunks = column['chunks']
+                kept = np.searchsorted(
+                    np.cumsum([0] + [n for n, _ in chunks]), n_draws)
+                if sum(n for n, _ in chunks[:kept]) != n_draws:
+                    raise RuntimeError(
+                        'Compressed draws of %s can only be truncated '
+                        'between the blocks they were appended in.'
+                        % self.path)
+                column['chunks'] = chunks[:kept]
+                size = sum(nbytes for _, nbytes in column['chunks'])
+            else:
+                size = n_draws * self._row_bytes(column)
+            if not self._file(name).exists():
+                continue
+            with open(str(self._file(name)), 'r+b') as f:
+                f.truncate(size)
+        self.index['n_draws'] = n_draws
+        self._write_index()
+
+    def append(self, fit: DrawsFit):
+        """Append the draws of a block of iterations of the chains.
+
+        Parameters
+        ----------
+        fit
+            Draws of the block, whose parameters and statistics should be the
+            same as those of the previous blocks.
+        """
+        index = self.index
+        columns = index['columns']
+        arrays = OrderedDict(fit.draws)
+        arrays.update((k + '__', v) for k, v in fit.sample_stats.items())
+        if not columns:
+            for name, values in arrays.items():
+                columns[name] = OrderedDict([
+                    ('dtype', np.dtype(values.dtype).str),
+                    ('shape', list(values.shape[2:])),
+                ])
+                if self.compressed:
+                    columns[name]['chunks'] = []
+        elif list(arrays) != list(columns):
+            raise RuntimeError(
+                'The draws to append do not match those of %s.' % self.path)
+        self.truncate(index['n_draws'])
+        n_draws = 0
+        for name, values in arrays.items():
+            column = columns[name]
+            values = np.asarray(values, dtype=column['dtype'])
+            n_draws = values.shape[1]
+            data = np.ascontiguousarray(np.swapaxes(values, 0, 1))
+            if self.compressed:
+                data = zlib.compress(data.tobytes(), _COMPRESSION_LEVEL)
+                column['chunks'].append([n_draws, len(data)])
+            with open(str(self._file(name)), 'ab') as f:
+                f.write(data)
+        index['n_draws'] += n_draws
+        self._write_index()
+
+    def column(self, name: str) -> np.ndarray:
+        """Memory-map the draws of a parameter (or statistic, ending in
+        ``__``), as an array of shape ``(n_draws, n_chains, *dims)``.
+
+        Compressed draws are decompressed into a read-only array instead.
+        """
+        column = self.index['columns'][name]
+        shape = (self.n_draws, self.index['n_chains']) + \
+            tuple(column['shape'])
+        if self.n_draws == 0:
+            return np.empty(shape, dtype=column['dtype'])
+        if not self.compressed:
+            return np.memmap(str(self._file(name)), dtype=column['dtype'],
+                             mode='r', shape=shape)
+        values = np.empty(shape, dtype=column['dtype'])
+        i = 0
+        for chunk in self.chunks(name):
+            values[i:i + len(chunk)] = chunk
+            i += len(chunk)
+        values.flags.writeable = False
+        return values
+
+    def chunks(self, name: str) -> Iterator[np.ndarray]:
+        """Iterate over the draws of a parameter (or statistic) block by
+        block, as appended, in arrays of shape ``(n_draws, n_chains,
+        *dims)``.
+
+        Uncompressed draws are memory-mapped as a single block.
+        """
+        if not self.compressed:
+            yield self.column(name)
+            return
+        column = self.index['columns'][name]
+        dims = (self.index['n_chains'],) + tuple(column['shape'])
+        with open(str(self._file(name)), 'rb') as f:
+            for n_draws, nbytes in column['chunks']:
+                data = zlib.decompress(f.read(nbytes))
+                yield np.frombuffer(data, dtype=column['dtype']) \
+                    .reshape((n_draws,) + dims)
+
+    def fit(self, adaptation: Optional[List[Dict[str, Any]]] = None) \
+            -> 'StoredFit':
+        """Return the draws as a fit (without reading them)."""
+        return StoredFit(self, adaptation)
+
+    def _file(self, name: str) -> Path:
+        return self.path / (name + '.bin')
+
+    def _row_bytes(self, column: Dict[str, Any]) -> int:
+        return int(self.index['n_chains'] * np.prod(column['shape']) *
+                   np.dtype(column['dtype']).itemsize)
+
+    def _write_index(self):
+        tmp = self.path / (_INDEX + '.tmp')
+        with open(str(tmp), 'w') as f:
+            json.dump(self._index, f)
+        os.replace(str(tmp), str(self.path / _INDEX))
+
+
+class _StoredDraws(Mapping):
+    """Read-only mapping of the draws of a store, by chain, read when used.
+
+    Parameters
+    ----------
+    store
+        Store holding the draws.
+    names
+        Names of the columns of the draws.
+    suffix
+        Suffix of their names in the store (``'__'`` for statistics).
+    """
+
+    def __init__(self, store: DrawStore, names: Sequence[str],
+                 suffix: str = ''):
+        self._store = store
+        self._names = list(names)
+        self._suffix = suffix
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        if name not in self._names:
+            raise KeyError(name)
+        return np.swapaxes(self._store.column(name + self._suffix), 0, 1)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._names)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+
+class StoredFit(DrawsFit):
+    """Draws of a fitted model, memory-mapped from a :class:`DrawStore`.
+
+    Draws are only read from disk when used, and :meth:`extract` returns
+    memory-mapped arrays without copying them (or decompressed arrays, for
+    compressed stores).
+
+    Parameters
+    ----------
+    store
+        Store holding the draws.
+    adaptation
+        Adapted ``'stepsize'`` and ``'inv_metric'`` of each chain.
+    """
+
+    def __init__(self, store: DrawStore,
+                 adaptation: Optional[List[Dict[str, Any]]] = None):
+        self.store = store
+        columns = store.index['columns']
+        draws = _StoredDraws(
+            store, [n for n in columns if not n.endswith('__')])
+        sample_stats = _StoredDraws(
+            store, [n[:-2] for n in columns if n.endswith('__')], '__')
+        super().__init__(
+            store.index['model'], draws, sample_stats,
+            adaptation or [{} for _ in range(store.index['n_chains'])])
+
+    def extract(self, pars: Optional[Sequence[str]] = None,
+                permuted: bool = True) -> 'OrderedDict[str, np.ndarray]':
+        """Extract the draws of each parameter (and ``lp__``).
+
+        Draws are memory-mapped, ordered by draw and then by chain.
+        """
+        columns = self.store.index['columns']
+        names = list(pars) if pars is not None else \
+            [n for n in columns if not n.endswith('__')] + ['lp__']
+        draws = OrderedDict()  # type: OrderedDict
+        for name in names:
+            if name in columns:
+                values = self.store.column(name)
+                draws[name] = values.reshape((-1,) + values.shape[2:])
+        return draws
+
+    def iter_draws(self, name: str, chunk_size: Optional[int] = None) \
+            -> Iterator[np.ndarray]:
+        """Iterate over the draws of a parameter (or ``lp__``) in chunks of
+        at most ``chunk_size`` draws, read sequentially from disk (each
+        chunk holds consecutive draws of all chains)."""
+        column = self.store.index['columns'][name]
+        chunk_size = chunk_size or _chunk_size(column['shape'])
+        step = max(chunk_size // self.n_chains, 1)
+        for values in self.store.chunks(name):
+            for i in range(0, len(values), step):
+                chunk = values[i:i + step]
+                yield chunk.reshape((-1,) + chunk.shape[2:])
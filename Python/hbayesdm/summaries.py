@@ -0,0 +1,327 @@
+"""Summaries of draws computed over chunks of draws, in bounded memory.
+
+Draws are read in chunks (e.g., chain by chain), so that summaries of large
+quantities, such as model-based regressors of shape ``(N, T)``, never need
+all their draws in memory at once. Means and variances are exact, updated
+with the parallel algorithm of Chan et al. Quantiles and highest density
+intervals (HDIs) are exact as long as the draws fit in :data:`EXACT_LIMIT`
+values; otherwise, the draws are read a second time to fill a histogram of
+each element between its minimum and maximum, with as many bins as fit in
+the same number of values, from which they are approximated.
+"""
+import re
+from collections import OrderedDict
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+__all__ = ['EXACT_LIMIT', 'ChoiceProportions', 'DrawSummary',
+           'parse_statistics', 'summarize']
+
+#: Number of values kept in memory to compute exact quantiles.
+EXACT_LIMIT = 2 ** 24
+
+_RE_STATISTIC = re.compile(r'^(mean|sd|median|q(\d+(?:\.\d*)?)|'
+                           r'hdi(\d+(?:\.\d*)?))$')
+
+# Bounds on the number of bins of the histograms of approximate quantiles
+_MIN_BINS, _MAX_BINS = 64, 4096
+
+# Number of intervals compared to approximate each HDI
+_HDI_GRID = 200
+
+# Largest number of distinct choices whose proportions are counted
+_MAX_CHOICES = 32
+
+
+def parse_statistics(statistics: Sequence[str]) \
+        -> List[Tuple[str, str, Optional[float]]]:
+    """Parse the names of summary statistics.
+
+    Parameters
+    ----------
+    statistics
+        Names of statistics: ``'mean'``, ``'sd'``, ``'median'``, quantiles
+        as percentages (e.g., ``'q2.5'``, ``'q97.5'``), and highest density
+        intervals with their probability mass (e.g., ``'hdi95'``).
+
+    Returns
+    -------
+    List[Tuple]
+        Name, kind (``'mean'``, ``'sd'``, ``'quantile'`` or ``'hdi'``) and
+        probability of each statistic.
+    """
+    parsed = []
+    for name in statistics:
+        m = _RE_STATISTIC.match(str(name))
+        if m is None:
+            raise RuntimeError(
+                'Unknown summary statistic: %r (available: \'mean\', '
+                '\'sd\', \'median\', \'q<percent>\', \'hdi<percent>\')'
+                % (name,))
+        if m.group(1) in ('mean', 'sd'):
+            parsed.append((name, m.group(1), None))
+        elif m.group(1) == 'median':
+            parsed.append((name, 'quantile', 0.5))
+        else:
+            prob = float(m.group(2) or m.group(3)) / 100
+            if not 0 < prob < 1:
+                raise RuntimeError(
+                    'The percentage of %r should be between 0 and 100.'
+                    % (name,))
+            parsed.append((name, 'quantile' if m.group(2) else 'hdi', prob))
+    return parsed
+
+
+def _as_float(chunk: np.ndarray) -> np.ndarray:
+    """Convert draws to floats, with ``NaN`` for masked values (e.g., of
+    missing trials)."""
+    if isinstance(chunk, np.ma.MaskedArray):
+        return np.ma.filled(chunk.astype(float), np.nan)
+    return np.asarray(chunk, dtype=float)
+
+
+def _exact_hdi(draws: np.ndarray, prob: float) \
+        -> Tuple[np.ndarray, np.ndarray]:
+    """Narrowest interval holding ``prob`` of the draws (of each element)."""
+    draws = np.sort(draws, axis=0)
+    width = int(np.floor(prob * len(draws)))
+    lower = np.argmin(draws[width:] - draws[:len(draws) - width],
+                      axis=0)[None]
+    return (np.take_along_axis(draws, lower, 0)[0],
+            np.take_along_axis(draws, lower + width, 0)[0])
+
+
+class DrawSummary(object):
+    """Summary statistics of the draws of a quantity, updated by chunks.
+
+    Chunks of draws are given to :meth:`update`. If :attr:`needs_histogram`
+    is then true, the same chunks should be given again to
+    :meth:`update_histogram`, before calling :meth:`result`.
+
+    Parameters
+    ----------
+    statistics
+        Statistics to compute (see :func:`parse_statistics`).
+    exact_limit
+        Number of values kept in memory to compute exact quantiles.
+    """
+
+    def __init__(self, statistics: Sequence[str] = ('mean',),
+                 exact_limit: int = EXACT_LIMIT):
+        self.statistics = parse_statistics(statistics)
+        self.exact_limit = exact_limit
+        self._needs_draws = any(kind in ('quantile', 'hdi')
+                                for _, kind, _ in self.statistics)
+        self.count = 0
+        self._mean = None  # type: Optional[np.ndarray]
+        self._m2 = None  # type: Optional[np.ndarray]
+        self._min = None  # type: Optional[np.ndarray]
+        self._max = None  # type: Optional[np.ndarray]
+        self._kept = []  # type: Optional[List[np.ndarray]]
+        self._counts = None  # type: Optional[np.ndarray]
+
+    @property
+    def needs_histogram(self) -> bool:
+        """Whether the draws should be read again to approximate quantiles
+        (they did not fit in ``exact_limit`` values)."""
+        return self._needs_draws and self._kept is None
+
+    def update(self, chunk: np.ndarray):
+        """Add a chunk of draws, of shape ``(n_draws, *dims)`` (masked
+        values are taken as ``NaN``)."""
+        chunk = _as_float(chunk)
+        n = chunk.shape[0]
+        if n == 0:
+            return
+        mean = chunk.mean(axis=0)
+        m2 = ((chunk - mean) ** 2).sum(axis=0)
+        if self.count == 0:
+            self._mean, self._m2 = mean, m2
+            self._min, self._max = chunk.min(axis=0), chunk.max(axis=0)
+        else:
+            total = self.count + n
+            delta = mean - self._mean
+            self._mean = self._mean + delta * n / total
+            self._m2 = self._m2 + m2 + delta ** 2 * self.count * n / total
+            np.minimum(self._min, chunk.min(axis=0), out=self._min)
+            np.maximum(self._max, chunk.max(axis=0), out=self._max)
+        self.count += n
+
+        if self._needs_draws and self._kept is not None:
+            if self.count * chunk[0].size <= self.exact_limit:
+                self._kept.append(chunk)
+            else:
+                self._kept = None
+
+    def update_histogram(self, chunk: np.ndarray):
+        """Add a chunk of draws to the histograms (second reading)."""
+        chunk = _as_float(chunk)
+        size = self._min.size
+        if self._counts is None:
+            bins = int(np.clip(self.exact_limit // max(size, 1),
+                               _MIN_BINS, _MAX_BINS))
+            self._counts = np.zeros((size, bins), dtype=np.int64)
+        bins = self._counts.shape[1]
+        lo, width = self._bins()
+        index = np.clip(((chunk - lo) / width).astype(np.int64), 0, bins - 1)
+        index = index.reshape(len(chunk), -1) + \
+            np.arange(size, dtype=np.int64) * bins
+        self._counts += np.bincount(
+            index.ravel(), minlength=size * bins).reshape(size, bins)
+
+    def _bins(self) -> Tuple[np.ndarray, np.ndarray]:
+        bins = self._counts.shape[1]
+        width = (self._max - self._min) / bins
+        return self._min, np.where(width > 0, width, 1.0)
+
+    def _searchsorted(self, cdf: np.ndarray, targets: np.ndarray) \
+            -> np.ndarray:
+        """Index of the first bin whose cumulative count reaches each target,
+        for each element (row) at once."""
+        size, bins = cdf.shape
+        offsets = np.arange(size) * (self.count + 1.0)
+        index = np.searchsorted((cdf + offsets[:, None]).ravel(),
+                                (targets + offsets[:, None]).ravel())
+        return np.minimum(index.reshape(targets.shape) -
+                          (np.arange(size) * bins)[:, None], bins - 1)
+
+    def _approximate_quantiles(self, probs: np.ndarray) -> np.ndarray:
+        """Quantiles of each element (rows), interpolated within bins."""
+        counts = self._counts
+        cdf = np.cumsum(counts, axis=1)
+        target = np.broadcast_to(np.asarray(probs) * self.count,
+                                 (len(cdf), len(probs)))
+        b = self._searchsorted(cdf, target)
+        inside = np.take_along_axis(counts, b, 1)
+        before = np.take_along_axis(cdf, b, 1) - inside
+        fraction = np.clip((target - before) / np.maximum(inside, 1), 0, 1)
+        lo, width = self._bins()
+        return lo.reshape(-1, 1) + (b + fraction) * width.reshape(-1, 1)
+
+    def _approximate_hdi(self, prob: float) \
+            -> Tuple[np.ndarray, np.ndarray]:
+        # Narrowest of the intervals between the quantiles at ``p`` and
+        # ``p + prob``, over a grid of ``p``
+        lower = np.linspace(0, 1 - prob, _HDI_GRID)
+        lowers = self._approximate_quantiles(lower)
+        uppers = self._approximate_quantiles(lower + prob)
+        i = np.argmin(uppers - lowers, axis=1)[:, None]
+        shape = self._min.shape
+        return (np.take_along_axis(lowers, i, 1).reshape(shape),
+                np.take_along_axis(uppers, i, 1).reshape(shape))
+
+    def result(self) -> 'OrderedDict[str, np.ndarray]':
+        """Compute the statistics of the draws.
+
+        Returns
+        -------
+        OrderedDict
+            Value of each statistic; each HDI gives its ``'<name>_lower'``
+            and ``'<name>_upper'`` bounds.
+        """
+        if self.count == 0:
+            raise RuntimeError('No draws to summarize.')
+        if self.needs_histogram and self._counts is None:
+            raise RuntimeError('The draws should be read again to compute '
+                               'approximate quantiles.')
+        draws = np.concatenate(self._kept) if self._kept else None
+        result = OrderedDict()  # type: OrderedDict
+        for name, kind, prob in self.statistics:
+            if kind == 'mean':
+                result[name] = self._mean
+            elif kind == 'sd':
+                result[name] = np.sqrt(self._m2 / max(self.count - 1, 1))
+            elif kind == 'quantile':
+                result[name] = np.quantile(draws, prob, axis=0) \
+                    if draws is not None else \
+                    self._approximate_quantiles([prob]).reshape(
+                        self._min.shape)
+            else:
+                result[name + '_lower'], result[name + '_upper'] = \
+                    _exact_hdi(draws, prob) if draws is not None else \
+                    self._approximate_hdi(prob)
+        return result
+
+
+class ChoiceProportions(object):
+    """Proportions of each predicted choice per subject, updated by chunks.
+
+    Missing predictions (``NaN``) are ignored. Predictions which are not
+    integers, or which take more than ``max_choices`` distinct values (e.g.,
+    response times), are not counted.
+
+    Parameters
+    ----------
+    max_choices
+        Largest number of distinct choices to count.
+    """
+
+    def __init__(self, max_choices: int = _MAX_CHOICES):
+        self.max_choices = max_choices
+        self.discrete = True
+        self._counts = OrderedDict()  # type: OrderedDict
+        self._valid = None  # type: Optional[np.ndarray]
+
+    def update(self, chunk: np.ndarray):
+        """Add a chunk of predictions, of shape ``(n_draws, n_subjects,
+        ...)``."""
+        if not self.discrete:
+            return
+        chunk = _as_float(chunk)
+        chunk = chunk.reshape(chunk.shape[:2] + (-1,))
+        valid = ~np.isnan(chunk)
+        choices = np.unique(chunk[valid])
+        if np.any(choices != np.round(choices)) or \
+                len(set(self._counts).union(choices.astype(int).tolist())) \
+                > self.max_choices:
+            self.discrete = False
+            self._counts.clear()
+            return
+        n_valid = valid.sum(axis=(0, 2))
+        self._valid = n_valid if self._valid is None else \
+            self._valid + n_valid
+        for choice in choices:
+            n = (chunk == choice).sum(axis=(0, 2))
+            self._counts[int(choice)] = self._counts.get(int(choice), 0) + n
+
+    def result(self) -> 'Optional[OrderedDict[int, np.ndarray]]':
+        """Proportion of the predictions of each choice (in order), per
+        subject, or ``None`` if predictions are not discrete choices."""
+        if not self.discrete or self._valid is None:
+            return None
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return OrderedDict(
+                (choice, self._counts[choice] / self._valid)
+                for choice in sorted(self._counts))
+
+
+def summarize(read_chunks: Callable[[], Iterable[np.ndarray]],
+              statistics: Sequence[str] = ('mean',),
+              exact_limit: int = EXACT_LIMIT) \
+        -> 'OrderedDict[str, np.ndarray]':
+    """Compute summary statistics over chunks of draws.
+
+    Parameters
+    ----------
+    read_chunks
+        Function returning an iterable over chunks of draws, of shape
+        ``(n_draws, *dims)``. It is called a second time if the draws do not
+        fit in ``exact_limit`` values and quantiles are requested.
+    statistics
+        Statistics to compute (see :func:`parse_statistics`).
+    exact_limit
+        Number of values kept in memory to compute exact quantiles.
+
+    Returns
+    -------
+    OrderedDict
+        Value of each statistic, of shape ``dims``.
+    """
+    summary = DrawSummary(statistics, exact_limit)
+    for chunk in read_chunks():
+        summary.update(chunk)
+    if summary.needs_histogram:
+        for chunk in read_chunks():
+            summary.update_histogram(chunk)
+    return summary.result()
@@ -0,0 +1,780 @@
+"""Variants of the Stan programs shipped with hBayesDM.
+
+Every hierarchical Stan program computes, in its ``generated quantities``
+block, trial-level model regressors and posterior predictions on every draw,
+even when they are not requested. The *lean* variant of a program only keeps
+the ``log_lik`` and ``mu_*`` quantities: declarations and assignments of all
+the other generated quantities are removed, along with the local variables
+and statements that only served to compute them. The *params* variant only
+keeps the ``mu_*`` quantities, for fits whose other generated quantities are
+computed afterwards, on a subset of the draws.
+
+Variants are derived from the original programs with a small parser of
+the statements of the ``generated quantities`` block; the other blocks are
+left untouched.
+
+The programs are written in the syntax of Stan 2.19 (used by PyStan 2),
+part of which was removed in Stan 2.33: :func:`canonical_model_code`
+rewrites them (and their variants) for later versions.
+"""
+import re
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from typing import (Callable, Dict, List, Optional, Sequence, Set, Tuple,
+                    Union)
+
+__all__ = ['VARIANTS', 'canonical_model_code', 'lean_model_code',
+           'parameter_declarations', 'params_model_code',
+           'threaded_model_code', 'variant_model_code',
+           'variant_model_source']
+
+_RE_TOKEN = re.compile(
+    r'(?P<string>"[^"]*")'
+    r'|(?P<ident>[A-Za-z_][A-Za-z0-9_]*)'
+    r'|(?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?)'
+    r'|(?P<op>\.\*=|\./=|[+\-*/]=|==|!=|<=|>=|&&|\|\||\.\*|\./'
+    r"|[-+*/%^<>=!?:;,()\[\]{}'\\|~])"
+    r'|(?P<space>\s+)')
+
+_ASSIGN_OPS = {'=', '+=', '-=', '*=', '/=', '.*=', './='}
+
+_TYPES = {
+    'int', 'real', 'complex', 'vector', 'row_vector', 'matrix', 'simplex',
+    'ordered', 'positive_ordered', 'unit_vector', 'cov_matrix',
+    'corr_matrix', 'cholesky_factor_cov', 'cholesky_factor_corr', 'array',
+}
+
+
+class _Statement(object):
+    """A statement of a Stan program, with the names it declares and reads.
+
+    ``kind`` is one of ``'decl'``, ``'local'`` (declaration turned into a
+    local variable), ``'assign'``, ``'other'`` (simple statements),
+    ``'block'``, ``'for'``, ``'while'``, and ``'if'``.
+    """
+
+    def __init__(self, kind: str, text: str = '',
+                 target: Optional[str] = None,
+                 reads: Optional[Set[str]] = None,
+                 body: Optional[List['_Statement']] = None,
+                 orelse: Optional[List['_Statement']] = None):
+        self.kind = kind
+        self.text = text
+        self.target = target
+        self.reads = reads or set()
+        self.body = body
+        self.orelse = orelse
+        self.local_text = text
+        self.tokens = []  # type: List[str]
+        self.span = (0, 0)  # position in the parsed code
+
+
+def _strip_comments(code: str) -> str:
+    code = re.sub(r'/\*.*?\*/', ' ', code, flags=re.S)
+    return re.sub(r'(//|#(?!include)).*', '', code)
+
+
+def _tokenize(code: str) -> Tuple[List[str], List[Tuple[int, int]]]:
+    """Split Stan code into tokens, also returning their spans in the code."""
+    tokens = []
+    spans = []
+    pos = 0
+    while pos < len(code):
+        m = _RE_TOKEN.match(code, pos)
+        if m is None:
+            raise ValueError('Unexpected character in Stan code: ' +
+                             repr(code[pos:pos + 20]))
+        if m.lastgroup != 'space':
+            tokens.append(m.group())
+            spans.append(m.span())
+        pos = m.end()
+    return tokens, spans
+
+
+def _idents(tokens: Sequence[str]) -> Set[str]:
+    return {t for t in tokens if re.match(r'[A-Za-z_]', t)}
+
+
+class _Parser(object):
+    """Parse a sequence of Stan statements."""
+
+    def __init__(self, code: str):
+        self.code = code
+        self.tokens, self.spans = _tokenize(code)
+        self.pos = 0
+
+    def _text(self, start: int, end: int) -> str:
+        """Source of the tokens in [start, end), on a single line."""
+        code = self.code[self.spans[start][0]:self.spans[end - 1][1]]
+        return ' '.join(code.split())
+
+    def _balanced(self, open_: str, close: str) -> List[str]:
+        """Consume a balanced group starting at the current token."""
+        assert self.tokens[self.pos] == open_
+        depth = 0
+        start = self.pos
+        while True:
+            tok = self.tokens[self.pos]
+            self.pos += 1
+            if tok == open_:
+                depth += 1
+            elif tok == close:
+                depth -= 1
+                if depth == 0:
+                    return self.tokens[start:self.pos]
+
+    def statements(self) -> List[_Statement]:
+        stmts = []
+        while self.pos < len(self.tokens) and self.tokens[self.pos] != '}':
+            stmts.append(self.statement())
+        return stmts
+
+    def body(self) -> List[_Statement]:
+        stmt = self.statement()
+        return stmt.body if stmt.kind == 'block' else [stmt]
+
+    def statement(self) -> _Statement:
+        begin = self.spans[self.pos][0]
+        stmt = self._statement()
+        stmt.span = (begin, self.spans[self.pos - 1][1])
+        return stmt
+
+    def _statement(self) -> _Statement:
+        tok = self.tokens[self.pos]
+        if tok == '{':
+            self.pos += 1
+            body = self.statements()
+            self.pos += 1  # '}'
+            return _Statement('block', body=body)
+        if tok in ('for', 'while'):
+            self.pos += 1
+            start = self.pos
+            header = self._balanced('(', ')')
+            text = tok + ' ' + self._text(start, self.pos)
+            stmt = _Statement(tok, text=text, reads=_idents(header),
+                              body=self.body())
+            stmt.tokens = header
+            return stmt
+        if tok == 'if':
+            self.pos += 1
+            start = self.pos
+            cond = self._balanced('(', ')')
+            text = 'if ' + self._text(start, self.pos)
+            body = self.body()
+            orelse = None
+            if self.pos < len(self.tokens) and self.tokens[self.pos] == 'else':
+                self.pos += 1
+                orelse = self.body()
+            return _Statement('if', text=text,
+                              reads=_idents(cond), body=body, orelse=orelse)
+        return self.simple()
+
+    def simple(self) -> _Statement:
+        start = self.pos
+        depth = 0
+        while True:
+            tok = self.tokens[self.pos]
+            self.pos += 1
+            if tok in '([{':
+                depth += 1
+            elif tok in ')]}':
+                depth -= 1
+            elif tok == ';' and depth == 0:
+                break
+        tokens = self.tokens[start:self.pos]
+        text = self._text(start, self.pos)
+
+        if tokens[0] in _TYPES:
+            # Skip the type(s), with their constraints and dimensions
+            i = 0
+            constraints = []
+            while tokens[i] in _TYPES or tokens[i] in ('<', '['):
+                if tokens[i] in _TYPES:
+                    i += 1
+                    continue
+                close = '>' if tokens[i] == '<' else ']'
+                begin = i
+                depth = 0
+                while True:
+                    if tokens[i] in ('<', '[', '('):
+                        depth += 1
+                    elif tokens[i] in ('>', ']', ')'):
+                        depth -= 1
+                    i += 1
+                    if depth == 0 and tokens[i - 1] == close:
+                        break
+                if close == '>':
+                    constraints.append((begin, i))
+            stmt = _Statement('decl', text=text, target=tokens[i],
+                              reads=_idents(tokens[:i] + tokens[i + 1:]))
+            # Local variables cannot have constraints
+            pieces = []
+            begin = 0
+            for c_begin, c_end in constraints + [(len(tokens), None)]:
+                if c_begin > begin:
+                    pieces.append(self._text(start + begin, start + c_begin))
+                begin = c_end
+            stmt.local_text = ' '.join(pieces)
+            stmt.tokens = tokens
+            return stmt
+
+        depth = 0
+        for tok in tokens:
+            if tok in '([':
+                depth += 1
+            elif tok in ')]':
+                depth -= 1
+            elif tok in _ASSIGN_OPS and depth == 0:
+                # Updating a variable does not make it needed by itself
+                stmt = _Statement('assign', text=text, target=tokens[0],
+                                  reads=_idents(tokens[1:]) - {tokens[0]})
+                break
+        else:
+            stmt = _Statement('other', text=text, reads=_idents(tokens))
+        stmt.tokens = tokens
+        return stmt
+
+
+def _walk(stmts: List[_Statement]):
+    """Iterate over statements, and the statements nested in them."""
+    for stmt in stmts:
+        yield stmt
+        for sub in (stmt.body, stmt.orelse):
+            if sub:
+                yield from _walk(sub)
+
+
+def _is_needed(stmt: _Statement, live: Set[str]) -> bool:
+    """Whether a statement contributes to the live variables."""
+    if stmt.kind in ('decl', 'local', 'assign'):
+        return stmt.target in live
+    if stmt.kind == 'other':
+        return True  # e.g., break, continue, print, reject
+    return any(_is_needed(sub, live)
+               for sub in (stmt.body or []) + (stmt.orelse or []))
+
+
+def _live_names(stmts: List[_Statement], kept: Set[str]) -> Set[str]:
+    """Find the variables needed to compute the kept ones."""
+    live = set(kept)
+
+    def reads(stmts):
+        names = set()  # type: Set[str]
+        for stmt in stmts:
+            if _is_needed(stmt, live):
+                names |= stmt.reads
+                names |= reads((stmt.body or []) + (stmt.orelse or []))
+        return names
+
+    while True:
+        names = reads(stmts)
+        if names <= live:
+            return live
+        live |= names
+
+
+def _prune(stmts: List[_Statement], live: Set[str]) -> List[_Statement]:
+    """Remove the statements that do not contribute to the live variables."""
+    out = []
+    for stmt in stmts:
+        if not _is_needed(stmt, live):
+            continue
+        if stmt.body is not None:
+            stmt.body = _prune(stmt.body, live)
+        if stmt.orelse is not None:
+            stmt.orelse = _prune(stmt.orelse, live) or None
+        out.append(stmt)
+    return out
+
+
+def _render(stmts: List[_Statement], indent: int) -> List[str]:
+    pad = '  ' * indent
+    lines = []
+    for stmt in stmts:
+        if stmt.kind == 'block':
+            lines += [pad + '{'] + _render(stmt.body, indent + 1) + [pad + '}']
+        elif stmt.kind in ('for', 'while', 'if'):
+            lines += [pad + stmt.text + ' {']
+            lines += _render(stmt.body, indent + 1)
+            if stmt.orelse:
+                lines += [pad + '} else {']
+                lines += _render(stmt.orelse, indent + 1)
+            lines += [pad + '}']
+        elif stmt.kind == 'local':
+            lines.append(pad + stmt.local_text)
+        else:
+            lines.append(pad + stmt.text)
+    return lines
+
+
+def _find_block(code: str, name: str) -> Optional[tuple]:
+    """Find the span of the body of a program block (e.g., 'model')."""
+    m = re.search(r'^\s*' + re.escape(name) + r'\s*\{', code, re.M)
+    if m is None:
+        return None
+    depth = 0
+    for i in range(m.end() - 1, len(code)):
+        if code[i] == '{':
+            depth += 1
+        elif code[i] == '}':
+            depth -= 1
+            if depth == 0:
+                return m.end(), i
+    raise ValueError('Unbalanced braces in block: ' + name)
+
+
+def parameter_declarations(code: str) -> 'OrderedDict[str, Set[str]]':
+    """List the parameters declared in the parameters block of a program.
+
+    Parameters
+    ----------
+    code
+        Stan program.
+
+    Returns
+    -------
+    OrderedDict
+        Names of the parameters, mapped to the names their declarations
+        depend on (e.g., ``{'mu_pr': set(), 'A_pr': {'N'}}``).
+    """
+    declarations = OrderedDict()  # type: OrderedDict
+    code = _strip_comments(code)
+    span = _find_block(code, 'parameters')
+    if span is not None:
+        for stmt in _Parser(code[span[0]:span[1]]).statements():
+            if stmt.kind == 'decl':
+                declarations[stmt.target] = stmt.reads - _TYPES - \
+                    {'lower', 'upper', 'offset', 'multiplier'}
+    return declarations
+
+
+def strip_generated_quantities(code: str,
+                               keep: Callable[[str], bool]) -> Optional[str]:
+    """Remove generated quantities that are not needed from a Stan program.
+
+    Parameters
+    ----------
+    code
+        Stan program.
+    keep
+        Function telling whether a generated quantity (given by its name)
+        should be kept.
+
+    Returns
+    -------
+    str
+        The program without the other generated quantities, and without the
+        local variables and statements that only served to compute them.
+        Removed quantities still needed by the kept ones are computed as
+        local variables. ``None`` if nothing can be removed.
+    """
+    code = _strip_comments(code)
+    span = _find_block(code, 'generated quantities')
+    if span is None:
+        return None
+
+    parser = _Parser(code[span[0]:span[1]])
+    stmts = parser.statements()
+
+    outputs = {s.target for s in stmts if s.kind == 'decl'}
+    dropped = {name for name in outputs if not keep(name)}
+    if not dropped:
+        return None
+
+    # Dropped quantities become local variables of a block wrapping all the
+    # statements, then statements not contributing to the kept quantities
+    # are removed.
+    decls = [s for s in stmts if s.kind == 'decl' and s.target not in dropped]
+    local = [s for s in stmts if s.kind == 'decl' and s.target in dropped]
+    block = _Statement('block', body=local + [
+        s for s in stmts if s.kind != 'decl'])
+    for stmt in local:
+        stmt.kind = 'local'
+    live = _live_names(block.body, outputs - dropped)
+    block.body = _prune(block.body, live)
+
+    body = '\n'.join(_render(decls + [block], 1))
+    return code[:span[0]] + '\n' + body + '\n' + code[span[1]:]
+
+
+def lean_model_code(code: str) -> Optional[str]:
+    """Return the lean variant of a Stan program.
+
+    Its generated quantities only compute ``log_lik`` and the ``mu_*``
+    parameters.
+
+    Parameters
+    ----------
+    code
+        Stan program.
+
+    Returns
+    -------
+    str
+        Stan program of the variant, or ``None`` if the program has no other
+        generated quantities (or they cannot be removed safely).
+    """
+    return strip_generated_quantities(
+        code, lambda name: name == 'log_lik' or name.startswith('mu_'))
+
+
+def params_model_code(code: str) -> Optional[str]:
+    """Return the params variant of a Stan program.
+
+    Its generated quantities only compute the ``mu_*`` parameters: the other
+    ones (``log_lik`` included) are computed afterwards from a subset of the
+    draws, by the generated quantities of the original (or lean) program
+    (see ``gq_thin``).
+
+    Parameters
+    ----------
+    code
+        Stan program.
+
+    Returns
+    -------
+    str
+        Stan program of the variant, or ``None`` if the program has no other
+        generated quantities (or they cannot be removed safely).
+    """
+    return strip_generated_quantities(
+        code, lambda name: name.startswith('mu_'))
+
+
+_DISCRETE = {
+    'bernoulli', 'bernoulli_logit', 'binomial', 'binomial_logit',
+    'beta_binomial', 'hypergeometric', 'categorical', 'categorical_logit',
+    'discrete_range', 'ordered_logistic', 'ordered_probit', 'neg_binomial',
+    'neg_binomial_2', 'neg_binomial_2_log', 'poisson', 'poisson_log',
+    'multinomial', 'multinomial_logit',
+}
+
+_ARG_TYPES = {
+    'int': 'int', 'real': 'real', 'complex': 'complex',
+    'vector': 'vector', 'simplex': 'vector', 'ordered': 'vector',
+    'positive_ordered': 'vector', 'unit_vector': 'vector',
+    'row_vector': 'row_vector', 'matrix': 'matrix', 'cov_matrix': 'matrix',
+    'corr_matrix': 'matrix', 'cholesky_factor_cov': 'matrix',
+    'cholesky_factor_corr': 'matrix',
+}
+
+
+def _skip_group(tokens: Sequence[str], i: int) -> Tuple[int, int]:
+    """Skip a bracketed group, returning its end and its number of items."""
+    depth = 0
+    items = 1
+    while True:
+        if tokens[i] in ('<', '[', '('):
+            depth += 1
+        elif tokens[i] in ('>', ']', ')'):
+            depth -= 1
+            if depth == 0:
+                return i + 1, items
+        elif tokens[i] == ',' and depth == 1:
+            items += 1
+        i += 1
+
+
+def _arg_type(stmt: _Statement) -> str:
+    """Type of a function argument taking a declared variable."""
+    tokens = stmt.tokens
+    dims = 0
+    i = 0
+    if tokens[0] == 'array':
+        i, dims = _skip_group(tokens, 1)
+    base = _ARG_TYPES[tokens[i]]
+    name = tokens.index(stmt.target, i + 1)
+    if tokens[name + 1] == '[':
+        dims += _skip_group(tokens, name + 1)[1]
+    if dims:
+        return 'array[%s] %s' % (',' * (dims - 1), base)
+    return base
+
+
+def _declarations(code: str, blocks: Sequence[str]) -> Dict[str, str]:
+    """Argument types of the variables declared in some program blocks."""
+    types = {}  # type: Dict[str, str]
+    for block in blocks:
+        span = _find_block(code, block)
+        if span is not None:
+            for stmt in _Parser(code[span[0]:span[1]]).statements():
+                if stmt.kind == 'decl':
+                    types[stmt.target] = _arg_type(stmt)
+    return types
+
+
+def _increment_log_prob(stmts: List[_Statement], code: str) -> bool:
+    """Turn sampling statements and ``target +=`` into ``lp +=``.
+
+    Returns ``False`` if a sampling statement cannot be rewritten (e.g., it
+    is truncated).
+    """
+    for stmt in _walk(stmts):
+        if '~' in stmt.tokens:
+            m = re.match(r'(.*?)\s*~\s*(\w+)\s*\((.*)\)\s*;$', stmt.text)
+            if m is None:
+                return False
+            lhs, dist, args = m.groups()
+            discrete = dist in _DISCRETE or \
+                re.search(r'\b' + dist + r'_lpmf\b', code)
+            stmt.text = 'lp += %s_%s(%s%s);' % (
+                dist, 'lupmf' if discrete else 'lupdf', lhs,
+                ' | ' + args if args.strip() else '')
+        elif stmt.kind == 'assign' and stmt.target == 'target':
+            stmt.text = 'lp' + stmt.text[len('target'):]
+    return True
+
+
+def threaded_model_code(code: str) -> Optional[str]:
+    """Return the threaded variant of a Stan program.
+
+    The loop over subjects of its model block is moved into a partial sum
+    function, and its log density is accumulated with ``reduce_sum``, so that
+    subjects are processed in parallel by ``threads_per_chain`` threads
+    (requires Stan 2.26 or later, built with threading support).
+
+    Parameters
+    ----------
+    code
+        Stan program.
+
+    Returns
+    -------
+    str
+        Stan program of the variant, or ``None`` if its model block has no
+        loop over subjects (``for (i in 1:N)``) that can be parallelized.
+    """
+    code = _strip_comments(code)
+    span = _find_block(code, 'model')
+    if span is None:
+        return None
+    model = code[span[0]:span[1]]
+
+    types = _declarations(code, ['data', 'transformed data', 'parameters',
+                                 'transformed parameters'])
+    loop = None
+    for stmt in _Parser(model).statements():
+        if stmt.kind == 'decl':
+            types[stmt.target] = _arg_type(stmt)
+        elif stmt.kind == 'for' and len(stmt.tokens) == 7 and \
+                stmt.tokens[2:6] == ['in', '1', ':', 'N']:
+            loop = stmt
+            break
+    if loop is None:
+        return None
+
+    # Subjects should only contribute to the log density
+    stmts = list(_walk(loop.body))
+    local = {s.target for s in stmts if s.kind == 'decl'}
+    if any(s.kind == 'assign' and s.target not in local | {'target'}
+           for s in stmts):
+        return None
+    reads = set()  # type: Set[str]
+    for stmt in stmts:
+        reads |= stmt.reads
+    new_names = {'partial_sum', 'subj_slice', 'start', 'end', 'lp',
+                 'subj_idx', 'grainsize'}
+    if new_names & (set(types) | reads):
+        return None
+    shared = [name for name in types if name in reads and name not in local]
+
+    if not _increment_log_prob(loop.body, code):
+        return None
+    function = '\n'.join(
+        ['  real partial_sum_lpmf(array[] int subj_slice, int start, int end'
+         + ''.join(',\n                        %s %s' % (types[n], n)
+                   for n in shared) + ') {',
+         '    real lp = 0;',
+         '    for (%s in start:end) {' % loop.tokens[1]]
+        + _render(loop.body, 3)
+        + ['    }', '    return lp;', '  }', ''])
+    call = 'target += reduce_sum(partial_sum_lupmf, subj_idx, grainsize%s);' \
+        % ''.join(',\n                       ' + n for n in shared)
+    indices = '\n'.join([
+        '  array[N] int subj_idx = linspaced_int_array(N, 1, N);',
+        '  int grainsize = 1;', ''])
+
+    # Edit the program from its end, so that the positions remain valid
+    code = code[:span[0]] + model[:loop.span[0]] + call + \
+        model[loop.span[1]:] + code[span[1]:]
+    tdata = _find_block(code, 'transformed data')
+    if tdata is not None:
+        code = code[:tdata[0]] + '\n' + indices + code[tdata[0]:]
+    else:
+        end = _find_block(code, 'data')[1] + 1
+        code = code[:end] + '\n\ntransformed data {\n' + indices + '}' + \
+            code[end:]
+    functions = _find_block(code, 'functions')
+    if functions is not None:
+        code = code[:functions[1]] + function + code[functions[1]:]
+    else:
+        start = re.search(r'^data\s*\{', code, re.M).start()
+        code = code[:start] + 'functions {\n' + function + '}\n\n' + \
+            code[start:]
+    return code
+
+
+#: Functions removed in Stan 2.33, and the functions replacing them.
+_RENAMED_FUNCTIONS = {
+    'fabs': 'abs',
+    'multiply_log': 'lmultiply',
+    'binomial_coefficient_log': 'lchoose',
+    'cov_exp_quad': 'gp_exp_quad_cov',
+}
+
+_RE_DENSITY = re.compile(r'\w+_(lpdf|lupdf|lpmf|lupmf|cdf|lcdf|lccdf)$')
+
+
+def _canonical_statements(code: str) -> str:
+    """Rewrite the array declarations and removed functions of Stan code
+    without ``#include`` directives."""
+    tokens, spans = _tokenize(code)
+    edits = []  # type: List[Tuple[int, int, str]]
+    i = 0
+    while i < len(tokens):
+        tok = tokens[i]
+        if tok in _RENAMED_FUNCTIONS and tokens[i + 1:i + 2] == ['(']:
+            edits.append(spans[i] + (_RENAMED_FUNCTIONS[tok],))
+        elif _RE_DENSITY.match(tok) and tokens[i + 1:i + 2] == ['('] and \
+                tokens[i - 1] not in _TYPES | {'void'}:
+            # Calls of densities and CDFs: normal_cdf(x, mu, sigma) ->
+            # normal_cdf(x | mu, sigma)
+            depth = 0
+            for j in range(i + 1, len(tokens)):
+                if tokens[j] in ('(', '[', '{'):
+                    depth += 1
+                elif tokens[j] in (')', ']', '}'):
+                    depth -= 1
+                if depth == 0 or depth == 1 and tokens[j] == '|':
+                    break
+                if depth == 1 and tokens[j] == ',':
+                    edits.append(spans[j] + (' |',))
+                    break
+        elif tok in _TYPES and tok != 'array' and \
+                tokens[i + 1:i + 2] == ['[']:
+            # Array types of function arguments and returns: real[ , ]
+            end, dims = _skip_group(tokens, i + 1)
+            if set(tokens[i + 2:end - 1]) <= {','}:
+                edits.append((spans[i][0], spans[end - 1][1],
+                              'array[%s] %s' % (',' * (dims - 1), tok)))
+                i = end
+                continue
+        if tok in _TYPES and tok != 'array' and \
+                (i == 0 or tokens[i - 1] in ('{', '}', ';')):
+            # Declarations: int<lower=1> Tsubj[N] -> array[N] int<...> Tsubj
+            name = i + 1
+            while name < len(tokens) and tokens[name] in ('<', '['):
+                name = _skip_group(tokens, name)[0]
+            if tokens[name + 1:name + 2] == ['[']:
+                end = _skip_group(tokens, name + 1)[0]
+                dims = code[spans[name + 1][1]:spans[end - 1][0]]
+                edits.append((spans[i][0], spans[end - 1][1], '%s %s %s' % (
+                    'array[' + ' '.join(dims.split()) + ']',
+                    code[spans[i][0]:spans[name - 1][1]], tokens[name])))
+                i = end
+                continue
+        i += 1
+    for begin, end, text in reversed(edits):
+        code = code[:begin] + text + code[end:]
+    return code
+
+
+@lru_cache(maxsize=None)
+def canonical_model_code(code: str) -> str:
+    """Return a Stan program in the syntax of Stan 2.33 and later.
+
+    Arrays declared with their dimensions after the name of the variable
+    (``real x[N, T]``), array types of function arguments (``real[]``),
+    functions renamed since (e.g., ``fabs``), and densities and CDFs called
+    without a vertical bar after their first argument were removed in Stan
+    2.33. They are rewritten in the current syntax (``array[N, T] real x``),
+    which Stan accepts since version 2.26. Comments are removed.
+
+    Parameters
+    ----------
+    code
+        Stan program.
+
+    Returns
+    -------
+    str
+        Stan program in the current syntax.
+    """
+    pieces = re.split(r'^([ \t]*#include.*)$', _strip_comments(code),
+                      flags=re.M)
+    return ''.join(piece if i % 2 else _canonical_statements(piece)
+                   for i, piece in enumerate(pieces))
+
+
+#: Transformations producing each variant from the original Stan program.
+#: Variants can be combined with ``+`` (e.g., ``'lean+threaded'``).
+VARIANTS = {
+    'lean': lean_model_code,
+    'params': params_model_code,
+    'threaded': threaded_model_code,
+}  # type: Dict[str, Callable[[str], Optional[str]]]
+
+
+def variant_model_source(model_path: Union[str, Path], variant: str) \
+        -> Tuple[Optional[str], Optional[str]]:
+    """Return the variant of a model actually derived, and its Stan program.
+
+    Transformations leaving the program unchanged (e.g., ``threaded`` for
+    models without a loop over subjects) are left out of the variant, so that
+    e.g. ``'lean+threaded'`` is the ``'lean'`` variant of such models.
+
+    Parameters
+    ----------
+    model_path
+        Path to the original ``.stan`` file.
+    variant
+        Name of the variant (one of :data:`VARIANTS`, or several of them
+        joined by ``+``).
+
+    Returns
+    -------
+    variant
+        Transformations applied, joined by ``+``, or ``None`` if the variant
+        is no different from the original program.
+    code
+        Stan program of the variant, or ``None`` if it is no different from
+        the original program.
+    """
+    names = variant.split('+')
+    unknown = [name for name in names if name not in VARIANTS]
+    if unknown:
+        raise RuntimeError('Unknown model variant: ' + repr(variant))
+
+    with open(str(model_path), 'r') as f:
+        code = f.read()
+    applied = []
+    for name in names:
+        transformed = VARIANTS[name](code)
+        if transformed is not None and transformed != code:
+            applied.append(name)
+            code = transformed
+    if not applied:
+        return None, None
+    return '+'.join(applied), code
+
+
+def variant_model_code(model_path: Union[str, Path],
+                       variant: str) -> Optional[str]:
+    """Return the Stan program of a variant of a model.
+
+    Parameters
+    ----------
+    model_path
+        Path to the original ``.stan`` file.
+    variant
+        Name of the variant (one of :data:`VARIANTS`, or several of them
+        joined by ``+``).
+
+    Returns
+    -------
+    str
+        Stan program of the variant, or ``None`` if the variant is no
+        different from the original program.
+    """
+    return variant_model_source(model_path, variant)[1]
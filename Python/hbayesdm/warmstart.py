@@ -0,0 +1,126 @@
+"""Warm starts: seeding a fit with the adaptation of a previous fit.
+
+The *adaptation* of a fit holds, for each chain, the step size and the
+inverse metric (mass matrix) adapted during warm-up, along with the last draw
+of the parameters. A new fit of the same model, on data of the same
+dimensions (e.g., the same number of subjects), can start from them and only
+needs a short warm-up.
+"""
+import json
+import warnings
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+
+from hbayesdm.backends import _to_json
+
+__all__ = ['chains_from_json', 'load_adaptation', 'save_adaptation',
+           'warm_start']
+
+
+def save_adaptation(path: Union[str, Path], model: str,
+                    adaptation: List[Dict[str, Any]], dims: Dict[str, int]):
+    """Save the adaptation of a fit to a JSON file.
+
+    Parameters
+    ----------
+    path
+        Path of the file to write.
+    model
+        Full name of the model (e.g., ``'ra_prospect'``).
+    adaptation
+        ``'stepsize'``, ``'inv_metric'`` and ``'init'`` (last draw of the
+        parameters) of each chain.
+    dims
+        Data values defining the dimensions of the parameters (e.g., ``N``).
+    """
+    with open(str(path), 'w') as f:
+        json.dump(_to_json(OrderedDict([
+            ('model', model),
+            ('dims', dims),
+            ('chains', adaptation),
+        ])), f)
+
+
+def chains_from_json(chains: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Convert the adaptation of each chain, as read from JSON."""
+    return [OrderedDict([
+        ('stepsize', float(chain['stepsize'])),
+        ('inv_metric', np.asarray(chain['inv_metric'], dtype=float)),
+        ('init', OrderedDict((k, np.asarray(v))
+                             for k, v in chain['init'].items())),
+    ]) for chain in chains]
+
+
+def load_adaptation(source: Union[str, Path, Any]) -> Dict[str, Any]:
+    """Load the adaptation of a previous fit.
+
+    Parameters
+    ----------
+    source
+        A fitted ``TaskModel``, or the path of a file written by
+        ``TaskModel.save_adaptation``.
+
+    Returns
+    -------
+    Dict
+        ``'model'``, ``'dims'`` and ``'chains'`` (the adaptation of each
+        chain, with arrays as NumPy arrays).
+    """
+    if isinstance(source, (str, Path)):
+        with open(str(source), 'r') as f:
+            saved = json.load(f)
+        try:
+            return {'model': saved['model'], 'dims': saved['dims'],
+                    'chains': chains_from_json(saved['chains'])}
+        except (KeyError, TypeError, ValueError):
+            raise RuntimeError('Invalid adaptation file: ' + str(source))
+
+    adaptation = getattr(source, 'adaptation', None)
+    if adaptation is None:
+        raise RuntimeError(
+            '\'adaptation_from\' should be a model fitted with MCMC, or the '
+            'path of a file written by TaskModel.save_adaptation.')
+    return {'model': source.model, 'dims': source.adaptation_dims,
+            'chains': adaptation}
+
+
+def warm_start(source: Any, model: str, dims: Dict[str, int],
+               nchain: int) -> Optional[List[Dict[str, Any]]]:
+    """Prepare the adaptation of each chain of a new fit from a previous fit.
+
+    Parameters
+    ----------
+    source
+        See :func:`load_adaptation`.
+    model
+        Full name of the model to fit.
+    dims
+        Data values defining the dimensions of the parameters in the new fit.
+    nchain
+        Number of chains of the new fit; the chains of the previous fit are
+        reused in turn if there are fewer of them.
+
+    Returns
+    -------
+    List[Dict]
+        Adaptation of each chain, or ``None`` if the previous fit cannot
+        be used (with a warning).
+    """
+    previous = load_adaptation(source)
+    if previous['model'] != model:
+        raise RuntimeError(
+            'Cannot reuse the adaptation of %s to fit %s.'
+            % (previous['model'], model))
+    if dict(previous['dims']) != dict(dims):
+        warnings.warn(
+            'The adaptation of the previous fit is not used, since the '
+            'dimensions of the parameters have changed (%s, now %s).'
+            % (dict(previous['dims']), dict(dims)),
+            RuntimeWarning, stacklevel=1)
+        return None
+    chains = previous['chains']
+    return [OrderedDict((k, v) for k, v in chains[c % len(chains)].items())
+            for c in range(nchain)]
@@ -73,6 +73,9 @@ setup(
         'matplotlib',
         'arviz',
     ],
+    entry_points={
+        'console_scripts': ['hbayesdm = hbayesdm.cli:main'],
+    },
     zip_safe=False,
     include_package_data=True,
 )
@@ -0,0 +1,12 @@
+import pytest
+
+from hbayesdm.backends import BACKENDS, get_backend
+
+
+@pytest.fixture(params=list(BACKENDS))
+def backend(request):
+    """Run a test with each backend (CmdStan only if installed)."""
+    if request.param != 'pystan' and \
+            not get_backend(request.param).available():
+        pytest.skip('%s is not installed' % request.param)
+    return request.param
@@ -3,9 +3,10 @@ import pytest
 from hbayesdm.models import alt_delta
 
 
-def test_alt_delta():
+def test_alt_delta(backend):
     _ = alt_delta(
-        data="example", niter=10, nwarmup=5, nchain=1, ncore=1)
+        data="example", niter=10, nwarmup=5, nchain=1, ncore=1,
+        backend=backend)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,258 @@
+import json
+import sys
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+
+from hbayesdm.backends import (CmdStanBackend, CmdStanFit, DrawsFit,
+                               PyStanBackend, _write_stan_csv, get_backend,
+                               read_stan_csv, to_inference_data)
+from hbayesdm.base import PATH_STAN, load_stan_model
+from hbayesdm.cache import registry
+
+# A stand-in for the executables compiled by CmdStan, which writes
+# ``mu_pr`` (set to the sum of ``x``) and ``y`` (a 2x2 matrix) to its output,
+# or ``z`` (twice ``mu_pr``) for each of the ``fitted_params``, which should
+# have the settings and all the columns of its output (as CmdStan checks)
+FAKE_MODEL = '''#!{python}
+import csv, json, sys
+args = dict(a.split('=', 1) for a in sys.argv[1:] if '=' in a)
+with open(sys.argv[sys.argv.index('data') + 1].split('=', 1)[1]) as f:
+    x = sum(json.load(f)['x'])
+n = int(args.get('num_samples', 3))
+columns = 'lp__,accept_stat__,mu_pr.1,y.1.1,y.2.1,y.1.2,y.2.2'
+if args.get('method') == 'generate_quantities':
+    with open(args['fitted_params']) as f:
+        lines = f.read().splitlines()
+    rows = [line for line in lines if not line.startswith('#')]
+    if rows[0] != columns or \\
+            '#     num_samples = %d' % (len(rows) - 1) not in lines:
+        sys.exit('Mismatch between model and fitted_parameters csv file')
+    mu = [float(row['mu_pr.1']) for row in csv.DictReader(rows)]
+    with open(sys.argv[sys.argv.index('output') + 1].split('=', 1)[1],
+              'w') as f:
+        f.write('mu_pr.1,z\\n')
+        f.writelines('%g,%g\\n' % (m, 2 * m) for m in mu)
+    sys.exit()
+with open(sys.argv[sys.argv.index('output') + 1].split('=', 1)[1], 'w') as f:
+    f.write('# model = fake\\n#     num_samples = %d\\n' % n)
+    f.write(columns + '\\n')
+    if args.get('method') == 'sample':
+        f.write('# Adaptation terminated\\n# Step size = 0.5\\n')
+        f.write('# Diagonal elements of inverse mass matrix:\\n# 1, 2\\n')
+    for i in range(n + 1):
+        f.write('%d,0.9,%g,11,21,12,22\\n' % (-i, x + i))
+    f.write('# Elapsed Time: 0.1 seconds\\n')
+'''
+
+# Records the last program compiled to ``compiled.stan``
+MAKEFILE = '''CMDSTAN_VERSION := {version}
+MAKEFLAGS += -r
+%: %.stan
+\tcp $< {compiled}
+\tcp {fake} $@
+\tchmod +x $@
+'''
+
+
+def _fake_cmdstan(path, version='2.33.0'):
+    fake = path / 'fake_model.py'
+    fake.write_text(FAKE_MODEL.format(python=sys.executable))
+    (path / 'makefile').write_text(MAKEFILE.format(
+        version=version, compiled=path / 'compiled.stan', fake=fake))
+    return CmdStanBackend(path)
+
+
+@pytest.fixture
+def cmdstan(tmp_path):
+    return _fake_cmdstan(tmp_path)
+
+
+def test_get_backend(monkeypatch):
+    monkeypatch.delenv('HBAYESDM_BACKEND', raising=False)
+    assert isinstance(get_backend(), PyStanBackend)
+    assert get_backend('cmdstan') is get_backend('cmdstan')
+
+    monkeypatch.setenv('HBAYESDM_BACKEND', 'cmdstan')
+    assert isinstance(get_backend(), CmdStanBackend)
+    assert isinstance(get_backend('pystan'), PyStanBackend)
+
+    with pytest.raises(RuntimeError):
+        get_backend('rstan')
+
+
+def test_cmdstan_not_found(tmp_path):
+    backend = CmdStanBackend(tmp_path)
+    assert not backend.available()
+    with pytest.raises(RuntimeError):
+        backend.version
+
+
+def test_read_stan_csv(tmp_path):
+    path = tmp_path / 'output.csv'
+    path.write_text('# comment\nlp__,theta.1,theta.2\n'
+                    '# Step size = 0.25\n'
+                    '# Diagonal elements of inverse mass matrix:\n'
+                    '# 0.5, 1.5\n-1,0.1,0.2\n-2,0.3,0.4\n')
+    columns, draws, adaptation = read_stan_csv(path)
+
+    assert columns == ['lp__', 'theta.1', 'theta.2']
+    assert draws.shape == (2, 3)
+    assert adaptation['stepsize'] == 0.25
+    assert np.array_equal(adaptation['inv_metric'], [0.5, 1.5])
+
+
+def test_cmdstan_fit_extract():
+    columns = ['lp__', 'mu', 'y.1.1', 'y.2.1', 'y.1.2', 'y.2.2',
+               'y.1.3', 'y.2.3']
+    chains = [np.arange(8.0)[None, :] + 10 * i for i in range(3)]
+    fit = CmdStanFit('model', columns, chains)
+    par_vals = fit.extract()
+
+    assert list(par_vals) == ['mu', 'y', 'lp__']
+    assert par_vals['mu'].shape == (3,)
+    assert par_vals['y'].shape == (3, 2, 3)
+    assert np.array_equal(par_vals['y'][1], [[12, 14, 16], [13, 15, 17]])
+
+    data = fit.to_inference_data(log_likelihood='y')
+    assert data.posterior['mu'].shape == (3, 1)
+    assert data.log_likelihood['y'].shape == (3, 1, 2, 3)
+    assert to_inference_data(fit) is not None
+
+
+def test_write_stan_csv(tmp_path):
+    fit = DrawsFit('model', OrderedDict([
+        ('mu', np.arange(6.0).reshape(2, 3)),
+        ('y', np.arange(36.0).reshape(2, 3, 2, 3)),
+    ]), OrderedDict([('lp', -np.ones((2, 3)))]))
+    _write_stan_csv(tmp_path / 'fitted.csv', fit, 1)
+    columns, draws, _ = read_stan_csv(tmp_path / 'fitted.csv')
+
+    assert columns[:4] == ['lp__', 'mu', 'y.1.1', 'y.2.1']
+    read = CmdStanFit('model', columns, [draws])
+    assert np.array_equal(read.draws['y'][0], fit.draws['y'][1])
+    assert np.array_equal(read.sample_stats['lp'][0],
+                          fit.sample_stats['lp'][1])
+
+
+def test_cmdstan_backend(cmdstan, tmp_path):
+    assert cmdstan.version == '2.33.0'
+    assert cmdstan.supports_threading
+    assert 'STAN_THREADS=true' in cmdstan.flags(threads=True)
+
+    (tmp_path / 'model.stan').write_text('parameters { real mu_pr; }\n')
+    sm = cmdstan.compile('model', tmp_path / 'model.stan', None, [tmp_path])
+    data = {'x': np.array([1, 2, 3])}
+
+    fit = cmdstan.sample(
+        sm, data=data, pars=['mu_pr', 'y'], init='random', chains=2,
+        iter=15, warmup=10, thin=1,
+        control={'adapt_delta': 0.95, 'stepsize': 1, 'max_treedepth': 10},
+        n_jobs=2)
+    par_vals = cmdstan.extract(fit)
+    assert par_vals['mu_pr'].shape == (12, 1)
+    assert par_vals['mu_pr'][0, 0] == 6
+    assert np.array_equal(par_vals['y'][0], [[11, 12], [21, 22]])
+    assert fit.adaptation[0]['stepsize'] == 0.5
+
+    # Resume the chains from their last draws, without warm-up
+    adaptation = cmdstan.adaptation(fit)
+    assert np.array_equal(adaptation[1]['inv_metric'], [1, 2])
+    for a, last in zip(adaptation, fit.last_draws()):
+        a['init'] = {'mu_pr': last['mu_pr']}
+    resumed = cmdstan.sample(
+        sm, data=data, pars=['mu_pr'], init='random', chains=2,
+        iter=4, warmup=0, thin=1,
+        control={'adapt_delta': 0.95, 'stepsize': 1, 'max_treedepth': 10},
+        n_jobs=2, adaptation=adaptation)
+    assert resumed.pars == ['mu_pr']
+    assert resumed.draws['mu_pr'].shape == (2, 5, 1)
+
+    assert cmdstan.vb_means(sm, data)['mu_pr[1]'] == 6
+    assert cmdstan.variational(
+        sm, data, ['mu_pr'], lambda: {'mu_pr': [0]}).pars == ['mu_pr']
+
+    with pytest.raises(RuntimeError):
+        cmdstan.sample(sm, data=data, pars=None, init='random', chains=1,
+                       iter=2, warmup=1, thin=1, control={}, n_jobs=1,
+                       threads_per_chain=2)
+
+
+@pytest.mark.parametrize('version', ['2.32.2', '2.33.0'])
+def test_cmdstan_stan_syntax(tmp_path, monkeypatch, version):
+    monkeypatch.setenv('HBAYESDM_CACHE_DIR', str(tmp_path / 'cache'))
+    cmdstan = _fake_cmdstan(tmp_path, version)
+    registry.clear()  # the fake model must not be used by other tests
+    try:
+        load_stan_model('ra_prospect', 'lean', cmdstan)
+    finally:
+        registry.clear()
+    compiled = (tmp_path / 'compiled.stan').read_text()
+
+    # Stan 2.33 removed the syntax of the original programs
+    canonical = version >= '2.33'
+    assert ('array[N] int<lower=1, upper=T> Tsubj;' in compiled) == canonical
+    assert ('int<lower=1, upper=T> Tsubj[N];' in compiled) != canonical
+    assert (cmdstan.stan_code(PATH_STAN / 'ra_prospect.stan', None) is None) \
+        != canonical
+
+
+def test_cmdstan_generate_quantities(cmdstan, tmp_path):
+    assert cmdstan.supports_generate_quantities
+    assert not PyStanBackend().supports_generate_quantities
+
+    (tmp_path / 'model.stan').write_text('parameters { real mu_pr; }\n')
+    sm = cmdstan.compile('model', tmp_path / 'model.stan', None, [tmp_path])
+    fit = DrawsFit('model', OrderedDict([
+        ('mu_pr', np.arange(8.0).reshape(2, 4, 1))]), OrderedDict())
+    generated = cmdstan.generate_quantities(
+        sm, {'x': [1]}, fit, ['z'], n_jobs=2)
+
+    assert generated.pars == ['z']
+    assert np.array_equal(generated.draws['z'], 2 * fit.draws['mu_pr'][..., 0])
+
+
+@pytest.mark.skipif(
+    not get_backend('cmdstan').available() or
+    not (get_backend('cmdstan').path / 'bin' / 'stanc').exists(),
+    reason='CmdStan is not installed')
+def test_real_cmdstan_generate_quantities(tmp_path):
+    cmdstan = get_backend('cmdstan')
+    (tmp_path / 'model.stan').write_text('''
+data { int<lower=1> N; }
+parameters { real mu_pr; }
+transformed parameters { real mu = 2 * mu_pr; }
+model { mu_pr ~ normal(0, 1); }
+generated quantities {
+  vector[N] y;
+  y[1] = mu;
+  y[2] = 3 * mu_pr;
+}
+''')
+    sm = cmdstan.compile('model', tmp_path / 'model.stan',
+                         cmdstan.stan_code(tmp_path / 'model.stan', None),
+                         [tmp_path])
+    # Draws of the parameters only, as sampled by the params variant
+    fit = DrawsFit('model', OrderedDict([
+        ('mu_pr', np.arange(8.0).reshape(2, 4))]), OrderedDict())
+    generated = cmdstan.generate_quantities(
+        sm, {'N': 2}, fit, ['y'], n_jobs=2)
+
+    assert np.allclose(generated.draws['y'][..., 0], 2 * fit.draws['mu_pr'])
+    assert np.allclose(generated.draws['y'][..., 1], 3 * fit.draws['mu_pr'])
+
+
+def test_cmdstan_model_pickle(cmdstan, tmp_path):
+    import pickle
+
+    (tmp_path / 'model.stan').write_text('parameters { real mu_pr; }\n')
+    sm = cmdstan.compile('model', tmp_path / 'model.stan', None, [tmp_path])
+    sm.path()
+    copy = pickle.loads(pickle.dumps(sm))
+    assert copy.executable == sm.executable
+    assert copy.path() != sm.path() and copy.path().exists()
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -3,9 +3,10 @@ import pytest
 from hbayesdm.models import bandit2arm_delta
 
 
-def test_bandit2arm_delta():
+def test_bandit2arm_delta(backend):
     _ = bandit2arm_delta(
-        data="example", niter=10, nwarmup=5, nchain=1, ncore=1)
+        data="example", niter=10, nwarmup=5, nchain=1, ncore=1,
+        backend=backend)
 
 
 if __name__ == '__main__':
@@ -3,9 +3,10 @@ import pytest
 from hbayesdm.models import bandit4arm_lapse_decay
 
 
-def test_bandit4arm_lapse_decay():
+def test_bandit4arm_lapse_decay(backend):
     _ = bandit4arm_lapse_decay(
-        data="example", niter=10, nwarmup=5, nchain=1, ncore=1)
+        data="example", niter=10, nwarmup=5, nchain=1, ncore=1,
+        backend=backend)
 
 
 if __name__ == '__main__':
@@ -3,9 +3,10 @@ import pytest
 from hbayesdm.models import banditNarm_4par
 
 
-def test_banditNarm_4par():
+def test_banditNarm_4par(backend):
     _ = banditNarm_4par(
-        data="example", niter=10, nwarmup=5, nchain=1, ncore=1)
+        data="example", niter=10, nwarmup=5, nchain=1, ncore=1,
+        backend=backend)
 
 
 if __name__ == '__main__':
@@ -3,9 +3,10 @@ import pytest
 from hbayesdm.models import banditNarm_singleA_lapse
 
 
-def test_banditNarm_singleA_lapse():
+def test_banditNarm_singleA_lapse(backend):
     _ = banditNarm_singleA_lapse(
-        data="example", niter=10, nwarmup=5, nchain=1, ncore=1)
+        data="example", niter=10, nwarmup=5, nchain=1, ncore=1,
+        backend=backend)
 
 
 if __name__ == '__main__':
@@ -3,9 +3,10 @@ import pytest
 from hbayesdm.models import bart_ewmv
 
 
-def test_bart_ewmv():
+def test_bart_ewmv(backend):
     _ = bart_ewmv(
-        data="example", niter=10, nwarmup=5, nchain=1, ncore=1)
+        data="example", niter=10, nwarmup=5, nchain=1, ncore=1,
+        backend=backend)
 
 
 if __name__ == '__main__':
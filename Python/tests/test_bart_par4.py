@@ -3,9 +3,10 @@ import pytest
 from hbayesdm.models import bart_par4
 
 
-def test_bart_par4():
+def test_bart_par4(backend):
     _ = bart_par4(
-        data="example", niter=10, nwarmup=5, nchain=1, ncore=1)
+        data="example", niter=10, nwarmup=5, nchain=1, ncore=1,
+        backend=backend)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,63 @@
+import time
+
+import pytest
+
+import hbayesdm
+from hbayesdm.batch import CoreScheduler
+
+
+def _busy(seconds):
+    start = time.time()
+    time.sleep(seconds)
+    return start, time.time()
+
+
+def _max_overlap(intervals):
+    events = sorted([(s, 1) for s, _ in intervals] +
+                    [(e, -1) for _, e in intervals])
+    running = peak = 0
+    for _, change in events:
+        running += change
+        peak = max(peak, running)
+    return peak
+
+
+def test_core_scheduler_budget():
+    scheduler = CoreScheduler(max_cores=2)
+    try:
+        assert 1 <= scheduler.max_cores <= 2
+        futures = [scheduler.submit(1, _busy, 0.3) for _ in range(4)]
+        assert _max_overlap([f.result() for f in futures]) <= 2
+
+        # Tasks taking all the cores run one at a time
+        futures = [scheduler.submit(scheduler.max_cores, _busy, 0.2)
+                   for _ in range(2)]
+        assert _max_overlap([f.result() for f in futures]) == 1
+    finally:
+        scheduler.shutdown()
+
+    with pytest.raises(RuntimeError):
+        CoreScheduler(max_cores=0)
+
+
+def test_fit_many_unknown_model():
+    with pytest.raises(RuntimeError):
+        list(hbayesdm.fit_many([dict(model='ra_unknown', data='example')]))
+    with pytest.raises(RuntimeError):
+        list(hbayesdm.fit_many([dict(data='example')]))
+
+
+def test_fit_many(backend):
+    jobs = [dict(model=model, data='example', niter=10, nwarmup=5, nchain=2,
+                 backend=backend)
+            for model in ('ra_prospect', 'ra_noLA')]
+    results = dict(hbayesdm.fit_many(jobs, max_cores=2))
+
+    assert sorted(results) == [0, 1]
+    assert results[0].model == 'ra_prospect'
+    assert results[1].model == 'ra_noLA'
+    assert results[0].par_vals['mu_rho'].shape[0] == 10
+
+
+if __name__ == '__main__':
+    pytest.main()
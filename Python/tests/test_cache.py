@@ -0,0 +1,175 @@
+import multiprocessing
+import os
+import threading
+import time
+
+import pytest
+
+from hbayesdm.base import PATH_STAN, load_stan_model
+from hbayesdm.cache import ModelCache, ModelRegistry, model_hash, registry
+from hbayesdm.cli import _cache_status, main
+from hbayesdm.models import bandit2arm_delta
+
+
+def test_model_hash_tracks_includes(tmp_path):
+    (tmp_path / 'pre').mkdir()
+    (tmp_path / 'pre' / 'license.stan').write_text('// license\n')
+    (tmp_path / 'model.stan').write_text(
+        '#include /pre/license.stan\nparameters { real x; }\n')
+
+    key = model_hash(tmp_path / 'model.stan', [tmp_path], version='2.19')
+    assert key == model_hash(tmp_path / 'model.stan', [tmp_path],
+                             version='2.19')
+    assert key != model_hash(tmp_path / 'model.stan', [tmp_path],
+                             version='2.19', flags=['-O3'])
+
+    (tmp_path / 'pre' / 'license.stan').write_text('// changed\n')
+    assert key != model_hash(tmp_path / 'model.stan', [tmp_path],
+                             version='2.19')
+
+
+def test_model_hash_stan_files():
+    keys = {model_hash(path, [PATH_STAN])
+            for path in PATH_STAN.glob('*.stan')}
+    assert len(keys) == len(list(PATH_STAN.glob('*.stan')))
+
+
+def test_cache_lru_eviction(tmp_path):
+    cache = ModelCache(tmp_path, max_size='2K')
+    payload = b'x' * 800
+
+    cache.store('a', '1', payload)
+    cache.store('b', '2', payload)
+    os.utime(str(cache.path('a', '1')), (1, 1))
+    os.utime(str(cache.path('b', '2')), (2, 2))
+
+    assert cache.load('a', '1') == payload  # 'a' is now the most recent
+    cache.store('c', '3', payload)
+
+    assert cache.path('a', '1').exists()
+    assert not cache.path('b', '2').exists()
+    assert cache.path('c', '3').exists()
+    assert cache.size() <= cache.max_size
+
+
+def test_cache_removes_invalid_entry(tmp_path):
+    cache = ModelCache(tmp_path)
+    tmp_path.joinpath(cache.path('a', '1').name).write_bytes(b'broken')
+
+    assert cache.load('a', '1') is None
+    assert not cache.path('a', '1').exists()
+
+
+def test_cache_manifest(tmp_path):
+    cache = ModelCache(tmp_path)
+    path = cache.store('a', '1', b'payload', manifest={'source_hash': 'abc'})
+
+    assert cache.read_manifest(path)['source_hash'] == 'abc'
+    assert cache.check(path, {'source_hash': 'abc'}, checksum=True) == 'ok'
+    assert cache.check(path, {'source_hash': 'def'}) == 'stale'
+    assert cache.load('a', '1', expected={'source_hash': 'def'}) is None
+    assert not path.exists()
+    assert not cache.manifest_path(path).exists()
+
+
+def test_cache_truncated_entry(tmp_path):
+    cache = ModelCache(tmp_path)
+    path = cache.store('a', '1', b'payload' * 100)
+    with open(str(path), 'r+b') as f:
+        f.truncate(10)
+
+    assert cache.check(path) == 'corrupt'
+    assert cache.load('a', '1') is None
+    assert not path.exists()
+
+
+def test_cache_cli(tmp_path, monkeypatch):
+    monkeypatch.setenv('HBAYESDM_CACHE_DIR', str(tmp_path))
+    cache = ModelCache()
+    cache.store('no_such_model', '1', b'payload')
+
+    # Unknown models are stale, whether or not their backend is installed
+    assert [e['status'] for e in _cache_status()] == ['stale']
+    assert main(['cache', 'ls']) == 0
+    assert main(['cache', 'verify']) == 0
+    assert main(['cache', 'prune']) == 0
+    assert not cache.entries()
+
+
+def _create_slowly(counter):
+    with open(counter, 'a') as f:
+        f.write('x')
+    time.sleep(0.5)
+    return b'payload' * 1000
+
+
+def _load_or_store(directory, counter):
+    cache = ModelCache(directory)
+    obj, _ = cache.load_or_store('a', '1', lambda: _create_slowly(counter))
+    return obj
+
+
+def test_cache_concurrent_stores(tmp_path):
+    counter = str(tmp_path / 'counter')
+    ctx = multiprocessing.get_context('spawn')
+    with ctx.Pool(8) as pool:
+        results = pool.starmap(_load_or_store,
+                               [(str(tmp_path / 'cache'), counter)] * 8)
+
+    assert all(r == b'payload' * 1000 for r in results)
+    with open(counter) as f:
+        assert f.read() == 'x'
+    assert ModelCache(tmp_path / 'cache').check(
+        ModelCache(tmp_path / 'cache').path('a', '1'), checksum=True) == 'ok'
+
+
+def _fit_bandit2arm_delta(_):
+    bandit2arm_delta(data='example', niter=10, nwarmup=5, nchain=1, ncore=1)
+    return True
+
+
+def test_concurrent_fits_share_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv('HBAYESDM_CACHE_DIR', str(tmp_path))
+    ctx = multiprocessing.get_context('spawn')
+    with ctx.Pool(6) as pool:
+        assert all(pool.map(_fit_bandit2arm_delta, range(6)))
+
+    entries = ModelCache().entries()
+    assert len(entries) == 1
+    assert ModelCache().check(entries[0]['path'], checksum=True) == 'ok'
+
+
+def test_registry_loads_once():
+    reg = ModelRegistry(max_entries=2)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return object()
+
+    threads = [threading.Thread(target=reg.get_or_load,
+                                args=('a', '1', loader))
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+
+    reg.put('b', '2', object())
+    reg.put('c', '3', object())
+    assert len(reg) == 2
+    assert ('a', '1') not in reg
+
+    reg.clear()
+    assert len(reg) == 0
+
+
+def test_load_stan_model_once():
+    registry.clear()
+    sm = load_stan_model('ra_prospect')
+    assert load_stan_model('ra_prospect') is sm
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -3,9 +3,10 @@ import pytest
 from hbayesdm.models import cgt_cm
 
 
-def test_cgt_cm():
+def test_cgt_cm(backend):
     _ = cgt_cm(
-        data="example", niter=10, nwarmup=5, nchain=1, ncore=1)
+        data="example", niter=10, nwarmup=5, nchain=1, ncore=1,
+        backend=backend)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,92 @@
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+
+from hbayesdm.backends import DrawsFit
+from hbayesdm.checkpoint import Checkpoint, data_hash
+from hbayesdm.models import ra_prospect
+from hbayesdm.store import DrawStore
+
+SETTINGS = OrderedDict([('model', 'ra_prospect'), ('data', 'abc'),
+                        ('pars', ['mu_pr', 'sigma']), ('nchain', 2),
+                        ('nthin', 1)])
+
+
+def _block(offset):
+    return DrawsFit('ra_prospect', OrderedDict([
+        ('mu_pr', np.arange(12.0).reshape(2, 3, 2) + offset),
+        ('sigma', np.ones((2, 3, 2))),
+    ]), OrderedDict([('lp', np.zeros((2, 3)))]))
+
+
+def _adaptation(block):
+    return [{'stepsize': 0.5, 'inv_metric': np.ones(4), 'init': last}
+            for last in block.last_draws()]
+
+
+def test_checkpoint(tmp_path):
+    checkpoint = Checkpoint(tmp_path / 'fit')
+    assert not checkpoint.exists()
+    store = DrawStore(tmp_path / 'fit' / 'draws')
+    checkpoint.create(SETTINGS, store)
+    store.create('ra_prospect', 2)
+
+    blocks = [_block(0), _block(100)]
+    for i, block in enumerate(blocks):
+        store.append(block)
+        checkpoint.save(8 + 3 * i, 42, _adaptation(block))
+    store.append(_block(200))  # interrupted before its checkpoint
+    assert checkpoint.exists()
+    with pytest.raises(RuntimeError):
+        Checkpoint(tmp_path / 'fit').create(SETTINGS, store)
+
+    state = Checkpoint(tmp_path / 'fit').load(SETTINGS)
+    assert state['iterations'] == 11 and state['seed'] == 42
+    assert np.array_equal(state['adaptation'][1]['init']['mu_pr'],
+                          [110, 111])
+    loaded = state['store'].fit()
+    assert state['store'].n_draws == 6
+    assert np.array_equal(loaded.draws['mu_pr'],
+                          DrawsFit.concat(blocks).draws['mu_pr'])
+    assert loaded.sample_stats['lp'].shape == (2, 6)
+
+    with pytest.raises(RuntimeError):
+        Checkpoint(tmp_path / 'fit').load(dict(SETTINGS, nchain=4))
+    with pytest.raises(RuntimeError):  # settings missing from either side
+        Checkpoint(tmp_path / 'fit').load(dict(SETTINGS, precision='compact'))
+    with pytest.raises(RuntimeError):
+        Checkpoint(tmp_path / 'fit').load(
+            OrderedDict((k, v) for k, v in SETTINGS.items() if k != 'nthin'))
+    with pytest.raises(RuntimeError):
+        Checkpoint(tmp_path / 'other').load(SETTINGS)
+
+
+def test_data_hash():
+    data = {'N': 2, 'x': np.array([1.0, 2.0])}
+    assert data_hash(data) == data_hash({'x': [1.0, 2.0], 'N': 2})
+    assert data_hash(data) != data_hash({'N': 2, 'x': np.array([1.0, 3.0])})
+
+
+def test_checkpoint_arguments(tmp_path):
+    with pytest.raises(RuntimeError):
+        ra_prospect(data='example', vb=True, checkpoint=str(tmp_path))
+    with pytest.raises(RuntimeError):
+        ra_prospect(data='example', resume=str(tmp_path / 'missing'))
+
+
+def test_resume(backend, tmp_path):
+    path = str(tmp_path / 'fit')
+    first = ra_prospect(data='example', niter=10, nwarmup=5, nchain=1,
+                        ncore=1, backend=backend, checkpoint=path,
+                        checkpoint_every=2)
+    resumed = ra_prospect(data='example', niter=14, nwarmup=5, nchain=1,
+                          ncore=1, backend=backend, resume=path)
+
+    assert resumed.par_vals['mu_rho'].shape == (9,)
+    assert np.array_equal(resumed.par_vals['mu_rho'][:5],
+                          first.par_vals['mu_rho'])
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -3,9 +3,10 @@ import pytest
 from hbayesdm.models import choiceRT_ddm_single
 
 
-def test_choiceRT_ddm_single():
+def test_choiceRT_ddm_single(backend):
     _ = choiceRT_ddm_single(
-        data="example", niter=10, nwarmup=5, nchain=1, ncore=1)
+        data="example", niter=10, nwarmup=5, nchain=1, ncore=1,
+        backend=backend)
 
 
 if __name__ == '__main__':
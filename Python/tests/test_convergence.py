@@ -0,0 +1,67 @@
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+
+from hbayesdm.backends import DrawsFit
+from hbayesdm.convergence import (AUTO_CONTROL, check_auto_control,
+                                  convergence_stats, is_converged)
+from hbayesdm.models import ra_prospect
+
+
+def _fit(draws):
+    return DrawsFit('model', OrderedDict(draws),
+                    OrderedDict(lp=np.zeros(draws[0][1].shape[:2])))
+
+
+def test_check_auto_control():
+    assert check_auto_control(None) == AUTO_CONTROL
+    assert check_auto_control({'rhat': 1.05})['rhat'] == 1.05
+    with pytest.raises(RuntimeError):
+        check_auto_control({'ess': 100})
+    with pytest.raises(RuntimeError):
+        check_auto_control({'rhat': 0.99})
+    with pytest.raises(RuntimeError):
+        check_auto_control({'block': 0})
+
+
+def test_convergence_stats():
+    rng = np.random.RandomState(0)
+    mixed = _fit([('mu_a', rng.normal(size=(4, 1000))),
+                  ('log_lik', rng.normal(size=(4, 1000, 3)))])
+    stats = convergence_stats(mixed.to_inference_data(),
+                              ['mu_a', 'sigma', 'log_lik'])
+    assert stats['rhat'] < 1.01
+    assert stats['ess_bulk'] > 2000 and stats['ess_tail'] > 2000
+    assert is_converged(stats, AUTO_CONTROL)
+
+    stuck = _fit([('mu_a', rng.normal(size=(4, 1000)) +
+                   np.arange(4)[:, None])])
+    stats = convergence_stats(stuck.to_inference_data(), ['mu_a'])
+    assert stats['rhat'] > 1.1
+    assert not is_converged(stats, AUTO_CONTROL)
+
+
+def test_draws_fit_concat():
+    first = _fit([('mu_a', np.zeros((2, 3))), ('y', np.zeros((2, 3, 4)))])
+    second = _fit([('mu_a', np.ones((2, 5))), ('y', np.ones((2, 5, 4)))])
+    second.adaptation[0]['stepsize'] = 0.5
+
+    fit = DrawsFit.concat([first, second], ['y'])
+    assert fit.pars == ['y']
+    assert fit.draws['y'].shape == (2, 8, 4)
+    assert fit.extract()['y'].shape == (16, 4)
+    assert fit.extract()['lp__'].shape == (16,)
+    assert fit.adaptation[0] == {'stepsize': 0.5}
+    assert np.array_equal(fit.last_draws()[1]['y'], np.ones(4))
+
+
+def test_niter_auto_requires_valid_control():
+    with pytest.raises(RuntimeError):
+        ra_prospect(data='example', niter='auto', auto_control={'ess': 1})
+    with pytest.raises(RuntimeError):
+        ra_prospect(data='example', niter='many')
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -3,9 +3,10 @@ import pytest
 from hbayesdm.models import cra_exp
 
 
-def test_cra_exp():
+def test_cra_exp(backend):
     _ = cra_exp(
-        data="example", niter=10, nwarmup=5, nchain=1, ncore=1)
+        data="example", niter=10, nwarmup=5, nchain=1, ncore=1,
+        backend=backend)
 
 
 if __name__ == '__main__':
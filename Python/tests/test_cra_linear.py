@@ -3,9 +3,10 @@ import pytest
 from hbayesdm.models import cra_linear
 
 
-def test_cra_linear():
+def test_cra_linear(backend):
     _ = cra_linear(
-        data="example", niter=10, nwarmup=5, nchain=1, ncore=1)
+        data="example", niter=10, nwarmup=5, nchain=1, ncore=1,
+        backend=backend)
 
 
 if __name__ == '__main__':
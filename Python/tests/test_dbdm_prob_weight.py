@@ -3,9 +3,10 @@ import pytest
 from hbayesdm.models import dbdm_prob_weight
 
 
-def test_dbdm_prob_weight():
+def test_dbdm_prob_weight(backend):
     _ = dbdm_prob_weight(
-        data="example", niter=10, nwarmup=5, nchain=1, ncore=1)
+        data="example", niter=10, nwarmup=5, nchain=1, ncore=1,
+        backend=backend)
 
 
 if __name__ == '__main__':
@@ -3,9 +3,10 @@ import pytest
 from hbayesdm.models import dd_cs
 
 
-def test_dd_cs():
+def test_dd_cs(backend):
     _ = dd_cs(
-        data="example", niter=10, nwarmup=5, nchain=1, ncore=1)
+        data="example", niter=10, nwarmup=5, nchain=1, ncore=1,
+        backend=backend)
 
 
 if __name__ == '__main__':
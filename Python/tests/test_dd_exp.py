@@ -3,9 +3,10 @@ import pytest
 from hbayesdm.models import dd_exp
 
 
-def test_dd_exp():
+def test_dd_exp(backend):
     _ = dd_exp(
-        data="example", niter=10, nwarmup=5, nchain=1, ncore=1)
+        data="example", niter=10, nwarmup=5, nchain=1, ncore=1,
+        backend=backend)
 
 
 if __name__ == '__main__':
@@ -3,9 +3,10 @@ import pytest
 from hbayesdm.models import gng_m2
 
 
-def test_gng_m2():
+def test_gng_m2(backend):
     _ = gng_m2(
-        data="example", niter=10, nwarmup=5, nchain=1, ncore=1)
+        data="example", niter=10, nwarmup=5, nchain=1, ncore=1,
+        backend=backend)
 
 
 if __name__ == '__main__':
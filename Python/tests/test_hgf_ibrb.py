@@ -3,9 +3,10 @@ import pytest
 from hbayesdm.models import hgf_ibrb
 
 
-def test_hgf_ibrb():
+def test_hgf_ibrb(backend):
     _ = hgf_ibrb(
-        data="example", niter=10, nwarmup=5, nchain=1, ncore=1)
+        data="example", niter=10, nwarmup=5, nchain=1, ncore=1,
+        backend=backend)
 
 
 if __name__ == '__main__':
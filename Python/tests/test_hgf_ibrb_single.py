@@ -3,9 +3,10 @@ import pytest
 from hbayesdm.models import hgf_ibrb_single
 
 
-def test_hgf_ibrb_single():
+def test_hgf_ibrb_single(backend):
     _ = hgf_ibrb_single(
-        data="example", niter=10, nwarmup=5, nchain=1, ncore=1)
+        data="example", niter=10, nwarmup=5, nchain=1, ncore=1,
+        backend=backend)
 
 
 if __name__ == '__main__':
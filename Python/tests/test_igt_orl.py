@@ -3,9 +3,10 @@ import pytest
 from hbayesdm.models import igt_orl
 
 
-def test_igt_orl():
+def test_igt_orl(backend):
     _ = igt_orl(
-        data="example", niter=10, nwarmup=5, nchain=1, ncore=1)
+        data="example", niter=10, nwarmup=5, nchain=1, ncore=1,
+        backend=backend)
 
 
 if __name__ == '__main__':
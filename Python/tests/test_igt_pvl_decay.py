@@ -3,9 +3,10 @@ import pytest
 from hbayesdm.models import igt_pvl_decay
 
 
-def test_igt_pvl_decay():
+def test_igt_pvl_decay(backend):
     _ = igt_pvl_decay(
-        data="example", niter=10, nwarmup=5, nchain=1, ncore=1)
+        data="example", niter=10, nwarmup=5, nchain=1, ncore=1,
+        backend=backend)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,62 @@
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+
+from hbayesdm.backends import DrawsFit, PyStanBackend
+from hbayesdm.parvals import ParVals
+
+
+class CountingFit(DrawsFit):
+    def extract(self, pars=None, permuted=True):
+        self.extracted.extend(pars)
+        return super().extract(pars, permuted)
+
+
+def _fit():
+    fit = CountingFit('model', OrderedDict([
+        ('mu', np.arange(6.0).reshape(2, 3)),
+        ('y_pred', np.array([[[1, -1], [0, 1], [-1, -1]]] * 2, dtype=float)),
+    ]), OrderedDict([('lp', np.zeros((2, 3)))]))
+    fit.extracted = []
+    return fit
+
+
+def test_par_vals():
+    fit = _fit()
+    par_vals = ParVals(fit, PyStanBackend(), {
+        'y_pred': lambda v: np.where(v == -1, np.nan, v)})
+
+    assert list(par_vals) == ['mu', 'y_pred', 'lp__']
+    assert len(par_vals) == 3 and 'mu' in par_vals and 'x' not in par_vals
+    assert fit.extracted == []
+
+    assert par_vals['mu'].shape == (6,)
+    assert par_vals['mu'] is par_vals['mu']
+    assert np.isnan(par_vals['y_pred'][0, 1])
+    assert fit.extracted == ['mu', 'y_pred']
+    with pytest.raises(ValueError):
+        par_vals['mu'][0] = 1
+    with pytest.raises(KeyError):
+        par_vals['x']
+
+    par_vals.release('mu')
+    assert par_vals['mu'].sum() == 15
+    par_vals.release()
+    assert fit.extracted == ['mu', 'y_pred', 'mu']
+    assert dict(par_vals)['lp__'].shape == (6,)
+
+
+def test_par_vals_exclude():
+    par_vals = ParVals(_fit(), PyStanBackend(), exclude=['mu'])
+
+    assert list(par_vals) == ['y_pred', 'lp__']
+    assert 'mu' not in par_vals
+    with pytest.raises(KeyError):
+        par_vals['mu']
+    with pytest.raises(KeyError):
+        next(par_vals.iter_draws('mu'))
+
+
+if __name__ == '__main__':
+    pytest.main()
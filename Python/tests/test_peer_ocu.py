@@ -3,9 +3,10 @@ import pytest
 from hbayesdm.models import peer_ocu
 
 
-def test_peer_ocu():
+def test_peer_ocu(backend):
     _ = peer_ocu(
-        data="example", niter=10, nwarmup=5, nchain=1, ncore=1)
+        data="example", niter=10, nwarmup=5, nchain=1, ncore=1,
+        backend=backend)
 
 
 if __name__ == '__main__':
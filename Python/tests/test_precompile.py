@@ -0,0 +1,45 @@
+import pandas as pd
+import pytest
+
+from hbayesdm import precompile
+from hbayesdm.base import BackgroundBuild, stan_model_manifest
+from hbayesdm.cache import ModelCache
+from hbayesdm.cli import main
+from hbayesdm.models import ra_prospect
+
+
+def test_precompile():
+    precompile('ra_prospect')
+    assert precompile(['ra_prospect']) == {'ra_prospect': 'cached'}
+
+
+def test_precompile_cli():
+    assert main(['precompile', 'ra_prospect', '--jobs', '2']) == 0
+
+
+def test_precompile_unknown_model():
+    with pytest.raises(RuntimeError):
+        precompile('no_such_model')
+    assert main(['precompile', 'no_such_model']) == 1
+
+
+def test_background_build_cancel(tmp_path, monkeypatch):
+    monkeypatch.setenv('HBAYESDM_CACHE_DIR', str(tmp_path))
+    build = BackgroundBuild('ra_prospect')
+    build.cancel()
+
+    _, key, _ = stan_model_manifest('ra_prospect')
+    assert not ModelCache().entries()
+    with ModelCache().lock('ra_prospect', key) as lock:
+        assert not lock.waited
+
+
+def test_invalid_data_cancels_build(tmp_path, monkeypatch):
+    monkeypatch.setenv('HBAYESDM_CACHE_DIR', str(tmp_path))
+    with pytest.raises(RuntimeError):
+        ra_prospect(data=pd.DataFrame({'subjID': [1, 1, 2]}))
+    assert not ModelCache().entries()
+
+
+if __name__ == '__main__':
+    pytest.main()
@@ -0,0 +1,157 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from hbayesdm.preprocess_funcs import (cgt_preprocess_func,
+                                       choiceRT_preprocess_func,
+                                       hgf_ibrb_preprocess_func,
+                                       hgf_ibrb_single_preprocess_func,
+                                       pad_trials, trial_index,
+                                       wcs_preprocess_func)
+
+
+def _general_info(raw_data, keys):
+    grouped_data = raw_data.groupby(keys, sort=False)
+    sizes = grouped_data.size()
+    if keys == 'subjid':
+        return {'grouped_data': grouped_data, 'n_subj': len(sizes),
+                'b_subjs': None, 'b_max': None, 't_max': sizes.max()}
+    blocks = sizes.index.to_frame(index=False).groupby(
+        'subjid', sort=False).size()
+    return {'grouped_data': grouped_data, 'n_subj': len(blocks),
+            'b_subjs': list(blocks), 'b_max': blocks.max(),
+            't_max': sizes.max()}
+
+
+def test_pad_trials():
+    # Subjects are interleaved, with different numbers of trials
+    raw_data = pd.DataFrame({
+        'subjid': ['b', 'a', 'b', 'c', 'a', 'b'],
+        'choice': [1, 2, 2, 1, 1, 2],
+        'gain': [0.5, 1.0, 1.5, 2.0, 2.5, 3.0],
+    })
+    general_info = _general_info(raw_data, 'subjid')
+    subj, trial = trial_index(general_info)
+    assert list(subj) == [0, 1, 0, 2, 1, 0]
+    assert list(trial) == [0, 0, 1, 0, 1, 2]
+
+    data = pad_trials(general_info, {
+        'choice': (raw_data['choice'], int, -1),
+        'gain': (raw_data['gain'] * 2, float, 0),
+    })
+    assert list(data) == ['choice', 'gain']
+    assert data['choice'].dtype == int
+    assert np.array_equal(data['choice'],
+                          [[1, 2, 2], [2, 1, -1], [1, -1, -1]])
+    assert np.array_equal(data['gain'],
+                          [[1, 3, 6], [2, 5, 0], [4, 0, 0]])
+
+
+def test_pad_trials_blocks():
+    raw_data = pd.DataFrame({
+        'subjid': [2, 2, 1, 2, 1, 1, 2, 1],
+        'block': [1, 2, 1, 1, 2, 2, 2, 1],
+        'choice': np.arange(8),
+    })
+    general_info = _general_info(raw_data, ['subjid', 'block'])
+    choice = pad_trials(
+        general_info, {'choice': (raw_data['choice'], int, -1)})['choice']
+
+    expected = np.full((2, 2, 2), -1)
+    subjs = list(pd.unique(raw_data['subjid']))
+    for (s, b), data in general_info['grouped_data']:
+        blocks = list(pd.unique(raw_data.loc[raw_data['subjid'] == s,
+                                             'block']))
+        expected[subjs.index(s), blocks.index(b), :len(data)] = \
+            data['choice']
+    assert np.array_equal(choice, expected)
+
+
+def test_cgt_preprocess():
+    raw_data = pd.DataFrame({
+        'subjid': [1, 1, 2],
+        'gambletype': [1, 0, 0],
+        'percentagestaked': [25, 25, 75],
+        'trialinitialpoints': [100, 200, 100],
+        'redchosen': [1, 0, 1],
+        'nredboxes': [6, 3, 8],
+    })
+    copy = raw_data.copy()
+    general_info = dict(_general_info(raw_data, 'subjid'), t_subjs=[2, 1])
+    data = cgt_preprocess_func(None, raw_data, general_info, {})
+    assert raw_data.equals(copy)
+
+    assert data['B'] == 2
+    # Bets are ranked in ascending order, or descending for gambletype 0
+    assert np.array_equal(data['bet_chosen'], [[1, 2], [1, 0]])
+    assert np.array_equal(data['col_chosen'], [[1, 2], [1, 0]])
+    assert np.allclose(data['prop_chosen'], [[0.6, 0.7], [0.8, 0]])
+    assert data['gain'].shape == (2, 2, 2)
+    assert np.allclose(data['gain'][0], [[1.25, 1.75], [3.5, 2.5]])
+    assert np.allclose(data['loss'][1], [[0.25, 0.75], [0, 0]])
+
+
+def test_choiceRT_preprocess():
+    # The second subject has no upper boundary responses
+    raw_data = pd.DataFrame({
+        'subjid': [1, 2, 1, 1, 2, 1],
+        'choice': [2, 1, 1, 2, 1, 2],
+        'rt': [0.5, 0.6, 0.4, 0.7, 0.3, 0.9],
+    })
+    general_info = _general_info(raw_data, 'subjid')
+    data = choiceRT_preprocess_func(None, raw_data, general_info, {})
+    assert np.array_equal(data['Nu'], [3, 0])
+    assert np.array_equal(data['Nl'], [1, 2])
+    assert data['Nu_max'] == 3 and data['Nl_max'] == 2
+    assert np.array_equal(data['RTu'], [[0.5, 0.7, 0.9], [-1, -1, -1]])
+    assert np.array_equal(data['RTl'], [[0.4, -1], [0.6, 0.3]])
+    assert np.array_equal(data['minRT'], [0.4, 0.3])
+
+
+def test_hgf_ibrb_preprocess():
+    # Rows out of order, with a gap in the index and invalid values
+    raw_data = pd.DataFrame({
+        'subjid': ['s2', 's1', 's2', 's1', 's1'],
+        'trialnum': [2, 1, 1, 3, 2],
+        'u': [1, 0, 0, np.nan, 1],
+        'y': [0, 1, 2, 1, 0],
+    }, index=[0, 1, 3, 4, 5])
+    general_info = {'n_subj': 2, 't_max': 3}
+    data = hgf_ibrb_preprocess_func(None, raw_data, general_info, {})
+    assert np.array_equal(data['u'], [[0, 1, -1], [0, 1, -1]])
+    assert np.array_equal(data['y'], [[-1, 0, -1], [1, 0, 1]])
+
+    single = raw_data[raw_data['subjid'] == 's1']
+    data = hgf_ibrb_single_preprocess_func(None, single, {}, {})
+    assert data['T'] == 3
+    assert np.array_equal(data['u'], [0, 1, -1])
+    assert np.array_equal(data['y'], [1, 0, 1])
+
+
+def test_wcs_preprocess():
+    raw_data = pd.DataFrame({
+        'subjid': [1, 1, 2],
+        'choice': [2, 4, 1],
+        'outcome': [1, 0, 0],
+    })
+    general_info = dict(_general_info(raw_data, 'subjid'), t_subjs=[2, 1])
+    data = wcs_preprocess_func(None, raw_data, general_info, {})
+    assert data['choice'].shape == (2, 4, 128)
+    assert np.array_equal(data['choice'][0, :, :3],
+                          [[0, 0, 0], [1, 0, 0], [0, 0, 0], [0, 1, 0]])
+    assert np.array_equal(data['outcome'][:, :3], [[1, 0, -1], [0, -1, -1]])
+    # The first card matches deck 2 on color and deck 1 on form and number
+    assert np.array_equal(data['choice_match_att'][:, 0, 0],
+                          [[1, 0, 0], [0, 1, 1]])
+    assert data['choice_match_att'][:, 2:].sum() == 0
+
+    # The answer sheet is read once, and shared read-only
+    again = wcs_preprocess_func(None, raw_data, general_info, {})
+    assert again['deck_match_rule'] is data['deck_match_rule']
+    assert not data['deck_match_rule'].flags.writeable
+    assert np.array_equal(data['deck_match_rule'][0],
+                          [[0, 1, 0, 0], [1, 0, 0, 0], [1, 0, 0, 0]])
+
+
+if __name__ == '__main__':
+    pytest.main()
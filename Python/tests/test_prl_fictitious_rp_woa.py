@@ -3,9 +3,10 @@ import pytest
 from hbayesdm.models import prl_fictitious_rp_woa
 
 
-def test_prl_fictitious_rp_woa():
+def test_prl_fictitious_rp_woa(backend):
     _ = prl_fictitious_rp_woa(
-        data="example", niter=10, nwarmup=5, nchain=1, ncore=1)
+        data="example", niter=10, nwarmup=5, nchain=1, ncore=1,
+        backend=backend)
 
 
 if __name__ == '__main__':
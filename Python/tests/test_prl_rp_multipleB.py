@@ -3,9 +3,10 @@ import pytest
 from hbayesdm.models import prl_rp_multipleB
 
 
-def test_prl_rp_multipleB():
+def test_prl_rp_multipleB(backend):
     _ = prl_rp_multipleB(
-        data="example", niter=10, nwarmup=5, nchain=1, ncore=1)
+        data="example", niter=10, nwarmup=5, nchain=1, ncore=1,
+        backend=backend)
 
 
 if __name__ == '__main__':
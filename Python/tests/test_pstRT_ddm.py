@@ -3,9 +3,10 @@ import pytest
 from hbayesdm.models import pstRT_ddm
 
 
-def test_pstRT_ddm():
+def test_pstRT_ddm(backend):
     _ = pstRT_ddm(
-        data="example", niter=10, nwarmup=5, nchain=1, ncore=1)
+        data="example", niter=10, nwarmup=5, nchain=1, ncore=1,
+        backend=backend)
 
 
 if __name__ == '__main__':
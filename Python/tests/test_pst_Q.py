@@ -3,9 +3,10 @@ import pytest
 from hbayesdm.models import pst_Q
 
 
-def test_pst_Q():
+def test_pst_Q(backend):
     _ = pst_Q(
-        data="example", niter=10, nwarmup=5, nchain=1, ncore=1)
+        data="example", niter=10, nwarmup=5, nchain=1, ncore=1,
+        backend=backend)
 
 
 if __name__ == '__main__':
@@ -3,9 +3,10 @@ import pytest
 from hbayesdm.models import ra_noLA
 
 
-def test_ra_noLA():
+def test_ra_noLA(backend):
     _ = ra_noLA(
-        data="example", niter=10, nwarmup=5, nchain=1, ncore=1)
+        data="example", niter=10, nwarmup=5, nchain=1, ncore=1,
+        backend=backend)
 
 
 if __name__ == '__main__':
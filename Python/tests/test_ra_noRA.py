@@ -3,9 +3,10 @@ import pytest
 from hbayesdm.models import ra_noRA
 
 
-def test_ra_noRA():
+def test_ra_noRA(backend):
     _ = ra_noRA(
-        data="example", niter=10, nwarmup=5, nchain=1, ncore=1)
+        data="example", niter=10, nwarmup=5, nchain=1, ncore=1,
+        backend=backend)
 
 
 if __name__ == '__main__':
@@ -3,9 +3,10 @@ import pytest
 from hbayesdm.models import rdt_happiness
 
 
-def test_rdt_happiness():
+def test_rdt_happiness(backend):
     _ = rdt_happiness(
-        data="example", niter=10, nwarmup=5, nchain=1, ncore=1)
+        data="example", niter=10, nwarmup=5, nchain=1, ncore=1,
+        backend=backend)
 
 
 if __name__ == '__main__':
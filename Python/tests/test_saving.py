@@ -0,0 +1,59 @@
+import time
+
+import numpy as np
+import pytest
+
+import hbayesdm
+from hbayesdm.models import ra_prospect
+from hbayesdm.store import StoredFit
+
+
+def test_save_load(backend, tmp_path):
+    output = ra_prospect(data='example', niter=10, nwarmup=5, nchain=2,
+                         ncore=1, backend=backend, inc_postpred=True,
+                         postpred_summary=['sd'])
+    output.save(str(tmp_path / 'fit'))
+
+    start = time.time()
+    loaded = hbayesdm.load(str(tmp_path / 'fit'))
+    mu_rho = loaded.par_vals['mu_rho']
+    assert time.time() - start < 1
+
+    assert type(loaded) is type(output) and loaded.model == 'ra_prospect'
+    assert isinstance(loaded.fit, StoredFit)
+    # Stored draws are ordered by draw, and then by chain
+    assert np.array_equal(loaded.fit.draws['mu_rho'],
+                          output.fit.draws['mu_rho'])
+    assert np.array_equal(np.sort(mu_rho), np.sort(output.par_vals['mu_rho']))
+    assert np.array_equal(np.isnan(loaded.par_vals['y_pred'][0]),
+                          np.isnan(output.par_vals['y_pred'][0]))
+    assert np.allclose(loaded.all_ind_pars, output.all_ind_pars)
+    assert list(loaded.all_ind_pars.index) == \
+        list(output.all_ind_pars.index)
+    assert loaded.raw_data.equals(output.raw_data)
+    assert np.array_equal(loaded.adaptation[1]['inv_metric'],
+                          output.adaptation[1]['inv_metric'])
+    summary = loaded.postpred_summary['y_pred']
+    assert np.array_equal(summary['sd'],
+                          output.postpred_summary['y_pred']['sd'])
+    assert summary['choice_prop'].equals(
+        output.postpred_summary['y_pred']['choice_prop'])
+
+    loaded.save(str(tmp_path / 'copy'), compress=True)
+    copy = hbayesdm.load(str(tmp_path / 'copy'))
+    assert copy.fit.store.compressed
+    assert np.array_equal(copy.par_vals['mu_rho'], mu_rho)
+    with pytest.raises(RuntimeError):
+        loaded.save(str(tmp_path / 'fit'))
+
+
+def test_load_missing(tmp_path):
+    with pytest.raises(RuntimeError):
+        hbayesdm.load(str(tmp_path))
+    (tmp_path / 'file').write_text('')
+    with pytest.raises(RuntimeError):
+        hbayesdm.saving.save(None, str(tmp_path))
+
+
+if __name__ == '__main__':
+    pytest.main()
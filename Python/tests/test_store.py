@@ -0,0 +1,120 @@
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+
+from hbayesdm.backends import DrawsFit
+from hbayesdm.base import _compact_postpreds, _masked_postpreds
+from hbayesdm.models import ra_prospect
+from hbayesdm.store import DrawStore, StoredFit
+
+
+def _block(n_draws, offset):
+    y = np.arange(2 * n_draws * 6.0).reshape(2, n_draws, 2, 3) + offset
+    return DrawsFit('model', OrderedDict([
+        ('mu', np.arange(2.0 * n_draws).reshape(2, n_draws) + offset),
+        ('y', y),
+    ]), OrderedDict([('lp', -np.ones((2, n_draws)))]))
+
+
+def test_draw_store(tmp_path):
+    store = DrawStore(tmp_path / 'draws')
+    store.create('model', 2)
+    assert store.n_draws == 0
+
+    blocks = [_block(3, 0), _block(2, 100)]
+    for block in blocks:
+        store.append(block)
+    with pytest.raises(RuntimeError):
+        store.append(DrawsFit('model', OrderedDict(
+            [('mu', np.zeros((2, 1)))]), OrderedDict()))
+
+    fit = DrawStore(tmp_path / 'draws').fit()
+    expected = DrawsFit.concat(blocks)
+    assert isinstance(fit, StoredFit)
+    assert fit.n_chains == 2 and fit.pars == ['mu', 'y']
+    assert np.array_equal(fit.draws['y'], expected.draws['y'])
+    assert np.array_equal(fit.sample_stats['lp'], -np.ones((2, 5)))
+
+    par_vals = fit.extract()
+    assert list(par_vals) == ['mu', 'y', 'lp__']
+    assert isinstance(par_vals['y'], np.memmap)
+    assert par_vals['y'].shape == (10, 2, 3)
+    # Draws are ordered by draw, and then by chain
+    assert np.array_equal(par_vals['y'][1], expected.draws['y'][1, 0])
+    assert sorted(par_vals['mu']) == sorted(expected.extract()['mu'])
+    with pytest.raises(ValueError):
+        par_vals['mu'][0] = 0
+
+    store.truncate(3)
+    assert DrawStore(tmp_path / 'draws').fit().draws['mu'].shape == (2, 3)
+
+
+def test_compressed_draw_store(tmp_path):
+    store = DrawStore(tmp_path / 'draws', compress=True)
+    store.create('model', 2)
+    blocks = [_block(3, 0), _block(2, 100), _block(4, 200)]
+    for block in blocks:
+        store.append(block)
+    assert (tmp_path / 'draws' / 'y.bin').stat().st_size < 9 * 2 * 6 * 8
+
+    fit = DrawStore(tmp_path / 'draws').fit()
+    expected = DrawsFit.concat(blocks)
+    assert np.array_equal(fit.draws['y'], expected.draws['y'])
+    assert np.array_equal(fit.extract(['y'])['y'],
+                          np.concatenate(list(fit.iter_draws('y', 4))))
+    assert [len(c) for c in fit.iter_draws('y', 4)] == [4, 2, 4, 4, 4]
+    with pytest.raises(ValueError):
+        fit.extract()['mu'][0] = 0
+
+    with pytest.raises(RuntimeError):
+        store.truncate(4)
+    store.truncate(5)
+    store.append(_block(1, 300))
+    assert np.array_equal(
+        DrawStore(tmp_path / 'draws').fit().draws['mu'][:, -1], [300, 301])
+
+
+def test_compact_postpreds():
+    choices = np.array([[[1, 2, -1], [2, 2, -1]]] * 3, dtype=float)
+    assert _compact_postpreds(choices).dtype == np.int8
+    assert _compact_postpreds(choices + 0.5).dtype == np.float32
+    assert _compact_postpreds(choices * 100).dtype == np.float32
+
+    masked = _masked_postpreds(choices)
+    assert masked.dtype == np.int8
+    assert masked.mask[:, :, 2].all() and not masked.mask[:, :, :2].any()
+    assert np.array_equal(masked.mean(axis=0)[:, :2], [[1, 2], [2, 2]])
+
+
+def test_precision_arguments(tmp_path):
+    with pytest.raises(RuntimeError):
+        ra_prospect(data='example', precision='half')
+    with pytest.raises(RuntimeError):
+        ra_prospect(data='example', compress=True)
+
+
+def test_draws_dir(backend, tmp_path):
+    output = ra_prospect(data='example', niter=10, nwarmup=5, nchain=2,
+                         ncore=1, backend=backend, draws_dir=str(tmp_path),
+                         checkpoint_every=2)
+
+    assert isinstance(output.par_vals['mu_rho'], np.memmap)
+    assert output.par_vals['mu_rho'].shape == (10,)
+    assert DrawStore(tmp_path).n_draws == 5
+
+
+def test_compact_draws_dir(backend, tmp_path):
+    output = ra_prospect(data='example', niter=10, nwarmup=5, nchain=2,
+                         ncore=1, backend=backend, draws_dir=str(tmp_path),
+                         checkpoint_every=2, inc_postpred=True,
+                         precision='compact', compress=True)
+
+    y_pred = output.par_vals['y_pred']
+    assert y_pred.dtype == np.int8 and isinstance(y_pred, np.ma.MaskedArray)
+    assert output.par_vals['mu_rho'].dtype == np.float64
+    assert DrawStore(tmp_path).compressed
+
+
+if __name__ == '__main__':
+    pytest.main()
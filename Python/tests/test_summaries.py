@@ -0,0 +1,183 @@
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+
+from hbayesdm.backends import DrawsFit, PyStanBackend
+from hbayesdm.models import ra_prospect
+from hbayesdm.parvals import ParVals
+from hbayesdm.store import DrawStore
+from hbayesdm.summaries import (ChoiceProportions, DrawSummary,
+                                parse_statistics, summarize)
+
+STATISTICS = ['mean', 'sd', 'median', 'q2.5', 'q97.5', 'hdi90']
+
+
+def _chunks(draws, size=250):
+    return lambda: (draws[i:i + size] for i in range(0, len(draws), size))
+
+
+def _hdi(draws, prob):
+    draws = np.sort(draws)
+    width = int(np.floor(prob * len(draws)))
+    i = np.argmin(draws[width:] - draws[:len(draws) - width])
+    return draws[i], draws[i + width]
+
+
+def test_parse_statistics():
+    assert parse_statistics(['mean', 'median', 'q2.5', 'hdi95']) == [
+        ('mean', 'mean', None), ('median', 'quantile', 0.5),
+        ('q2.5', 'quantile', 0.025), ('hdi95', 'hdi', 0.95)]
+    with pytest.raises(RuntimeError):
+        parse_statistics(['mode'])
+    with pytest.raises(RuntimeError):
+        parse_statistics(['q100'])
+
+
+def test_exact_summaries():
+    draws = np.random.RandomState(0).gamma(2.0, size=(4000, 3, 5))
+    result = summarize(_chunks(draws), STATISTICS)
+
+    assert list(result) == ['mean', 'sd', 'median', 'q2.5', 'q97.5',
+                            'hdi90_lower', 'hdi90_upper']
+    assert np.allclose(result['mean'], draws.mean(axis=0))
+    assert np.allclose(result['sd'], draws.std(axis=0, ddof=1))
+    assert np.allclose(result['q2.5'], np.quantile(draws, 0.025, axis=0))
+    assert np.array_equal(result['median'], np.median(draws, axis=0))
+    lower, upper = _hdi(draws[:, 1, 2], 0.9)
+    assert result['hdi90_lower'][1, 2] == lower
+    assert result['hdi90_upper'][1, 2] == upper
+
+
+def test_approximate_summaries():
+    draws = np.random.RandomState(1).normal(size=(4000, 200))
+    exact = summarize(_chunks(draws), STATISTICS)
+    approx = summarize(_chunks(draws), STATISTICS, exact_limit=200 * 256)
+
+    assert np.allclose(approx['mean'], exact['mean'])
+    assert np.allclose(approx['sd'], exact['sd'])
+    for name in ('median', 'q2.5', 'q97.5'):
+        assert np.abs(approx[name] - exact[name]).max() < 0.05
+    for name in ('hdi90_lower', 'hdi90_upper'):
+        assert np.abs(approx[name] - exact[name]).mean() < 0.05
+
+
+def test_draw_summary_needs_histogram():
+    summary = DrawSummary(['median'], exact_limit=10)
+    summary.update(np.zeros((20, 2)))
+    assert summary.needs_histogram
+    with pytest.raises(RuntimeError):
+        summary.result()
+    assert not DrawSummary(['mean', 'sd'], exact_limit=10).needs_histogram
+
+
+def test_choice_proportions():
+    y_pred = np.random.RandomState(2).randint(1, 4, size=(1000, 3, 20))
+    y_pred = y_pred.astype(float)
+    y_pred[:, 2, 15:] = np.nan  # missing trials
+    proportions = ChoiceProportions()
+    for i in range(0, 1000, 300):
+        proportions.update(y_pred[i:i + 300])
+    result = proportions.result()
+
+    assert list(result) == [1, 2, 3]
+    assert np.allclose(sum(result.values()), 1)
+    assert np.allclose(result[2][2], np.mean(y_pred[:, 2, :15] == 2))
+
+    rts = ChoiceProportions()
+    rts.update(np.random.RandomState(3).gamma(2.0, size=(10, 3, 20)))
+    assert rts.result() is None
+
+
+def test_summary_arguments():
+    with pytest.raises(RuntimeError):
+        ra_prospect(data='example', postpred_summary=True)
+    with pytest.raises(RuntimeError):
+        ra_prospect(data='example', inc_postpred=True,
+                    postpred_summary=['q200'])
+    with pytest.raises(RuntimeError):
+        ra_prospect(data='example', regressor_summary=['mean'])
+
+
+def test_iter_draws(tmp_path):
+    values = np.arange(60.0).reshape(2, 10, 3)
+    fit = DrawsFit('ra_prospect', OrderedDict([('y', values)]),
+                   OrderedDict([('lp', np.zeros((2, 10)))]))
+    chunks = list(fit.iter_draws('y', 4))
+    assert [len(c) for c in chunks] == [4, 4, 2, 4, 4, 2]
+    assert np.array_equal(np.concatenate(chunks), values.reshape(-1, 3))
+
+    store = DrawStore(tmp_path / 'draws')
+    store.create('ra_prospect', 2)
+    store.append(fit)
+    stored = list(store.fit().iter_draws('y', 4))
+    assert [len(c) for c in stored] == [4] * 5
+    assert np.array_equal(np.sort(np.concatenate(stored), axis=0),
+                          np.sort(values.reshape(-1, 3), axis=0))
+
+    par_vals = ParVals(fit, PyStanBackend())
+    summary = summarize(lambda: par_vals.iter_draws('y', 3), ['mean'])
+    assert np.allclose(summary['mean'], par_vals['y'].mean(axis=0))
+
+
+class StanFit(object):
+    """Draws kept by a PyStan 2 StanFit: one array per scalar and chain
+    (including 2 warm-up draws), named in column-major order."""
+
+    def __init__(self, name, values):
+        dims = values.shape[2:]
+        index = list(np.ndindex(*dims[::-1]))
+        fnames = ['%s[%s]' % (name, ','.join(str(i + 1) for i in idx[::-1]))
+                  for idx in index]
+        self.sim = {
+            'pars_oi': [name, 'lp__'], 'dims_oi': [list(dims), []],
+            'fnames_oi': fnames + ['lp__'], 'warmup2': [2] * len(values),
+            'samples': [{'chains': OrderedDict(
+                [(f, chain[(slice(None),) + idx[::-1]])
+                 for f, idx in zip(fnames, index)]
+                + [('lp__', -chain.reshape(len(chain), -1)[:, 0])])}
+                for chain in values],
+        }
+
+    def extract(self, pars=None, permuted=True):
+        raise AssertionError('draws extracted at once')
+
+
+def test_pystan_iter_draws():
+    values = np.arange(84.0).reshape(2, 7, 2, 3)
+    fit = StanFit('y', values)
+    assert fit.sim['fnames_oi'][:3] == ['y[1,1]', 'y[2,1]', 'y[1,2]']
+
+    chunks = list(PyStanBackend().iter_draws(fit, 'y', 2))
+    assert [len(c) for c in chunks] == [2, 2, 1, 2, 2, 1]
+    assert np.array_equal(np.concatenate(chunks),
+                          values[:, 2:].reshape(-1, 2, 3))
+    lp = np.concatenate(list(PyStanBackend().iter_draws(fit, 'lp__')))
+    assert np.array_equal(lp, -values[:, 2:, 0, 0].ravel())
+    with pytest.raises(KeyError):
+        next(PyStanBackend().iter_draws(fit, 'x'))
+
+
+def test_pystan_postpred_summary():
+    # Posterior predictions are summarized without extracting their draws
+    y_pred = np.random.RandomState(0).randint(0, 2, (2, 10, 2, 3)) * 1.0
+    y_pred[:, :, 1, 2] = -1  # missing trial
+    par_vals = ParVals(StanFit('y_pred', y_pred), PyStanBackend(), {
+        'y_pred': lambda v: np.where(v == -1, np.nan, v)})
+    summary = DrawSummary(['mean', 'q97.5'])
+    proportions = ChoiceProportions()
+    for chunk in par_vals.iter_draws('y_pred', 3):
+        summary.update(chunk)
+        proportions.update(chunk)
+    mean = summary.result()['mean']
+    choice_prop = proportions.result()
+
+    draws = y_pred[:, 2:].reshape(-1, 2, 3)
+    assert np.isnan(mean[1, 2])
+    assert np.allclose(mean[0], draws[:, 0].mean(axis=0))
+    assert np.allclose(choice_prop[1],
+                       [draws[:, 0].mean(), draws[:, 1, :2].mean()])
+
+
+if __name__ == '__main__':
+    pytest.main()
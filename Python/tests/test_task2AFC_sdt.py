@@ -3,9 +3,10 @@ import pytest
 from hbayesdm.models import task2AFC_sdt
 
 
-def test_task2AFC_sdt():
+def test_task2AFC_sdt(backend):
     _ = task2AFC_sdt(
-        data="example", niter=10, nwarmup=5, nchain=1, ncore=1)
+        data="example", niter=10, nwarmup=5, nchain=1, ncore=1,
+        backend=backend)
 
 
 if __name__ == '__main__':
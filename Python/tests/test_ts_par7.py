@@ -3,9 +3,10 @@ import pytest
 from hbayesdm.models import ts_par7
 
 
-def test_ts_par7():
+def test_ts_par7(backend):
     _ = ts_par7(
-        data="example", niter=10, nwarmup=5, nchain=1, ncore=1)
+        data="example", niter=10, nwarmup=5, nchain=1, ncore=1,
+        backend=backend)
 
 
 if __name__ == '__main__':
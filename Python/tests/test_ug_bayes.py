@@ -3,9 +3,10 @@ import pytest
 from hbayesdm.models import ug_bayes
 
 
-def test_ug_bayes():
+def test_ug_bayes(backend):
     _ = ug_bayes(
-        data="example", niter=10, nwarmup=5, nchain=1, ncore=1)
+        data="example", niter=10, nwarmup=5, nchain=1, ncore=1,
+        backend=backend)
 
 
 if __name__ == '__main__':
@@ -3,9 +3,10 @@ import pytest
 from hbayesdm.models import ug_delta
 
 
-def test_ug_delta():
+def test_ug_delta(backend):
     _ = ug_delta(
-        data="example", niter=10, nwarmup=5, nchain=1, ncore=1)
+        data="example", niter=10, nwarmup=5, nchain=1, ncore=1,
+        backend=backend)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,288 @@
+import re
+import shutil
+import subprocess
+
+import pytest
+
+from hbayesdm.backends import get_backend
+from hbayesdm.base import (PATH_STAN, load_stan_model, stan_model_manifest,
+                           stan_model_source)
+from hbayesdm.models import dd_hyperbolic_single, ra_prospect, task2AFC_sdt
+from hbayesdm.variants import (canonical_model_code, lean_model_code,
+                               params_model_code, threaded_model_code,
+                               variant_model_code)
+
+CODE = '''
+parameters {
+  real mu_pr;
+}
+generated quantities {
+  real mu_x;
+  real log_lik[N];
+  real y_pred[N];
+  real ev[N];  // regressor needed by log_lik
+  real<lower=0> tmp;
+
+  mu_x = mu_pr;
+  {
+    real scratch;
+    for (i in 1:N) {
+      real p;
+      p = inv_logit(x[i]);
+      ev[i] = p;
+      scratch = 2 * p;
+      tmp = scratch;
+      log_lik[i] = bernoulli_lpmf(y[i] | ev[i]);
+      y_pred[i] = bernoulli_rng(p);
+    }
+  }
+}
+'''
+
+
+def _generated_quantities(code):
+    return code[code.index('generated quantities'):]
+
+
+def _declared(line):
+    """Name declared by a line, if any."""
+    m = re.match(r'\s*(?:int|real|vector|row_vector|matrix)(?:\[[^\]]*\])?'
+                 r'\s+(\w+)', re.sub(r'<[^>]*>', '', line))
+    return m.group(1) if m else None
+
+
+def _outputs(code):
+    """Names declared at the top of the generated quantities."""
+    lines = _generated_quantities(code).splitlines()[1:]
+    return [_declared(line) for line in lines[:lines.index('  {')]]
+
+
+def test_lean_model_code():
+    code = lean_model_code(CODE)
+    gq = _generated_quantities(code)
+
+    assert _outputs(code) == ['mu_x', 'log_lik']
+    assert 'real ev[N];' in gq  # local variable without constraints
+    assert 'y_pred' not in gq
+    assert 'tmp' not in gq
+    assert 'scratch' not in gq
+    assert 'log_lik[i] = bernoulli_lpmf(y[i] | ev[i]);' in gq
+
+
+def test_params_model_code():
+    code = params_model_code(CODE)
+    gq = _generated_quantities(code)
+
+    assert _outputs(code) == ['mu_x']
+    assert 'log_lik' not in gq
+    assert 'ev' not in gq
+    assert 'mu_x = mu_pr;' in gq
+
+
+def test_lean_model_code_nothing_to_remove():
+    assert lean_model_code(
+        'generated quantities {\n  real log_lik;\n  log_lik = 0;\n}\n') is None
+
+
+@pytest.mark.parametrize('path', sorted(PATH_STAN.glob('*.stan')),
+                         ids=lambda p: p.stem)
+def test_lean_variants(path):
+    code = variant_model_code(path, 'lean')
+    if code is None:
+        return
+
+    with open(str(path)) as f:
+        original = _generated_quantities(f.read())
+    expected = [_declared(line) for line in original.splitlines()
+                if re.match(r'  \w', line) and _declared(line) and
+                re.match(r'log_lik$|mu_', _declared(line))]
+    assert code.count('{') == code.count('}')
+    assert 'log_lik' in _outputs(code)
+    assert sorted(_outputs(code)) == sorted(expected)
+
+
+def test_threaded_model_code():
+    code = threaded_model_code('''
+data {
+  int<lower=1> N;
+  int<lower=1> T;
+  int<lower=1, upper=T> Tsubj[N];
+  int<lower=0, upper=1> y[N, T];
+}
+parameters {
+  vector[N] beta;
+}
+model {
+  beta ~ normal(0, 1);
+  for (i in 1:N) {
+    for (t in 1:Tsubj[i]) {
+      y[i, t] ~ bernoulli_logit(beta[i]);  // likelihood
+      target += normal_lpdf(beta[i] | 0, 10);
+    }
+  }
+}
+''')
+    functions = code[code.index('functions {'):code.index('data {')]
+    model = code[code.index('model {'):]
+
+    assert 'array[N] int subj_idx = linspaced_int_array(N, 1, N);' in code
+    assert 'array[] int Tsubj,' in functions
+    assert 'array[,] int y,' in functions
+    assert 'vector beta) {' in functions
+    assert 'lp += bernoulli_logit_lupmf(y[i, t] | beta[i]);' in functions
+    assert 'lp += normal_lpdf(beta[i] | 0, 10);' in functions
+    assert 'for (i in start:end) {' in functions
+    assert 'beta ~ normal(0, 1);' in model
+    assert re.search(r'target \+= reduce_sum\(partial_sum_lupmf, subj_idx, '
+                     r'grainsize,\s+Tsubj,\s+y,\s+beta\);', model)
+
+
+@pytest.mark.parametrize('path', sorted(PATH_STAN.glob('*.stan')),
+                         ids=lambda p: p.stem)
+def test_threaded_variants(path):
+    code = variant_model_code(path, 'lean+threaded')
+    if path.stem.endswith('_single'):
+        assert code is None or 'reduce_sum' not in code
+    if code is None or 'reduce_sum' not in code:
+        return
+
+    functions = code[code.index('functions'):code.index('data {')]
+    model = code[code.index('model {'):code.index('generated quantities')]
+    assert code.count('{') == code.count('}')
+    assert '~' not in functions
+    assert 'for (i in 1:N)' not in model and 'for (j in 1:N)' not in model
+    assert model.count('reduce_sum(partial_sum_lupmf') == 1
+
+
+def test_canonical_model_code():
+    code = canonical_model_code('''#include /pre/license.stan
+functions {
+  real lba_lpdf(matrix RT, real d, vector v) { return 0; }
+  real f(real[,] x, int[] y) { return fabs(x[1, 1]); }
+}
+data {
+  int<lower=1> T;
+  real x[2, T];  // real y[T];
+  vector<lower=0>[3] v[T];
+  matrix[2, T] RT;
+}
+model {
+  real p = normal_cdf(x[1, 1], f(x, {1}), 1);
+  target += lba_lpdf(RT | 1, v[1]) + normal_lpdf(p | 0, 1);
+  target += binomial_lpmf(1, T, p);
+}
+''')
+
+    assert code.startswith('#include /pre/license.stan\n')
+    assert 'real lba_lpdf(matrix RT, real d, vector v)' in code
+    assert 'real f(array[,] real x, array[] int y)' in code
+    assert 'return abs(x[1, 1]);' in code
+    assert 'array[2, T] real x;' in code
+    assert 'array[T] vector<lower=0>[3] v;' in code
+    assert '//' not in code and 'real y' not in code
+    assert 'normal_cdf(x[1, 1] | f(x, {1}), 1)' in code
+    assert 'lba_lpdf(RT | 1, v[1]) + normal_lpdf(p | 0, 1)' in code
+    assert 'binomial_lpmf(1 | T, p)' in code
+    assert canonical_model_code(code) == code
+
+
+def _stanc():
+    """Path to stanc 2.33 or later (of CmdStan, or on the PATH)."""
+    cmdstan = get_backend('cmdstan')
+    stanc = shutil.which('stanc')
+    if cmdstan.available() and (cmdstan.path / 'bin' / 'stanc').exists():
+        stanc = str(cmdstan.path / 'bin' / 'stanc')
+    if stanc is not None:
+        version = subprocess.run([stanc, '--version'], stdout=subprocess.PIPE,
+                                 universal_newlines=True).stdout
+        m = re.search(r'v(\d+)\.(\d+)', version)
+        if m and (int(m.group(1)), int(m.group(2))) >= (2, 33):
+            return stanc
+    return None
+
+
+@pytest.mark.skipif(_stanc() is None, reason='stanc 2.33+ is not installed')
+@pytest.mark.parametrize('variant', [None, 'lean', 'params', 'threaded'])
+@pytest.mark.parametrize('path', sorted(PATH_STAN.glob('*.stan')),
+                         ids=lambda p: p.stem)
+def test_canonical_models(tmp_path, path, variant):
+    if variant is None:
+        with open(str(path)) as f:
+            code = f.read()
+    else:
+        code = variant_model_code(path, variant)
+        if code is None:
+            return
+    stan_file = tmp_path / path.name
+    stan_file.write_text(canonical_model_code(code))
+
+    result = subprocess.run(
+        [_stanc(), '--include-paths=' + str(PATH_STAN),
+         '--o=' + str(tmp_path / 'model.hpp'), str(stan_file)],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        universal_newlines=True)
+    assert result.returncode == 0, result.stdout
+
+
+def test_threads_per_chain_requires_threading():
+    with pytest.raises(RuntimeError):
+        ra_prospect(data='example', threads_per_chain=2)
+    with pytest.raises(RuntimeError):
+        ra_prospect(data='example', threads_per_chain=0)
+
+
+@pytest.mark.parametrize('model', [dd_hyperbolic_single, task2AFC_sdt])
+def test_threads_per_chain_without_threaded_variant(model):
+    with pytest.raises(RuntimeError, match='not available'):
+        model(data='example', threads_per_chain=2, backend='cmdstan')
+
+
+def test_threaded_variant_name():
+    # Models without a threaded variant build the lean one instead
+    assert stan_model_source('task2AFC_sdt', 'lean+threaded')[0] == \
+        'task2AFC_sdt.lean'
+    assert stan_model_source('dd_hyperbolic_single', 'threaded') == \
+        ('dd_hyperbolic_single', None)
+    assert stan_model_source('ra_prospect', 'lean+threaded')[0] == \
+        'ra_prospect.lean+threaded'
+
+
+def test_gq_thin_arguments(tmp_path):
+    with pytest.raises(RuntimeError):
+        ra_prospect(data='example', gq_thin=0)
+    with pytest.raises(RuntimeError):
+        ra_prospect(data='example', vb=True, gq_thin=2)
+    with pytest.raises(RuntimeError):
+        ra_prospect(data='example', gq_thin=2, draws_dir=str(tmp_path))
+    with pytest.raises(RuntimeError):  # PyStan 2 cannot compute them apart
+        ra_prospect(data='example', gq_thin=2, backend='pystan')
+
+
+def test_gq_thin(backend):
+    if backend == 'pystan':
+        pytest.skip('gq_thin requires CmdStan')
+    output = ra_prospect(data='example', niter=30, nwarmup=10, nchain=2,
+                         ncore=1, backend=backend, gq_thin=5)
+
+    assert output.par_vals['mu_rho'].shape == (40,)
+    assert output.par_vals['log_lik'].shape[0] == 8
+
+
+def test_lean_variant_manifest():
+    name, key, manifest = stan_model_manifest('ra_prospect', 'lean')
+    assert name == 'ra_prospect.lean'
+    assert manifest['variant'] == 'lean'
+    assert key != stan_model_manifest('ra_prospect')[1]
+
+    name, _, manifest = stan_model_manifest('choiceRT_ddm', 'lean')
+    assert name == 'choiceRT_ddm'
+    assert 'variant' not in manifest
+
+
+def test_load_lean_variant():
+    assert load_stan_model('ra_prospect', 'lean') is not \
+        load_stan_model('ra_prospect')
+
+
+if __name__ == '__main__':
+    pytest.main()
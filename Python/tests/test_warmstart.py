@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+from hbayesdm.base import PATH_STAN, stan_model_parameters
+from hbayesdm.models import ra_prospect
+from hbayesdm.variants import parameter_declarations
+from hbayesdm.warmstart import load_adaptation, save_adaptation, warm_start
+
+ADAPTATION = [
+    {'stepsize': 0.5, 'inv_metric': np.array([1.0, 2.0]),
+     'init': {'mu_pr': np.array([0.1, 0.2]), 'sigma': np.array([1.5, 2.5])}},
+    {'stepsize': 0.25, 'inv_metric': np.array([3.0, 4.0]),
+     'init': {'mu_pr': np.array([0.3, 0.4]), 'sigma': np.array([0.5, 0.6])}},
+]
+
+
+def test_parameter_declarations():
+    code = '''
+    data { int<lower=1> N; int<lower=1> K; }
+    parameters {
+      // group-level parameters
+      vector[K] mu_pr;
+      vector<lower=0>[K] sigma;
+      vector<offset=mu_pr[1], multiplier=sigma[1]>[N] A;
+      real<lower=0, upper=1> p;
+    }
+    model { }
+    '''
+    declarations = parameter_declarations(code)
+    assert list(declarations) == ['mu_pr', 'sigma', 'A', 'p']
+    assert declarations['mu_pr'] == {'K'}
+    assert declarations['A'] == {'N', 'mu_pr', 'sigma'}
+    assert declarations['p'] == set()
+
+
+def test_stan_model_parameters():
+    assert list(stan_model_parameters('ra_prospect')) == \
+        ['mu_pr', 'sigma', 'rho_pr', 'lambda_pr', 'tau_pr']
+    assert stan_model_parameters('ra_prospect')['rho_pr'] == {'N'}
+    assert (PATH_STAN / 'ra_prospect.stan').exists()
+
+
+def test_save_load_adaptation(tmp_path):
+    path = tmp_path / 'adaptation.json'
+    save_adaptation(path, 'ra_prospect', ADAPTATION, {'N': 5})
+    loaded = load_adaptation(str(path))
+
+    assert loaded['model'] == 'ra_prospect'
+    assert loaded['dims'] == {'N': 5}
+    assert loaded['chains'][1]['stepsize'] == 0.25
+    assert np.array_equal(loaded['chains'][1]['inv_metric'], [3, 4])
+    assert np.array_equal(loaded['chains'][0]['init']['sigma'], [1.5, 2.5])
+
+    path.write_text('{"model": "ra_prospect"}')
+    with pytest.raises(RuntimeError):
+        load_adaptation(path)
+
+
+def test_warm_start(tmp_path):
+    path = tmp_path / 'adaptation.json'
+    save_adaptation(path, 'ra_prospect', ADAPTATION, {'N': 5})
+
+    chains = warm_start(path, 'ra_prospect', {'N': 5}, nchain=3)
+    assert [c['stepsize'] for c in chains] == [0.5, 0.25, 0.5]
+
+    with pytest.warns(RuntimeWarning):
+        assert warm_start(path, 'ra_prospect', {'N': 6}, nchain=3) is None
+    with pytest.raises(RuntimeError):
+        warm_start(path, 'ra_noLA', {'N': 5}, nchain=3)
+
+
+def test_warm_start_from_model():
+    class Fitted(object):
+        model = 'ra_prospect'
+        adaptation = ADAPTATION
+        adaptation_dims = {'N': 5}
+
+    chains = warm_start(Fitted(), 'ra_prospect', {'N': 5}, nchain=2)
+    assert np.array_equal(chains[1]['init']['mu_pr'], [0.3, 0.4])
+
+    Fitted.adaptation = None
+    with pytest.raises(RuntimeError):
+        warm_start(Fitted(), 'ra_prospect', {'N': 5}, nchain=2)
+
+
+def test_warm_start_conflicts(tmp_path):
+    path = tmp_path / 'adaptation.json'
+    save_adaptation(path, 'ra_prospect', ADAPTATION, {'N': 5})
+
+    with pytest.raises(RuntimeError, match='adaptation_from'):
+        ra_prospect(data='example', vb=True, adaptation_from=str(path))
+    with pytest.raises(RuntimeError, match='adaptation_from'):
+        ra_prospect(data='example', adaptation_from=str(path),
+                    resume=str(tmp_path))
+
+
+def test_raw_parameters(backend):
+    output = ra_prospect(data='example', niter=20, nwarmup=10, nchain=1,
+                         ncore=1, backend=backend)
+
+    # Sampled for the last draws of the chains, but left out of par_vals
+    assert 'rho_pr' in output.adaptation[0]['init']
+    assert 'rho_pr' not in output.par_vals
+    assert 'sigma' in output.par_vals and 'rho' in output.par_vals
+
+
+if __name__ == '__main__':
+    pytest.main()
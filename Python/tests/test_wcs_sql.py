@@ -3,9 +3,10 @@ import pytest
 from hbayesdm.models import wcs_sql
 
 
-def test_wcs_sql():
+def test_wcs_sql(backend):
     _ = wcs_sql(
-        data="example", niter=10, nwarmup=5, nchain=1, ncore=1)
+        data="example", niter=10, nwarmup=5, nchain=1, ncore=1,
+        backend=backend)
 
 
 if __name__ == '__main__':
@@ -85,7 +85,10 @@ def message_model_regressor_return(regressors):
     if regressors:
         return (
             '- ``model_regressor``: '
-            + 'Dict holding the extracted model-based regressors.')
+            + 'Dict holding the extracted model-based regressors.\n'
+            + '        - ``model_regressor_summary``: Dict holding the '
+            + 'statistics of each\n'
+            + '          regressor requested with ``regressor_summary``.')
     else:
         return ''
 